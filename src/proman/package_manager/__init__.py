@@ -3,19 +3,14 @@
 """Simple package manager for Python."""
 
 import logging
-
 import os
 import site
-from typing import List, Optional
-from urllib.parse import urljoin
-
-from distlib.locators import PyPIJSONLocator
-from proman.common.config import Config
-from proman.common.manifest import LockFile, SpecFile, Manifest
+from typing import TYPE_CHECKING, Any, Dict, List, Optional
 
 from . import config
-from .distributions import LocalDistributionPath, UserDistributionPath
-from .package_manager import PackageManager
+
+if TYPE_CHECKING:
+    from .package_manager import PackageManager
 
 __author__ = 'Jesse P. Johnson'
 __title__ = 'proman-dependencies'
@@ -25,32 +20,107 @@ __all__: List[str] = ['local_distribution', 'package_manager', 'spec_cfg']
 
 logging.getLogger(__name__).addHandler(logging.NullHandler())
 
-if site.ENABLE_USER_SITE:
-    user_distribution = UserDistributionPath()
 
-# Setup distribution paths
-local_distribution = LocalDistributionPath()
+def __getattr__(name: str) -> Any:
+    """Load distribution paths on first use so startup stays light."""
+    # NOTE: the import finder and daemon client only need the stdlib
+    if name == 'local_distribution':
+        from .distributions import LocalDistributionPath
+
+        value: Any = LocalDistributionPath()
+    elif name == 'user_distribution' and site.ENABLE_USER_SITE:
+        from .distributions import UserDistributionPath
+
+        value = UserDistributionPath()
+    elif name == 'PackageManager':
+        from .package_manager import PackageManager as value
+    elif name == 'AsyncPackageManager':
+        from .aio import AsyncPackageManager as value
+    else:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    globals()[name] = value
+    return value
+
+
+def get_tool_settings(filepath: str) -> Dict[str, Any]:
+    """Get tool.proman table of a pyproject file."""
+    from proman.common.config import Config
+
+    if not os.path.isfile(filepath):
+        return {}
+    return (
+        Config(filepath=filepath, writable=False).retrieve('.tool.proman')
+        or {}
+    )
+
+
+def get_package_manager(
+    base_dir: Optional[str] = None, **options: Any
+) -> 'PackageManager':
+    """Get package manager.
+
+    Parameters
+    ----------
+    base_dir: str, optional
+        project directory when it is not the working directory
+    scheduler: Scheduler
+        concurrency limits shared with other package managers
+    prefetcher: Prefetcher
+        artifact downloads shared with other package managers
+    budgets: dict
+        temp disk, memory and open file limits overriding the project
+    network: dict
+        timeouts, deadline and mirrors overriding the project
+    zipped: bool
+        install zip safe pure Python wheels without unpacking them
+
+    """
+    from proman.common.config import Config
+    from proman.common.manifest import LockFile, Manifest, SpecFile
 
+    from .package_manager import PackageManager
+    from .session import get_locator
+
+    if base_dir is None:
+        local_distribution = __getattr__('local_distribution')
+        pyproject_path = config.pyproject_path
+        lock_path = config.lock_path
+    else:
+        from .distributions import LocalDistributionPath
+
+        local_distribution = LocalDistributionPath(
+            name=os.path.basename(os.path.abspath(base_dir)),
+            pypackages_dir=os.path.join(base_dir, '__pypackages__'),
+        )
+        pyproject_path = os.path.join(base_dir, 'pyproject.toml')
+        lock_path = os.path.join(base_dir, 'proman-lock.json')
 
-def get_package_manager() -> 'PackageManager':
-    """Get package manager."""
     # Load configuration files
     specfile = None
     lockfile = None
+    concurrency = None
+    budgets = None
+    network = None
+    zipped = False
 
-    if os.path.exists(config.pyproject_path):
-        spec_cfg = Config(filepath=config.pyproject_path, writable=True)
+    if os.path.exists(pyproject_path):
+        spec_cfg = Config(filepath=pyproject_path, writable=True)
         specfile = SpecFile(spec_cfg)
+        settings = get_tool_settings(pyproject_path)
+        concurrency = settings.get('concurrency')
+        budgets = settings.get('budgets')
+        network = settings.get('network')
+        zipped = settings.get('zipped', False)
         local_distribution.create_pypackages_pth()
         # local_distribution.load_pypackages()
 
-        if os.path.exists(config.lock_path):
-            lock_cfg = Config(filepath=config.lock_path, writable=True)
+        if os.path.exists(lock_path):
+            lock_cfg = Config(filepath=lock_path, writable=True)
             lockfile = LockFile(lock_cfg)
         else:
-            logging.warning(f"log no lock found {config.lock_path}")
+            logging.warning(f"log no lock found {lock_path}")
     else:
-        logging.warning(f"log no source tree found {config.pyproject_path}")
+        logging.warning(f"log no source tree found {pyproject_path}")
 
     manifest: Optional[Manifest] = None
     if specfile and lockfile:
@@ -68,11 +138,19 @@ def get_package_manager() -> 'PackageManager':
 
     # TODO setup proxy capability
     # setup repository
-    locator = PyPIJSONLocator(urljoin(config.INDEX_URL, 'pypi'))
+    locator = get_locator()
 
     # Setup package manager
     return PackageManager(
         manifest=manifest,
         distribution_path=local_distribution,
         locator=locator,
+        concurrency=concurrency,
+        lock_path=lock_path,
+        **{
+            'budgets': budgets,
+            'network': network,
+            'zipped': zipped,
+            **options,
+        },
     )
@@ -2,16 +2,89 @@
 # SPDX-License-Identifier: LGPL-3.0-or-later
 """Simple package manager for Python."""
 
-from argufy import Parser
+import json
+import sys
+from typing import TYPE_CHECKING, List, Optional, Set
 
-from . import cli
+from .daemon import call_daemon
 
+if TYPE_CHECKING:
+    from argufy import Parser
+
+# flags of the status command understood without loading the CLI
+QUICK_STATUS_FLAGS = ('quick', 'json')
+
+
+def get_parser() -> 'Parser':
+    """Get parser of CLI commands."""
+    # loading the CLI sets up the package manager for the project
+    from argufy import Parser
+
+    from . import cli
 
-def main() -> None:
-    """Provide main function for CLI."""
     parser = Parser(use_module_args=True)
     parser.add_commands(cli)
-    parser.dispatch()
+    return parser
+
+
+def _parse_quick_status(args: List[str]) -> Optional[Set[str]]:
+    """Get flags of a quick status command or None for other commands."""
+    if args[:1] != ['status']:
+        return None
+    flags = set()
+    for arg in args[1:]:
+        if arg.startswith('--') and arg[2:] in QUICK_STATUS_FLAGS:
+            flags.add(arg[2:])
+        elif arg.startswith('-') and not arg.startswith('--') and arg[1:]:
+            # short flags may be combined as with argparse
+            for letter in arg[1:]:
+                flag = next(
+                    (x for x in QUICK_STATUS_FLAGS if x[0] == letter), None
+                )
+                if flag is None:
+                    return None
+                flags.add(flag)
+        else:
+            return None
+    return flags if 'quick' in flags else None
+
+
+def quick_status(args: List[str]) -> Optional[int]:
+    """Compare environment stamp with the lock without loading the CLI.
+
+    Parameters
+    ----------
+    args: List[str]
+        command line arguments which are handled only for status --quick
+
+    """
+    flags = _parse_quick_status(args)
+    if flags is None:
+        return None
+
+    from . import config
+    from .stamp import CURRENT, get_dist_dir, stamp_status
+
+    status = stamp_status(get_dist_dir(), config.lock_path)
+    if 'json' in flags:
+        print(json.dumps({'stamp': status}))
+    else:
+        print('stamp', status)
+    return 0 if status == CURRENT else 1
+
+
+def main() -> None:
+    """Provide main function for CLI."""
+    # entry points confirm their environment on every start
+    code = quick_status(sys.argv[1:])
+    if code is not None:
+        sys.exit(code)
+    response = call_daemon(sys.argv[1:])
+    if response is not None and response.get('code') is not None:
+        sys.stdout.write(response['stdout'])
+        sys.stderr.write(response['stderr'])
+        sys.exit(response['code'])
+    get_parser().dispatch(sys.argv[1:])
 
 
 if __name__ == '__main__':
@@ -0,0 +1,589 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Manage packages from an asyncio event loop."""
+
+import asyncio
+import functools
+import hashlib
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from tempfile import TemporaryDirectory
+from typing import (
+    Any,
+    Callable,
+    Coroutine,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+)
+from urllib.parse import urljoin
+
+from packaging.utils import canonicalize_name
+
+from . import config, package_manager
+from .aiosession import AsyncSession
+from .budget import DOWNLOAD_FILES
+from .dependencies import Candidate, Dependency
+from .exception import PackageManagerException
+from .markers import get_environment
+from .metadata import ProjectMetadata, read_fields, read_project
+from .package_manager import PackageManager
+from .resolution import fingerprint
+from .resolver import IndexProvider, Resolver
+from .specifiers import parse_requirement
+
+log = logging.getLogger(__name__)
+
+__all__: List[str] = ['AsyncPackageManager', 'PackageResult', 'Progress']
+
+T = TypeVar('T')
+
+
+class Progress:
+    """Report a step of an operation on one package."""
+
+    __slots__ = ('stage', 'name', 'version', 'completed', 'total', 'error')
+
+    def __init__(
+        self,
+        stage: str,
+        name: str,
+        version: Optional[str] = None,
+        completed: int = 0,
+        total: int = 0,
+        error: Optional[str] = None,
+    ) -> None:
+        """Initialize progress event."""
+        self.stage = stage
+        self.name = name
+        self.version = version
+        self.completed = completed
+        self.total = total
+        self.error = error
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get serializable event."""
+        return {x: getattr(self, x) for x in self.__slots__}
+
+
+class PackageResult:
+    """Provide outcome of an operation on one package."""
+
+    __slots__ = ('name', 'version', 'path', 'error')
+
+    def __init__(
+        self,
+        name: str,
+        version: Optional[str] = None,
+        path: Optional[str] = None,
+        error: Optional[str] = None,
+    ) -> None:
+        """Initialize package result."""
+        self.name = name
+        self.version = version
+        self.path = path
+        self.error = error
+
+    @property
+    def ok(self) -> bool:
+        """Check operation succeeded."""
+        return self.error is None
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get serializable result."""
+        return {x: getattr(self, x) for x in self.__slots__}
+
+
+class AsyncPackageManager:
+    """Manage packages from an event loop without blocking it.
+
+    Index requests are sent from the event loop so thousands of metadata
+    lookups can run concurrently while solving and writing files run in
+    executor threads. Progress is reported to a callback instead of
+    being printed.
+    """
+
+    def __init__(
+        self,
+        manager: PackageManager,
+        progress: Optional[Callable[[Progress], Any]] = None,
+        session: Optional[AsyncSession] = None,
+    ) -> None:
+        """Initialize from a package manager of the project."""
+        self.manager = manager
+        self.progress = progress
+        self.session = session or AsyncSession(
+            maxsize=manager.scheduler.network.maximum
+        )
+        # budget waits are queued on one thread so none holds part of a
+        # reservation while executor threads needed to release it are busy
+        self.__budget_executor = ThreadPoolExecutor(
+            max_workers=1, thread_name_prefix='budget'
+        )
+
+    async def __aenter__(self) -> 'AsyncPackageManager':
+        """Enter context closing connections on exit."""
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        """Close idle connections."""
+        self.close()
+
+    def close(self) -> None:
+        """Close idle connections."""
+        self.session.close()
+        self.__budget_executor.shutdown(wait=False)
+
+    def _report(self, *args: Any, **kwargs: Any) -> None:
+        """Send progress event to the callback."""
+        if self.progress:
+            self.progress(Progress(*args, **kwargs))
+
+    @staticmethod
+    async def _run(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+        """Run blocking work in an executor thread."""
+        loop = asyncio.get_event_loop()
+        return await loop.run_in_executor(
+            None, functools.partial(func, *args, **kwargs)
+        )
+
+    @staticmethod
+    def _bridge(
+        loop: asyncio.AbstractEventLoop,
+        func: Callable[..., Coroutine[Any, Any, T]],
+    ) -> Callable[..., T]:
+        """Call a coroutine function on the loop from an executor thread."""
+
+        def call(*args: Any) -> T:
+            return asyncio.run_coroutine_threadsafe(func(*args), loop).result()
+
+        return call
+
+    def _acquire(self, temp_disk: int, open_files: int) -> Tuple[int, int]:
+        """Wait for temp disk and open file budgets of the manager."""
+        budgets = self.manager.budgets
+        reserved = budgets.temp_disk.acquire(temp_disk)
+        return reserved, budgets.open_files.acquire(open_files)
+
+    def _release(self, reserved: Tuple[int, int]) -> None:
+        """Return reserved temp disk and open files to the budgets."""
+        self.manager.budgets.temp_disk.release(reserved[0])
+        self.manager.budgets.open_files.release(reserved[1])
+
+    async def _reserve(
+        self, temp_disk: int = 0, open_files: int = 0
+    ) -> Tuple[int, int]:
+        """Reserve budgets of the manager without blocking the loop."""
+        if not self.manager.budgets.bounded:
+            return (0, 0)
+        loop = asyncio.get_event_loop()
+        future = loop.run_in_executor(
+            self.__budget_executor, self._acquire, temp_disk, open_files
+        )
+        try:
+            return await asyncio.shield(future)
+        except asyncio.CancelledError:
+            # reservations completing after cancellation are returned
+            future.add_done_callback(lambda x: self._release(x.result()))
+            raise
+
+    # Repository
+    async def lookup_metadata(
+        self, name: str, version: Optional[str] = None
+    ) -> Optional[ProjectMetadata]:
+        """Get reduced package metadata used for resolution."""
+        key = (canonicalize_name(name), version)
+        # shared with synchronous lookups of the package manager
+        cache = package_manager._metadata_cache
+        if key in cache:
+            loaded, metadata = cache[key]
+            if time.monotonic() - loaded < config.METADATA_TTL:
+                return metadata
+        path = (
+            f"pypi/{name}/{version}/json" if version else f"pypi/{name}/json"
+        )
+        rsp = await self.session.request(
+            'GET', urljoin(config.INDEX_URL, path)
+        )
+        if rsp.status == 200:
+            metadata = read_project(rsp.stream(config.CHUNK_SIZE))
+            cache[key] = (time.monotonic(), metadata)
+            return metadata
+        log.error(f"{name} package not found")
+        return None
+
+    async def info(
+        self, name: str, section: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """Get package information."""
+        url_path = urljoin(config.INDEX_URL, f"pypi/{name}/json")
+        rsp = await self.session.request('GET', url_path)
+        if rsp.status != 200:
+            log.error(f"{name} package not found")
+            return {}
+        data = json.loads(rsp.data)
+        return data[section] if section else data
+
+    async def _lookup_serial(self, name: str) -> Optional[int]:
+        """Get last serial of a project from the package index."""
+        url_path = urljoin(config.INDEX_URL, f"simple/{name}/")
+        rsp = await self.session.request('HEAD', url_path)
+        serial = rsp.headers.get('X-PyPI-Last-Serial')
+        if rsp.status == 200 and serial:
+            return int(serial)
+        # mirrors without the header still publish it in the JSON API
+        url_path = urljoin(config.INDEX_URL, f"pypi/{name}/json")
+        rsp = await self.session.request('GET', url_path)
+        if rsp.status == 200:
+            fields = read_fields(
+                rsp.stream(config.CHUNK_SIZE), ['last_serial']
+            )
+            return fields.get('last_serial')
+        return None
+
+    async def _check_serials(self, serials: Dict[str, int]) -> bool:
+        """Check projects are unchanged since they were resolved."""
+        found = await asyncio.gather(
+            *(self._lookup_serial(x) for x in serials)
+        )
+        return list(found) == list(serials.values())
+
+    async def _load_metadata(
+        self, requirements: Iterable[str], **options: Any
+    ) -> int:
+        """Look up every reachable project concurrently before solving."""
+        environment = get_environment(
+            options.get('python'), options.get('platform')
+        )
+        seen: Set[Tuple[str, FrozenSet[str]]] = set()
+        pending = [parse_requirement(x) for x in requirements]
+        while pending:
+            found = {
+                (canonicalize_name(x.name), frozenset(x.extras))
+                for x in pending
+                if environment.applies(x)
+            } - seen
+            seen |= found
+            pending = []
+            lookups = {x[0] for x in found}
+            results = dict(
+                zip(
+                    lookups,
+                    await asyncio.gather(
+                        *(self.lookup_metadata(x) for x in lookups)
+                    ),
+                )
+            )
+            for name, extras in found:
+                metadata = results[name]
+                for sequence in metadata.requires_dist if metadata else ():
+                    requirement = parse_requirement(sequence)
+                    # requirements of other targets are never looked up
+                    if environment.applies(requirement, extras):
+                        pending.append(requirement)
+        return len({x[0] for x in seen})
+
+    async def get_candidate(
+        self, requirement: str, **options: Any
+    ) -> Optional[Candidate]:
+        """Get candidate best matching a requirement."""
+        req = parse_requirement(requirement)
+        metadata = await self.lookup_metadata(req.name)
+        if metadata is None:
+            return None
+
+        version = metadata.version_set.best_match(
+            str(req.specifier), options.get('prerelease', False)
+        )
+        if version is None:
+            log.error(f"no release of {req.name} matches {req.specifier}")
+            return None
+
+        # requirements are only published for the latest release
+        requires = metadata.requires_dist
+        if version != metadata.version:
+            release = await self.lookup_metadata(req.name, version)
+            requires = release.requires_dist if release else ()
+        return Candidate.from_metadata(
+            metadata, version, requires=requires, **options
+        )
+
+    async def resolve(
+        self, *requirements: str, **options: Any
+    ) -> List[Candidate]:
+        """Resolve candidates reusing results for identical inputs.
+
+        Raises
+        ------
+        PackageManagerResolution
+            requirements that cannot be satisfied together
+
+        """
+        loop = asyncio.get_event_loop()
+        resolutions = self.manager.resolutions
+        transitive = options.pop('transitive', True)
+        key = fingerprint(
+            requirements, config.INDEX_URL, transitive=transitive, **options
+        )
+        cached = None
+        if not options.pop('refresh', False):
+            cached = await self._run(
+                resolutions.get, key, self._bridge(loop, self._check_serials)
+            )
+
+        candidates: List[Candidate]
+        if cached is not None:
+            log.info(f"reusing cached resolution {key[:12]}")
+            candidates = cached
+        elif transitive:
+            await self._load_metadata(requirements, **options)
+            provider = IndexProvider(
+                self._bridge(loop, self.lookup_metadata),
+                python=options.get('python'),
+            )
+
+            def solve() -> List[Candidate]:
+                resolver = Resolver(provider, **options)
+                resolution = resolver.resolve(requirements)
+                log.info(
+                    f"resolved {len(resolution)} packages "
+                    f"after {resolver.decisions} decisions"
+                )
+                return [
+                    x
+                    for x in (
+                        provider.get_candidate(k, v, **options)
+                        for k, v in resolution.items()
+                    )
+                    if x is not None
+                ]
+
+            candidates = await self._run(solve)
+        else:
+            candidates = [
+                x
+                for x in await asyncio.gather(
+                    *(self.get_candidate(x, **options) for x in requirements)
+                )
+                if x is not None
+            ]
+        if cached is None:
+            await self._run(resolutions.put, key, candidates)
+
+        for completed, candidate in enumerate(candidates, 1):
+            self._report(
+                'resolved',
+                candidate.name,
+                candidate.version,
+                completed,
+                len(candidates),
+            )
+        return candidates
+
+    async def _download(
+        self, candidate: Candidate, dest: str
+    ) -> PackageResult:
+        """Download and verify the artifact of a candidate."""
+        result = PackageResult(candidate.name, candidate.version)
+        release = candidate.get_release() or candidate.get_release('sdist')
+        if release is None:
+            result.error = 'no release artifact found'
+            return result
+        filepath = os.path.join(dest, release.filename)
+        reserved = await self._reserve(open_files=DOWNLOAD_FILES)
+        try:
+            await self.session.download(release.url, filepath)
+        except PackageManagerException as err:
+            result.error = str(err)
+            return result
+        finally:
+            self._release(reserved)
+        if release.sha256:
+            digest = await self._run(_sha256, filepath)
+            if digest != release.sha256:
+                os.remove(filepath)
+                result.error = f"digest mismatch for {release.filename}"
+                return result
+        result.path = filepath
+        return result
+
+    async def download(
+        self, *packages: Union[str, Candidate], dest: str = '.', **options: Any
+    ) -> List[PackageResult]:
+        """Download artifacts of requirements or resolved candidates."""
+        candidates = [x for x in packages if isinstance(x, Candidate)]
+        requirements = [x for x in packages if not isinstance(x, Candidate)]
+        if requirements:
+            options.setdefault('transitive', False)
+            candidates += await self.resolve(*requirements, **options)
+        completed = 0
+
+        async def fetch(candidate: Candidate) -> PackageResult:
+            nonlocal completed
+            result = await self._download(candidate, dest)
+            completed += 1
+            self._report(
+                'downloaded' if result.ok else 'failed',
+                result.name,
+                result.version,
+                completed,
+                len(candidates),
+                result.error,
+            )
+            return result
+
+        return list(await asyncio.gather(*(fetch(x) for x in candidates)))
+
+    # Install package
+    async def install(
+        self, *packages: str, **options: Any
+    ) -> List[PackageResult]:
+        """Install packages and dependencies returning outcome of each.
+
+        Each package is installed as soon as its artifact is downloaded.
+
+        Parameters
+        ----------
+        dev: bool
+            install development locks when no packages are given
+        save: bool
+            write the project and lock files afterwards
+        refresh: bool
+            resolve again instead of reusing a cached resolution
+
+        """
+        manager = self.manager
+        dev = options.get('dev', False)
+        await self._run(manager.distribution_path.create_pypackages)
+        await self._run(manager.installed.load)
+        manager._clear_stamp()
+
+        if packages:
+            candidates = await self.resolve(*packages, **dict(options))
+            manager._add_roots(packages, candidates)
+        else:
+            # locks already include every transitive dependency
+            candidates = await self.resolve(
+                *manager._get_lock_requirements(dev),
+                dev=dev,
+                refresh=options.get('refresh', False),
+                transitive=False,
+            )
+        completed = 0
+
+        async def install(
+            candidate: Candidate, temp_dir: str
+        ) -> PackageResult:
+            nonlocal completed
+            result = PackageResult(candidate.name, candidate.version)
+            # stored wheels are linked without fetching the artifact
+            downloaded = not (
+                manager.distribution_path.is_installed(candidate.name)
+                or manager._is_stored(candidate, **options)
+            )
+            reserved = (0, 0)
+            try:
+                if downloaded:
+                    # the download is held on temp disk until installed
+                    reserved = await self._reserve(
+                        temp_disk=manager._artifact_size(candidate)
+                        or config.CHUNK_SIZE
+                    )
+                    result = await self._download(candidate, temp_dir)
+                if result.ok:
+                    try:
+                        installed = await self._run(
+                            manager._perform_install,
+                            candidate,
+                            **{
+                                **options,
+                                'temp_dir': temp_dir,
+                                'reserved': downloaded,
+                            },
+                        )
+                    except Exception as err:
+                        installed, result.error = None, str(err)
+                    if installed:
+                        result.path = installed.path
+                    elif result.ok:
+                        result.error = 'installation failed'
+            finally:
+                self._release(reserved)
+            completed += 1
+            self._report(
+                'installed' if result.ok else 'failed',
+                result.name,
+                result.version,
+                completed,
+                len(candidates),
+                result.error,
+            )
+            return result
+
+        with TemporaryDirectory() as temp_dir:
+            results = await asyncio.gather(
+                *(install(x, temp_dir) for x in candidates)
+            )
+        if candidates:
+            await self._run(manager.installed.save)
+            if options.get('save', True):
+                await self._run(manager.save)
+        return list(results)
+
+    # Uninstall package
+    async def uninstall(
+        self, *packages: str, **options: Any
+    ) -> List[PackageResult]:
+        """Uninstall packages and dependencies returning outcome of each."""
+        manager = self.manager
+        await self._run(manager.installed.load)
+        manager._clear_stamp()
+        dependencies = await self._run(
+            manager._get_removals, packages, options.get('dev', False)
+        )
+        completed = 0
+
+        async def uninstall(dependency: Dependency) -> PackageResult:
+            nonlocal completed
+            result = PackageResult(dependency.name)
+            removed = await self._run(
+                manager._uninstall_package, dependency, **options
+            )
+            if removed:
+                result.version, result.path = removed.version, removed.path
+            else:
+                result.error = 'package is not installed'
+            completed += 1
+            self._report(
+                'uninstalled' if result.ok else 'failed',
+                result.name,
+                result.version,
+                completed,
+                len(dependencies),
+                result.error,
+            )
+            return result
+
+        results = await asyncio.gather(*(uninstall(x) for x in dependencies))
+        if dependencies:
+            await self._run(manager.installed.save)
+            await self._run(manager.save)
+        return list(results)
+
+
+def _sha256(filepath: str) -> str:
+    """Get digest of a file."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(config.CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
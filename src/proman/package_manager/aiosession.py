@@ -0,0 +1,344 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Send index requests from an event loop without blocking it."""
+
+import asyncio
+import logging
+import os
+import ssl
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Tuple,
+    TypeVar,
+)
+from urllib.parse import urljoin, urlsplit
+
+from . import config
+from .exception import PackageManagerNetwork
+from .session import COALESCED_METHODS, Response
+
+log = logging.getLogger(__name__)
+
+__all__: List[str] = ['AsyncSession', 'Headers']
+
+REDIRECT_STATUSES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 5
+BODYLESS_STATUSES = (204, 304)
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+T = TypeVar('T')
+Host = Tuple[str, str, int]
+Sink = Callable[[bytes], Any]
+
+
+class Headers(Mapping[str, str]):
+    """Provide response header fields looked up case insensitively."""
+
+    def __init__(self, items: Iterable[Tuple[str, str]]) -> None:
+        """Initialize headers combining repeated fields."""
+        self.__fields: Dict[str, str] = {}
+        for name, value in items:
+            key = name.lower()
+            if key in self.__fields:
+                value = f"{self.__fields[key]}, {value}"
+            self.__fields[key] = value
+
+    def __getitem__(self, name: str) -> str:
+        """Get field value."""
+        return self.__fields[name.lower()]
+
+    def __iter__(self) -> Iterator[str]:
+        """Iterate field names."""
+        return iter(self.__fields)
+
+    def __len__(self) -> int:
+        """Get number of fields."""
+        return len(self.__fields)
+
+
+class _Connection:
+    """Hold streams of a keep-alive connection."""
+
+    __slots__ = ('reader', 'writer')
+
+    def __init__(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ) -> None:
+        """Initialize connection."""
+        self.reader = reader
+        self.writer = writer
+
+    def close(self) -> None:
+        """Close connection."""
+        self.writer.close()
+
+
+class AsyncSession:
+    """Send HTTP/1.1 requests over keep-alive connections of an event loop.
+
+    Identical GET and HEAD requests in flight are coalesced so thousands
+    of concurrent lookups share one round trip per project. A session
+    belongs to the event loop it is first used from.
+    """
+
+    def __init__(
+        self, maxsize: int = 64, timeout: Optional[float] = 60
+    ) -> None:
+        """Initialize session with a connection limit per host."""
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self.requests = 0
+        self.coalesced = 0
+        self.__idle: Dict[Host, List[_Connection]] = {}
+        self.__limits: Dict[Host, asyncio.Semaphore] = {}
+        self.__inflight: Dict[Tuple[Any, ...], 'asyncio.Future[Response]'] = {}
+        self.__ssl: Optional[ssl.SSLContext] = None
+
+    async def _wait(self, awaitable: Awaitable[T]) -> T:
+        """Wait for a network operation within the timeout."""
+        if self.timeout is None:
+            return await awaitable
+        return await asyncio.wait_for(awaitable, self.timeout)
+
+    def _limit(self, host: Host) -> asyncio.Semaphore:
+        """Get semaphore bounding connections to a host."""
+        limit = self.__limits.get(host)
+        if limit is None:
+            limit = self.__limits[host] = asyncio.Semaphore(self.maxsize)
+        return limit
+
+    async def _connect(self, host: Host) -> _Connection:
+        """Open connection to a host."""
+        scheme, hostname, port = host
+        context = None
+        if scheme == 'https':
+            if self.__ssl is None:
+                self.__ssl = ssl.create_default_context()
+            context = self.__ssl
+        reader, writer = await self._wait(
+            asyncio.open_connection(hostname, port, ssl=context)
+        )
+        return _Connection(reader, writer)
+
+    async def _read_body(
+        self,
+        reader: asyncio.StreamReader,
+        fields: Headers,
+        write: Sink,
+    ) -> bool:
+        """Read response body returning whether the connection is reusable."""
+        if 'chunked' in fields.get('Transfer-Encoding', '').lower():
+            while True:
+                line = await self._wait(reader.readline())
+                size = int(line.split(b';', 1)[0].strip(), 16)
+                if size == 0:
+                    # trailer fields end with an empty line
+                    while (await self._wait(reader.readline())).strip():
+                        pass
+                    return True
+                while size > 0:
+                    chunk = await self._wait(
+                        reader.readexactly(min(size, config.CHUNK_SIZE))
+                    )
+                    write(chunk)
+                    size -= len(chunk)
+                await self._wait(reader.readline())
+        length = fields.get('Content-Length')
+        if length is not None:
+            remaining = int(length)
+            while remaining > 0:
+                chunk = await self._wait(
+                    reader.readexactly(min(remaining, config.CHUNK_SIZE))
+                )
+                write(chunk)
+                remaining -= len(chunk)
+            return True
+        # body is delimited by the server closing the connection
+        while True:
+            chunk = await self._wait(reader.read(config.CHUNK_SIZE))
+            if not chunk:
+                return False
+            write(chunk)
+
+    async def _read_response(
+        self,
+        reader: asyncio.StreamReader,
+        method: str,
+        status_line: bytes,
+        sink: Optional[Sink],
+    ) -> Tuple[int, Headers, bytes, bool]:
+        """Read status, header fields and body of a response."""
+        while True:
+            parts = status_line.decode('latin-1').split(None, 2)
+            if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+                raise PackageManagerNetwork(
+                    f"malformed status line {status_line!r}"
+                )
+            status = int(parts[1])
+            items = []
+            while True:
+                line = await self._wait(reader.readline())
+                if not line.strip():
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                items.append((name.strip(), value.strip()))
+            # interim responses precede the final one
+            if not 100 <= status < 200:
+                break
+            status_line = await self._wait(reader.readline())
+
+        fields = Headers(items)
+        reusable = parts[0] != 'HTTP/1.0' and (
+            fields.get('Connection', '').lower() != 'close'
+        )
+        chunks: List[bytes] = []
+        if method != 'HEAD' and status not in BODYLESS_STATUSES:
+            # only successful bodies are streamed to the sink
+            write = sink if sink and 200 <= status < 300 else chunks.append
+            reusable = await self._read_body(reader, fields, write) and (
+                reusable
+            )
+        return status, fields, b''.join(chunks), reusable
+
+    async def _roundtrip(
+        self, host: Host, method: str, request: bytes, sink: Optional[Sink]
+    ) -> Tuple[int, Headers, bytes]:
+        """Exchange request and response over a pooled connection."""
+        idle = self.__idle.setdefault(host, [])
+        while True:
+            reused = bool(idle)
+            connection = idle.pop() if reused else await self._connect(host)
+            try:
+                connection.writer.write(request)
+                await self._wait(connection.writer.drain())
+                status_line = await self._wait(connection.reader.readline())
+                if not status_line:
+                    raise ConnectionResetError('connection closed by server')
+            except (OSError, asyncio.IncompleteReadError):
+                connection.close()
+                # servers may close idle connections at any time
+                if reused:
+                    continue
+                raise
+            break
+        try:
+            status, fields, data, reusable = await self._read_response(
+                connection.reader, method, status_line, sink
+            )
+        except BaseException:
+            connection.close()
+            raise
+        if reusable:
+            idle.append(connection)
+        else:
+            connection.close()
+        return status, fields, data
+
+    async def _send(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+        sink: Optional[Sink] = None,
+    ) -> Response:
+        """Send request following redirects."""
+        self.requests += 1
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urlsplit(url)
+            if parts.scheme not in DEFAULT_PORTS:
+                raise PackageManagerNetwork(f"unsupported URL {url}")
+            host = (
+                parts.scheme,
+                parts.hostname or '',
+                parts.port or DEFAULT_PORTS[parts.scheme],
+            )
+            target = parts.path or '/'
+            if parts.query:
+                target = f"{target}?{parts.query}"
+            lines = [
+                f"{method} {target} HTTP/1.1",
+                f"Host: {parts.netloc}",
+                'Accept-Encoding: identity',
+                'User-Agent: proman',
+            ]
+            lines += [f"{k}: {v}" for k, v in (headers or {}).items()]
+            request = '\r\n'.join(lines + ['', '']).encode('latin-1')
+            try:
+                async with self._limit(host):
+                    status, fields, data = await self._roundtrip(
+                        host, method, request, sink
+                    )
+            # timeouts are also OS errors on recent versions of Python
+            except asyncio.TimeoutError as err:
+                message = f"{method} {url} timed out"
+                raise PackageManagerNetwork(message) from err
+            except (OSError, asyncio.IncompleteReadError) as err:
+                raise PackageManagerNetwork(f"{method} {url}: {err}") from err
+            if status in REDIRECT_STATUSES and 'Location' in fields:
+                url = urljoin(url, fields['Location'])
+                if status == 303:
+                    method = 'GET'
+                continue
+            return Response(url, status, fields, data)
+        raise PackageManagerNetwork(f"too many redirects for {url}")
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Response:
+        """Send request sharing responses of identical ones in flight."""
+        if method not in COALESCED_METHODS:
+            return await self._send(method, url, headers)
+        key = (method, url, tuple(sorted((headers or {}).items())))
+        future = self.__inflight.get(key)
+        if future is not None:
+            self.coalesced += 1
+            # cancelling one caller must not cancel the shared request
+            return await asyncio.shield(future)
+        future = asyncio.get_event_loop().create_future()
+        self.__inflight[key] = future
+        try:
+            response = await self._send(method, url, headers)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as err:
+            future.set_exception(err)
+            # mark retrieved for when no other caller was waiting
+            future.exception()
+            raise
+        else:
+            future.set_result(response)
+            return response
+        finally:
+            del self.__inflight[key]
+
+    async def download(self, url: str, filepath: str) -> None:
+        """Stream a file to disk."""
+        tmp_path = f"{filepath}.{os.getpid()}.{id(self)}.part"
+        try:
+            with open(tmp_path, 'wb') as f:
+                rsp = await self._send('GET', url, sink=f.write)
+            if rsp.status != 200:
+                raise PackageManagerNetwork(f"{url} returned {rsp.status}")
+            os.replace(tmp_path, filepath)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def close(self) -> None:
+        """Close idle connections."""
+        for connections in self.__idle.values():
+            for connection in connections:
+                connection.close()
+        self.__idle.clear()
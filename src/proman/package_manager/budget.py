@@ -0,0 +1,117 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Bound temporary disk, memory and open files used by installs."""
+
+import logging
+import re
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Union
+
+log = logging.getLogger(__name__)
+
+__all__: List[str] = ['Budget', 'Budgets', 'parse_size']
+
+SIZE_UNITS = {'': 1, 'k': 1 << 10, 'm': 1 << 20, 'g': 1 << 30, 't': 1 << 40}
+
+# descriptors held by a download (socket and file) and a wheel install
+# (archive, extracted file and RECORD)
+DOWNLOAD_FILES = 2
+INSTALL_FILES = 3
+
+
+def parse_size(value: Union[int, str, None]) -> Optional[int]:
+    """Parse sizes such as 512M or 2GiB into bytes."""
+    if value is None or isinstance(value, int):
+        return value
+    match = re.fullmatch(r'\s*(\d+)\s*([kmgt]?)(?:i?b)?\s*', value.lower())
+    if not match:
+        raise ValueError(f"invalid size {value!r}")
+    return int(match.group(1)) * SIZE_UNITS[match.group(2)]
+
+
+class Budget:
+    """Reserve amounts of a resource waiting while it is exhausted.
+
+    Requests larger than the capacity are clamped to it so they run
+    alone instead of waiting forever.
+    """
+
+    def __init__(self, name: str, capacity: Optional[int] = None) -> None:
+        """Initialize budget where None is unlimited."""
+        if capacity is not None and capacity < 1:
+            raise ValueError(f"invalid {name} budget {capacity}")
+        self.name = name
+        self.capacity = capacity
+        self.__condition = threading.Condition()
+        self.__used = 0
+        self.peak = 0
+
+    @property
+    def used(self) -> int:
+        """Get amount currently reserved."""
+        return self.__used
+
+    def acquire(self, amount: int) -> int:
+        """Wait until amount fits returning the amount reserved."""
+        if self.capacity is None or amount <= 0:
+            return 0
+        amount = min(amount, self.capacity)
+        with self.__condition:
+            if self.__used + amount > self.capacity:
+                log.debug(f"waiting for {amount} of {self.name} budget")
+            while self.__used + amount > self.capacity:
+                self.__condition.wait()
+            self.__used += amount
+            self.peak = max(self.peak, self.__used)
+        return amount
+
+    def release(self, amount: int) -> None:
+        """Return reserved amount to the budget."""
+        if amount <= 0:
+            return
+        with self.__condition:
+            self.__used -= amount
+            self.__condition.notify_all()
+
+    @contextmanager
+    def reserve(self, amount: int) -> Iterator[int]:
+        """Hold amount of the budget while work runs."""
+        reserved = self.acquire(amount)
+        try:
+            yield reserved
+        finally:
+            self.release(reserved)
+
+
+class Budgets:
+    """Provide temporary disk, memory and open file budgets."""
+
+    def __init__(
+        self,
+        temp_disk: Union[int, str, None] = None,
+        memory: Union[int, str, None] = None,
+        open_files: Optional[int] = None,
+    ) -> None:
+        """Initialize budgets where None is unlimited."""
+        self.temp_disk = Budget('temp disk', parse_size(temp_disk))
+        self.memory = Budget('memory', parse_size(memory))
+        self.open_files = Budget('open files', open_files)
+
+    @classmethod
+    def from_config(cls, settings: Optional[Dict[str, Any]]) -> 'Budgets':
+        """Create budgets from the tool.proman.budgets table."""
+        settings = settings or {}
+        return cls(
+            temp_disk=settings.get('temp_disk'),
+            memory=settings.get('memory'),
+            open_files=settings.get('open_files'),
+        )
+
+    @property
+    def bounded(self) -> bool:
+        """Check any budget is limited."""
+        return any(
+            x.capacity is not None
+            for x in (self.temp_disk, self.memory, self.open_files)
+        )
@@ -0,0 +1,257 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Create and restore portable bundles of pypackages."""
+
+import hashlib
+import json
+import logging
+import os
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from packaging.utils import canonicalize_name
+
+from .exception import PackageManagerBundle
+
+log = logging.getLogger(__name__)
+
+__all__: List[str] = [
+    'create_bundle',
+    'lock_digest',
+    'read_index',
+    'restore_bundle',
+    'verify_locks',
+]
+
+BUNDLE_FORMAT = 1
+BUNDLE_INDEX = 'proman-bundle.json'
+TREE_DIR = 'tree'
+WHEEL_DIR = 'wheels'
+CHUNK_SIZE = 1024 * 1024
+
+
+def _hash_file(filepath: str) -> str:
+    """Get sha256 digest of a file."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _lock_key(locks: Iterable[Dict[str, Any]]) -> List[Tuple[str, str]]:
+    """Get sorted name and version pairs from locks."""
+    return sorted((x['name'].lower(), str(x['version'])) for x in locks)
+
+
+def lock_digest(locks: Iterable[Dict[str, Any]]) -> str:
+    """Get digest identifying the locked distributions."""
+    content = json.dumps(_lock_key(locks), separators=(',', ':'))
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def _walk_tree(dist_dir: str) -> List[Tuple[str, str]]:
+    """List files of a distribution tree with their archive names."""
+    entries = []
+    for root, dirs, files in os.walk(dist_dir):
+        # bytecode is regenerated by the interpreter on first import
+        dirs[:] = sorted(d for d in dirs if d != '__pycache__')
+        for filename in sorted(files):
+            filepath = os.path.join(root, filename)
+            relpath = os.path.relpath(filepath, dist_dir)
+            entries.append(
+                (filepath, '/'.join([TREE_DIR] + relpath.split(os.sep)))
+            )
+    return entries
+
+
+def create_bundle(
+    dist_dir: str,
+    dest: str,
+    locks: Iterable[Dict[str, Any]],
+    wheels: Iterable[str] = (),
+    **options: Any,
+) -> str:
+    """Create a compressed digest indexed archive of an environment.
+
+    Parameters
+    ----------
+    dist_dir: str
+        versioned pypackages directory to be bundled
+    dest: str
+        filepath of the bundle to be created
+    locks: Iterable[Dict[str, Any]]
+        locked distributions the environment was installed from
+    wheels: Iterable[str]
+        wheel files to be shipped alongside the unpacked tree
+
+    """
+    locks = list(locks)
+    entries = _walk_tree(dist_dir) if os.path.isdir(dist_dir) else []
+    entries += [
+        (x, f"{WHEEL_DIR}/{os.path.basename(x)}") for x in sorted(wheels)
+    ]
+    index: Dict[str, Any] = {
+        'format': BUNDLE_FORMAT,
+        'python': os.path.basename(os.path.normpath(dist_dir)),
+        'locks': [
+            {'name': x['name'], 'version': str(x['version'])} for x in locks
+        ],
+        'lock_digest': lock_digest(locks),
+        'files': {},
+    }
+    compression = options.get('compression', zipfile.ZIP_DEFLATED)
+    tmp_path = f"{dest}.part"
+    with zipfile.ZipFile(tmp_path, 'w', compression=compression) as bundle:
+        for filepath, arcname in entries:
+            index['files'][arcname] = {
+                'sha256': _hash_file(filepath),
+                'size': os.path.getsize(filepath),
+            }
+            bundle.write(filepath, arcname)
+        bundle.writestr(BUNDLE_INDEX, json.dumps(index, sort_keys=True))
+    os.replace(tmp_path, dest)
+    log.info(f"bundled {len(entries)} files into {dest}")
+    return dest
+
+
+def read_index(filepath: str) -> Dict[str, Any]:
+    """Read the digest index of a bundle."""
+    try:
+        with zipfile.ZipFile(filepath) as bundle:
+            index = json.loads(bundle.read(BUNDLE_INDEX))
+    except (KeyError, zipfile.BadZipFile) as err:
+        raise PackageManagerBundle(f"invalid bundle {filepath}") from err
+    if index.get('format') != BUNDLE_FORMAT:
+        raise PackageManagerBundle(
+            f"unsupported bundle format {index.get('format')}"
+        )
+    return index
+
+
+def verify_locks(
+    index: Dict[str, Any], locks: Iterable[Dict[str, Any]]
+) -> None:
+    """Verify bundle was created from the same locked distributions."""
+    expected = _lock_key(locks)
+    actual = _lock_key(index['locks'])
+    if expected != actual:
+        missing = sorted(set(expected) - set(actual))
+        extra = sorted(set(actual) - set(expected))
+        raise PackageManagerBundle(
+            f"bundle does not match lock: missing {missing}, extra {extra}"
+        )
+
+
+def _get_unpacked(index: Dict[str, Any]) -> Set[Tuple[str, str]]:
+    """Get names and versions of distributions in the bundled tree."""
+    unpacked: Set[Tuple[str, str]] = set()
+    for arcname in index['files']:
+        kind, _, relpath = arcname.partition('/')
+        if kind != TREE_DIR:
+            continue
+        for part in relpath.split('/')[:-1]:
+            if part.endswith('.dist-info'):
+                name, _, version = part[: -len('.dist-info')].partition('-')
+                unpacked.add((canonicalize_name(name), version))
+    return unpacked
+
+
+def _wheel_key(filename: str) -> Tuple[str, str]:
+    """Get name and version of a wheel from its filename."""
+    name, version = filename.split('-')[:2]
+    return canonicalize_name(name), version
+
+
+def _target_path(dest_dir: str, arcname: str) -> str:
+    """Get safe extraction path for an archive member."""
+    parts = arcname.split('/')
+    if arcname.startswith('/') or '..' in parts:
+        raise PackageManagerBundle(f"unsafe path in bundle {arcname}")
+    return os.path.join(dest_dir, *parts)
+
+
+def _extract_members(
+    filepath: str,
+    members: List[Tuple[str, str, str]],
+) -> int:
+    """Extract and verify a chunk of bundle members."""
+    with zipfile.ZipFile(filepath) as bundle:
+        for arcname, target, expected in members:
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            digest = hashlib.sha256()
+            with bundle.open(arcname) as src, open(target, 'wb') as dst:
+                for chunk in iter(lambda: src.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                    dst.write(chunk)
+            if digest.hexdigest() != expected:
+                os.remove(target)
+                raise PackageManagerBundle(f"digest mismatch for {arcname}")
+    return len(members)
+
+
+def restore_bundle(
+    filepath: str,
+    dist_dir: str,
+    locks: Optional[Iterable[Dict[str, Any]]] = None,
+    **options: Any,
+) -> List[str]:
+    """Restore a bundle into a versioned pypackages directory.
+
+    Parameters
+    ----------
+    filepath: str
+        bundle to be restored
+    dist_dir: str
+        versioned pypackages directory receiving the unpacked tree
+    locks: Iterable[Dict[str, Any]], optional
+        locked distributions the bundle must match
+    max_workers: int
+        number of parallel extraction workers
+
+    Returns
+    -------
+    List[str]:
+        wheel files shipped in the bundle that still require install
+
+    """
+    index = read_index(filepath)
+    python = os.path.basename(os.path.normpath(dist_dir))
+    if index.get('python') != python:
+        raise PackageManagerBundle(
+            f"bundle was created for Python {index.get('python')}"
+            f" not {python}"
+        )
+    if locks is not None:
+        verify_locks(index, locks)
+
+    wheel_dir = options.get('wheel_dir', os.path.join(dist_dir, WHEEL_DIR))
+    unpacked = _get_unpacked(index)
+    members = []
+    wheels = []
+    for arcname, meta in sorted(index['files'].items()):
+        kind, _, relpath = arcname.partition('/')
+        if kind == TREE_DIR:
+            target = _target_path(dist_dir, relpath)
+        elif kind == WHEEL_DIR:
+            # wheels of distributions in the tree are already installed
+            if _wheel_key(relpath) in unpacked:
+                continue
+            target = _target_path(wheel_dir, relpath)
+            wheels.append(target)
+        else:
+            raise PackageManagerBundle(f"unknown bundle member {arcname}")
+        members.append((arcname, target, meta['sha256']))
+
+    max_workers = options.get('max_workers') or os.cpu_count() or 1
+    chunks = [members[i::max_workers] for i in range(max_workers)]
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        count = sum(
+            executor.map(
+                lambda x: _extract_members(filepath, x),
+                [x for x in chunks if x],
+            )
+        )
+    log.info(f"restored {count} files from {filepath}")
+    return wheels
@@ -0,0 +1,248 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Verify installed distributions against RECORD and lock."""
+
+import base64
+import csv
+import hashlib
+import json
+import logging
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from packaging.utils import canonicalize_name
+
+log = logging.getLogger(__name__)
+
+__all__: List[str] = ['check_environment', 'hash_file']
+
+STATE_FORMAT = 1
+STATE_FILENAME = 'proman-check.json'
+LIB_DIRS = ('lib', 'lib64')
+# verifying few files is faster than starting worker processes
+INLINE_LIMIT = 256
+CHUNK_SIZE = 64
+
+# (relative path, algorithm, expected digest, expected size)
+Entry = Tuple[str, Optional[str], Optional[str], Optional[int]]
+
+
+def hash_file(filepath: str, algorithm: str = 'sha256') -> str:
+    """Get RECORD style digest of a file by mapping it into memory."""
+    digest = hashlib.new(algorithm)
+    with open(filepath, 'rb') as f:
+        if os.fstat(f.fileno()).st_size:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                digest.update(data)
+    return base64.urlsafe_b64encode(digest.digest()).decode().rstrip('=')
+
+
+def _verify_chunk(
+    dist_dir: str, entries: List[Entry]
+) -> List[Tuple[str, str, int, int]]:
+    """Verify files returning status, size and mtime of each."""
+    results = []
+    for relpath, algorithm, expected, size in entries:
+        filepath = os.path.join(dist_dir, relpath)
+        try:
+            stat = os.stat(filepath)
+        except OSError:
+            results.append((relpath, 'missing', 0, 0))
+            continue
+        if size is not None and stat.st_size != size:
+            status = 'modified'
+        elif algorithm and expected:
+            status = (
+                'ok'
+                if hash_file(filepath, algorithm) == expected
+                else 'modified'
+            )
+        else:
+            status = 'ok'
+        results.append((relpath, status, stat.st_size, stat.st_mtime_ns))
+    return results
+
+
+def _parse_record(subdir: str, record_path: str) -> List[Entry]:
+    """Parse RECORD rows into paths relative to the pypackages directory."""
+    entries: List[Entry] = []
+    with open(record_path, newline='') as f:
+        for row in csv.reader(f):
+            if not row:
+                continue
+            row += [''] * (3 - len(row))
+            algorithm, _, expected = row[1].partition('=')
+            entries.append(
+                (
+                    os.path.normpath(os.path.join(subdir, row[0])),
+                    algorithm or None,
+                    expected or None,
+                    int(row[2]) if row[2] else None,
+                )
+            )
+    return entries
+
+
+def _read_records(dist_dir: str) -> Dict[str, Tuple[str, List[Entry]]]:
+    """Read RECORD entries of each installed distribution."""
+    distributions: Dict[str, Tuple[str, List[Entry]]] = {}
+    for subdir in LIB_DIRS:
+        lib = os.path.join(dist_dir, subdir)
+        if not os.path.isdir(lib):
+            continue
+        for dist_info in sorted(os.listdir(lib)):
+            if not dist_info.endswith('.dist-info'):
+                continue
+            name, _, version = dist_info[:-10].rpartition('-')
+            record_path = os.path.join(lib, dist_info, 'RECORD')
+            if os.path.isfile(record_path):
+                entries = _parse_record(subdir, record_path)
+            else:
+                # report the RECORD itself as missing
+                relpath = os.path.join(subdir, dist_info, 'RECORD')
+                entries = [(relpath, None, None, None)]
+            distributions[canonicalize_name(name)] = (version, entries)
+    return distributions
+
+
+def _find_extras(dist_dir: str, recorded: Iterable[str]) -> List[str]:
+    """Find library files not listed by any RECORD."""
+    known = set(recorded)
+    extras = []
+    for subdir in LIB_DIRS:
+        for root, dirs, files in os.walk(os.path.join(dist_dir, subdir)):
+            # bytecode is generated by the interpreter
+            dirs[:] = [x for x in dirs if x != '__pycache__']
+            for filename in files:
+                relpath = os.path.relpath(
+                    os.path.join(root, filename), dist_dir
+                )
+                if relpath not in known and not filename.endswith('.pyc'):
+                    extras.append(relpath)
+    return sorted(extras)
+
+
+def _load_state(dist_dir: str) -> Dict[str, List[Any]]:
+    """Load size, mtime and digest of files from the last verified run."""
+    try:
+        with open(os.path.join(dist_dir, STATE_FILENAME)) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data['files'] if data.get('format') == STATE_FORMAT else {}
+
+
+def _save_state(dist_dir: str, files: Dict[str, List[Any]]) -> None:
+    """Save verified file state atomically."""
+    filepath = os.path.join(dist_dir, STATE_FILENAME)
+    tmp_path = f"{filepath}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(
+            {'format': STATE_FORMAT, 'files': files},
+            f,
+            separators=(',', ':'),
+        )
+    os.replace(tmp_path, filepath)
+
+
+def check_environment(
+    dist_dir: str,
+    locks: Optional[Iterable[Dict[str, Any]]] = None,
+    **options: Any,
+) -> Dict[str, Any]:
+    """Verify installed files and versions of a pypackages directory.
+
+    Parameters
+    ----------
+    dist_dir: str
+        versioned pypackages directory to be verified
+    locks: Iterable[Dict[str, Any]], optional
+        locked distributions installed versions must match
+    incremental: bool
+        skip files whose size and mtime are unchanged since the last run
+    max_workers: int
+        number of hashing processes
+
+    Returns
+    -------
+    Dict[str, Any]:
+        missing, modified and extra files and distributions differing
+        from the lock
+
+    """
+    distributions = _read_records(dist_dir)
+    state = _load_state(dist_dir) if options.get('incremental') else {}
+
+    pending: List[Entry] = []
+    verified: Dict[str, List[Any]] = {}
+    for _, entries in distributions.values():
+        for relpath, algorithm, expected, size in entries:
+            previous = state.get(relpath)
+            if previous and previous[2] == expected:
+                try:
+                    stat = os.stat(os.path.join(dist_dir, relpath))
+                except OSError:
+                    pass
+                else:
+                    if [stat.st_size, stat.st_mtime_ns] == previous[:2]:
+                        verified[relpath] = previous
+                        continue
+            pending.append((relpath, algorithm, expected, size))
+    skipped = len(verified)
+
+    if len(pending) <= INLINE_LIMIT:
+        results = _verify_chunk(dist_dir, pending)
+    else:
+        max_workers = options.get('max_workers') or os.cpu_count() or 1
+        count = max(1, len(pending) // CHUNK_SIZE)
+        chunks = [pending[i::count] for i in range(count)]
+        with ProcessPoolExecutor(max_workers=max_workers) as executor:
+            results = [
+                x
+                for chunk in executor.map(
+                    _verify_chunk, [dist_dir] * len(chunks), chunks
+                )
+                for x in chunk
+            ]
+
+    expected_digests = {x[0]: x[2] for x in pending}
+    report: Dict[str, Any] = {
+        'checked': len(results),
+        'skipped': skipped,
+        'missing': [],
+        'modified': [],
+        'extra': _find_extras(
+            dist_dir,
+            (x[0] for _, entries in distributions.values() for x in entries),
+        ),
+        'not_installed': [],
+        'version_mismatch': [],
+        'unlocked': [],
+    }
+    for relpath, status, size, mtime in results:
+        if status == 'ok':
+            verified[relpath] = [size, mtime, expected_digests[relpath]]
+        else:
+            report[status].append(relpath)
+    report['missing'].sort()
+    report['modified'].sort()
+    if os.path.isdir(dist_dir):
+        _save_state(dist_dir, verified)
+
+    if locks is not None:
+        locked = {canonicalize_name(x['name']): x for x in locks}
+        for key, lock in sorted(locked.items()):
+            if key not in distributions:
+                report['not_installed'].append(lock['name'])
+            elif distributions[key][0] != str(lock['version']):
+                report['version_mismatch'].append(
+                    {
+                        'name': lock['name'],
+                        'locked': str(lock['version']),
+                        'installed': distributions[key][0],
+                    }
+                )
+        report['unlocked'] = sorted(set(distributions) - set(locked))
+    return report
@@ -2,21 +2,36 @@
 # SPDX-License-Identifier: LGPL-3.0-or-later
 """Arguments for inspection based CLI parser."""
 
-import json
+import json as _json
 import logging
+import os
 import sys
-from typing import Any, Optional
+from typing import Any, Dict, List, Optional, Tuple
 
-from . import (
-    local_distribution as _local_distribution,
-    get_package_manager as _get_package_manager,
-)
+from . import config as _config
+from . import daemon as _daemon
+from . import exception as _exception
+from . import get_package_manager as _get_package_manager
+from . import stamp as _stamp
 
 log_level: Optional[str] = None
 _log = logging.getLogger(__name__)
 _package_manager = _get_package_manager()
 
 
+def _get_project_mtimes() -> List[Optional[Tuple[int, int]]]:
+    """Get modification times and sizes of the pyproject and lock."""
+    mtimes: List[Optional[Tuple[int, int]]] = []
+    for path in (_config.pyproject_path, _package_manager.lock_path):
+        try:
+            stat = os.stat(path)
+        except OSError:
+            mtimes.append(None)
+        else:
+            mtimes.append((stat.st_mtime_ns, stat.st_size))
+    return mtimes
+
+
 def config() -> None:
     """Manage distributions and global configuration."""
     pass
@@ -42,10 +57,91 @@ def config() -> None:
 #         print('project is already initialized')
 
 
-def info(name: str, output: str = None) -> None:
-    """Get package info."""
-    info = _package_manager.info(name)
-    print(json.dumps(info, indent=2))
+def daemon(stop: bool = False) -> None:
+    """Serve commands for this project from a resident process.
+
+    Parameters
+    ----------
+    stop: bool
+        stop the daemon serving this project
+
+    """
+    if stop:
+        if not _daemon.stop_daemon():
+            print('no daemon is serving this project', file=sys.stderr)
+        return
+
+    from .__main__ import get_parser
+
+    parser = get_parser()
+    mtimes = _get_project_mtimes()
+
+    def dispatch(args: List[str]) -> None:
+        global _package_manager
+        nonlocal mtimes
+        current = _get_project_mtimes()
+        if current != mtimes:
+            # settings and locks edited since the manager was loaded
+            _log.info('reloading changed project files')
+            _package_manager = _get_package_manager()
+            mtimes = current
+        else:
+            _package_manager.refresh()
+        parser.dispatch(args)
+
+    _daemon.serve(dispatch)
+
+
+def cache(
+    command: str,
+    bind: str = '127.0.0.1',
+    port: int = 8080,
+    upstream: Optional[str] = None,
+    url: Optional[str] = None,
+) -> None:
+    """Share the artifact and metadata cache with other nodes.
+
+    Parameters
+    ----------
+    command: str
+        serve the cache as a read-through package index proxy
+    bind: str
+        address the proxy listens on
+    port: int
+        port the proxy listens on
+    upstream: str
+        package index the proxy reads through to
+    url: str
+        public URL of the proxy used in file links
+
+    """
+    if command != 'serve':
+        print(f"unknown cache command {command!r}", file=sys.stderr)
+        sys.exit(2)
+    from .proxy import serve
+
+    serve(bind, port, upstream=upstream, url=url)
+
+
+def info(*names: str, fields: Optional[str] = None) -> None:
+    """Get package info.
+
+    Parameters
+    ----------
+    names: str
+        name of package(s) to be looked up
+    fields: str
+        comma separated fields to select such as info.version,urls.filename
+
+    """
+    if len(names) == 1 and not fields:
+        print(_json.dumps(_package_manager.info(names[0]), indent=2))
+    else:
+        infos = _package_manager.get_infos(
+            *names, fields=fields.split(',') if fields else None
+        )
+        for name, record in infos.items():
+            print(_json.dumps({'name': name, **(record or {})}))
 
 
 def download(name: str, dest: str = '.') -> None:
@@ -70,10 +166,49 @@ def install(*packages: str, **options: Any) -> None:
         optional package that is not required
     platform: str
         restrict package to specific platform
+    from_bundle: str
+        restore environment from bundle without network access
+    refresh: bool
+        resolve again instead of reusing a cached resolution
+    workspace: bool
+        install every member project of the workspace
+    deadline: float
+        seconds after which outstanding index requests fail
+    zipped: bool
+        keep zip safe pure Python wheels intact instead of unpacking them
 
     """
     options['log_level'] = log_level
-    _package_manager.install(*packages, **options)
+    if options.pop('workspace', False):
+        from .workspace import Workspace
+
+        errors = Workspace.from_config().install(**options)
+        for member, error in sorted(errors.items()):
+            print(member, error or 'installed')
+        if any(errors.values()):
+            sys.exit(1)
+        return
+    try:
+        _package_manager.install(*packages, **options)
+    except _exception.PackageManagerResolution as err:
+        print(err, file=sys.stderr)
+        sys.exit(1)
+
+
+def bundle(
+    dest: str = 'proman-bundle.zip', wheel_dir: Optional[str] = None
+) -> None:
+    """Bundle locked environment into a portable archive.
+
+    Parameters
+    ----------
+    dest: str
+        filepath of the bundle to be created
+    wheel_dir: str
+        directory of wheels to include with the unpacked tree
+
+    """
+    _package_manager.bundle(dest, wheel_dir=wheel_dir)
 
 
 def uninstall(*packages: str, **options: Any) -> None:
@@ -89,6 +224,12 @@ def uninstall(*packages: str, **options: Any) -> None:
     _package_manager.uninstall(*packages, **options)
 
 
+def gc() -> None:
+    """Remove unreferenced stored distributions and stale artifacts."""
+    for key in _package_manager.collect():
+        print('removed', key, file=sys.stdout)
+
+
 def update(*packages: str, **options: Any) -> None:
     """Update package(s) and dependencies.
 
@@ -104,63 +245,192 @@ def update(*packages: str, **options: Any) -> None:
     _package_manager.update(*packages, **options)
 
 
-def list(versions: bool = True) -> None:
-    """List installed packages."""
-    if versions:
-        for k in _local_distribution.packages:
-            print(k.name.ljust(25), k.version.ljust(15), file=sys.stdout)
+def sync(production: bool = False, dry_run: bool = False) -> None:
+    """Install, remove and swap packages to match the lock exactly.
+
+    Parameters
+    ----------
+    production: bool
+        exclude development dependencies
+    dry_run: bool
+        only show the changes that would be made
+
+    """
+    plan = _package_manager.sync(production=production, dry_run=dry_run)
+    _print_plan(plan)
+
+
+def _print_plan(plan: Any) -> None:
+    """Print changes of a sync plan."""
+    for lock in plan.installs:
+        print('+', lock['name'], lock['version'], file=sys.stdout)
+    for record in plan.removals:
+        print('-', record.name, record.version, file=sys.stdout)
+    for record, lock in plan.swaps:
+        print(
+            '~',
+            record.name,
+            record.version,
+            '->',
+            lock['version'],
+            file=sys.stdout,
+        )
+    print(f"{plan.unchanged} unchanged", file=sys.stdout)
+
+
+def status(quick: bool = False, json: bool = False) -> None:
+    """Show whether installed packages match the lock.
+
+    Parameters
+    ----------
+    quick: bool
+        only compare the stamp written when the environment last matched
+    json: bool
+        output status as JSON
+
+    """
+    result: Dict[str, Any] = {
+        'stamp': _stamp.stamp_status(
+            _package_manager.distribution_path.dist_dir,
+            _package_manager.lock_path,
+        )
+    }
+    current = result['stamp'] == _stamp.CURRENT
+    if not quick:
+        plan = _package_manager.sync(dry_run=True)
+        result['plan'] = plan.to_dict()
+        current = not plan
+    if json:
+        print(_json.dumps(result), file=sys.stdout)
+    else:
+        print('stamp', result['stamp'], file=sys.stdout)
+        if not quick:
+            _print_plan(plan)
+    if not current:
+        sys.exit(1)
+
+
+def check(
+    incremental: bool = False, production: bool = False, json: bool = False
+) -> None:
+    """Verify installed packages match their RECORD and the lock.
+
+    Parameters
+    ----------
+    incremental: bool
+        skip files unchanged since the last verified run
+    production: bool
+        exclude development packages from the lock
+    json: bool
+        output report as JSON
+
+    """
+    report = _package_manager.check(
+        incremental=incremental, production=production
+    )
+    issues = {
+        k: v
+        for k, v in report.items()
+        if k not in ('checked', 'skipped') and v
+    }
+    if json:
+        print(_json.dumps(report), file=sys.stdout)
+    else:
+        for kind, values in issues.items():
+            for value in values:
+                print(kind.ljust(18), value, file=sys.stdout)
+        print(
+            f"checked {report['checked']} files,",
+            f"skipped {report['skipped']} unchanged,",
+            f"found {sum(len(x) for x in issues.values())} issues",
+            file=sys.stdout,
+        )
+    if issues:
+        sys.exit(1)
+
+
+def list(
+    versions: bool = True, json: bool = False, outdated: bool = False
+) -> None:
+    """List installed packages.
+
+    Parameters
+    ----------
+    versions: bool
+        include installed versions
+    json: bool
+        output packages as JSON
+    outdated: bool
+        only list packages with newer releases
+
+    """
+    if outdated:
+        packages = _package_manager.outdated()
+    else:
+        packages = [
+            {'name': x.name, 'version': x.version}
+            for x in _package_manager.list_installed()
+        ]
+
+    if json:
+        print(_json.dumps(packages), file=sys.stdout)
+    elif versions:
+        for x in packages:
+            print(
+                x['name'].ljust(25),
+                x['version'].ljust(15),
+                x.get('latest', ''),
+                file=sys.stdout,
+            )
     else:
-        print('\n'.join(_local_distribution.package_names), file=sys.stdout)
+        print('\n'.join(x['name'] for x in packages), file=sys.stdout)
 
 
 def search(
     name: str,
-    version: Optional[str] = None,
-    stable_version: Optional[str] = None,
-    author: Optional[str] = None,
-    author_email: Optional[str] = None,
-    maintainer: Optional[str] = None,
-    maintainer_email: Optional[str] = None,
-    home_page: Optional[str] = None,
-    terms: Optional[str] = None,
     summary: Optional[str] = None,
-    description: Optional[str] = None,
     keywords: Optional[str] = None,
-    platform: Optional[str] = None,
-    download_url: Optional[str] = None,
     classifiers: Optional[str] = None,
-    project_url: Optional[str] = None,
-    docs_url: Optional[str] = None,
     operation: Optional[str] = None,
+    refresh: bool = False,
+    limit: int = 20,
 ) -> None:
-    """Search PyPI for packages."""
+    """Search local index of PyPI packages.
+
+    Parameters
+    ----------
+    name: str
+        prefix or approximate name of package
+    summary: str
+        text contained in package summary
+    keywords: str
+        text contained in package keywords
+    classifiers: str
+        text contained in package classifiers
+    operation: str
+        combine field filters with 'and' or 'or'
+    refresh: bool
+        refresh index from the package index before searching
+    limit: int
+        maximum number of results
+
+    """
     packages = _package_manager.search(
         query={
             'name': name,
-            'version': version,
-            'stable_version': stable_version,
-            'author': author,
-            'author_email': author_email,
-            'maintainer': maintainer,
-            'maintainer_email': maintainer_email,
-            'home_page': home_page,
-            'license': terms,
             'summary': summary,
-            'description': description,
             'keywords': keywords,
-            'platform': platform,
-            'download_url': download_url,
             'classifiers': classifiers,
-            'project_url': project_url,
-            'docs_url': docs_url,
         },
         operation=operation,
+        refresh=refresh,
+        limit=limit,
     )
     for package in packages:
         print(
-            package['name'].ljust(25),  # type: ignore
-            package['version'].ljust(15),  # type: ignore
-            package['summary'],  # type: ignore
+            package['name'].ljust(25),
+            package['version'].ljust(15),
+            package['summary'],
             file=sys.stdout,
         )
 
@@ -3,9 +3,25 @@
 """Provide configuration for package management."""
 
 import os
+
 # from . import exception
 
 INDEX_URL = 'https://pypi.org'
+CHUNK_SIZE = 64 * 1024
+CACHE_DIR = os.getenv(
+    'PROMAN_CACHE_DIR',
+    os.path.join(os.path.expanduser('~'), '.cache', 'proman'),
+)
+METADATA_TTL = int(os.getenv('PROMAN_METADATA_TTL', '300'))
+RESOLUTION_TTL = int(os.getenv('PROMAN_RESOLUTION_TTL', '3600'))
+# cached artifacts are evicted once unused or beyond the total size
+ARTIFACT_MAX_AGE = int(os.getenv('PROMAN_ARTIFACT_MAX_AGE', '2592000'))
+ARTIFACT_MAX_SIZE = os.getenv('PROMAN_ARTIFACT_MAX_SIZE', '2G')
+REQUEST_TIMEOUT = float(os.getenv('PROMAN_REQUEST_TIMEOUT', '30'))
+# secondary indexes receive duplicates of requests slower than usual
+MIRROR_URLS = [
+    x for x in os.getenv('PROMAN_MIRROR_URLS', '').split(',') if x.strip()
+]
 VENV_PATH = os.getenv('VIRTUAL_ENV', None)
 PATHS = [VENV_PATH] if VENV_PATH else []
 
@@ -0,0 +1,148 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Serve CLI commands from a resident process over a Unix socket."""
+
+import hashlib
+import io
+import json
+import logging
+import os
+import socket
+import socketserver
+import threading
+from contextlib import redirect_stderr, redirect_stdout
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from . import config
+from .exception import PackageManagerDaemon
+
+log = logging.getLogger(__name__)
+
+__all__: List[str] = ['call_daemon', 'serve', 'socket_path', 'stop_daemon']
+
+TIMEOUT = 0.5
+
+
+def socket_path(base_dir: Optional[str] = None) -> str:
+    """Get socket path of the daemon serving a project."""
+    project = os.path.realpath(base_dir or config.base_dir)
+    digest = hashlib.sha1(project.encode('utf-8')).hexdigest()[:16]
+    return os.path.join(config.CACHE_DIR, 'daemon', f"{digest}.sock")
+
+
+def _request(
+    message: Dict[str, Any],
+    path: Optional[str] = None,
+    timeout: Optional[float] = None,
+) -> Optional[Dict[str, Any]]:
+    """Send request to the daemon returning None when it is absent."""
+    path = path or socket_path()
+    if not hasattr(socket, 'AF_UNIX') or not os.path.exists(path):
+        return None
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.settimeout(TIMEOUT)
+        client.connect(path)
+        # commands may legitimately run for a long time once accepted
+        client.settimeout(timeout)
+        client.sendall(json.dumps(message).encode('utf-8') + b'\n')
+        with client.makefile('rb') as f:
+            line = f.readline()
+    except OSError:
+        return None
+    finally:
+        client.close()
+    return json.loads(line) if line else None
+
+
+def call_daemon(args: Sequence[str]) -> Optional[Dict[str, Any]]:
+    """Run CLI arguments in the daemon when one serves this project."""
+    # long running commands would hold the daemon indefinitely
+    if os.getenv('PROMAN_NO_DAEMON') or (
+        args and args[0] in ('daemon', 'cache')
+    ):
+        return None
+    return _request({'args': list(args), 'cwd': os.getcwd()})
+
+
+def stop_daemon() -> bool:
+    """Ask the daemon serving this project to exit."""
+    return _request({'shutdown': True}) is not None
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """Handle a single newline delimited JSON request."""
+
+    server: '_Server'
+
+    def handle(self) -> None:
+        """Dispatch request and reply with captured output."""
+        request = json.loads(self.rfile.readline() or b'{}')
+        if request.get('shutdown'):
+            response: Dict[str, Any] = {'code': 0}
+            threading.Thread(target=self.server.shutdown).start()
+        elif not request.get('cwd') or os.path.realpath(
+            request['cwd']
+        ) != os.path.realpath(self.server.base_dir):
+            # the daemon only holds state of the project it was started in
+            response = {'code': None}
+        else:
+            response = self.server.run(request.get('args', []))
+        self.wfile.write(json.dumps(response).encode('utf-8') + b'\n')
+
+
+class _Server(socketserver.UnixStreamServer):
+    """Run commands one at a time so redirected output is not shared."""
+
+    def __init__(
+        self, path: str, dispatch: Callable[[List[str]], Any]
+    ) -> None:
+        """Initialize server bound to socket path."""
+        self.base_dir = config.base_dir
+        self.dispatch = dispatch
+        super().__init__(path, _Handler)
+
+    def run(self, args: List[str]) -> Dict[str, Any]:
+        """Run command capturing its output and exit code."""
+        stdout, stderr = io.StringIO(), io.StringIO()
+        code = 0
+        with redirect_stdout(stdout), redirect_stderr(stderr):
+            try:
+                self.dispatch(args)
+            except SystemExit as err:
+                # exit the way the interpreter would for the same code
+                if err.code is None or isinstance(err.code, int):
+                    code = err.code or 0
+                else:
+                    print(err.code, file=stderr)
+                    code = 1
+            except Exception as err:
+                log.exception(err)
+                print(f"error: {err}", file=stderr)
+                code = 1
+        return {
+            'code': code,
+            'stdout': stdout.getvalue(),
+            'stderr': stderr.getvalue(),
+        }
+
+
+def serve(
+    dispatch: Callable[[List[str]], Any], path: Optional[str] = None
+) -> None:
+    """Serve commands for the current project until stopped."""
+    path = path or socket_path()
+    os.makedirs(os.path.dirname(path), mode=0o700, exist_ok=True)
+    if os.path.exists(path):
+        if _request({'cwd': None}, path) is not None:
+            raise PackageManagerDaemon(f"daemon already listening on {path}")
+        os.remove(path)
+    server = _Server(path, dispatch)
+    os.chmod(path, 0o600)
+    log.info(f"daemon listening on {path}")
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+        if os.path.exists(path):
+            os.remove(path)
@@ -2,22 +2,177 @@
 # SPDX-License-Identifier: LGPL-3.0-or-later
 """Resolve package dependencies."""
 
-import re
-from typing import Any, Dict, Tuple
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Optional, Tuple
 
-# from distlib.database import Distribution
 # from distlib.index import PackageIndex
-from distlib.database import EggInfoDistribution, InstalledDistribution
-from distlib.locators import locate
+from distlib.database import (
+    Distribution,
+    EggInfoDistribution,
+    InstalledDistribution,
+    make_dist,
+)
 
 # from distlib.scripts import ScriptMaker
 # from distlib.wheel import Wheel
 # from packaging.specifiers import SpecifierSet
 from proman.common.dependencies import DependencyBase
 
+from .metadata import ReleaseFile
+from .session import get_locator
+from .specifiers import split_requirement
+
+if TYPE_CHECKING:
+    from .metadata import ProjectMetadata
+
 # from . import config
 
 
+class Candidate:
+    """Provide compact record of a resolved package candidate."""
+
+    # NOTE: DependencyBase has no slots so it is registered instead
+
+    __slots__ = (
+        '_name',
+        '_version',
+        'requires',
+        'artifacts',
+        'is_dev',
+        'is_optional',
+        'allow_prerelease',
+        'last_serial',
+        '_distribution',
+    )
+
+    def __init__(
+        self,
+        name: str,
+        version: str,
+        requires: Iterable[str] = (),
+        artifacts: Iterable[ReleaseFile] = (),
+        **options: Any,
+    ) -> None:
+        """Initialize candidate."""
+        self._name = name
+        self._version = version
+        self.requires = tuple(requires)
+        self.artifacts = tuple(artifacts)
+        self.is_dev = options.get('dev', False)
+        self.is_optional = options.get('optional', False)
+        self.allow_prerelease = options.get('prerelease', False)
+        self.last_serial: Optional[int] = options.get('last_serial')
+        self._distribution: Optional[Distribution] = None
+
+    def __repr__(self) -> str:
+        """Get representation of candidate."""
+        return f"Candidate({self.name!r}, {self.version!r})"
+
+    @classmethod
+    def from_metadata(
+        cls,
+        metadata: 'ProjectMetadata',
+        version: Optional[str] = None,
+        **options: Any,
+    ) -> 'Candidate':
+        """Create candidate from fetched metadata without network access."""
+        version = version or metadata.version
+        if 'requires' in options:
+            requires = options.pop('requires')
+        elif version == metadata.version:
+            requires = metadata.requires_dist
+        else:
+            requires = ()
+        options.setdefault('last_serial', metadata.last_serial)
+        return cls(
+            name=metadata.name,
+            version=version,
+            requires=requires,
+            artifacts=metadata.releases.get(version, ()),
+            **options,
+        )
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'Candidate':
+        """Create candidate from a serialized record."""
+        return cls(
+            name=data['name'],
+            version=data['version'],
+            requires=data.get('requires', ()),
+            artifacts=[
+                ReleaseFile.from_dict(x) for x in data.get('artifacts', ())
+            ],
+            dev=data.get('dev', False),
+            optional=data.get('optional', False),
+            prerelease=data.get('prerelease', False),
+            last_serial=data.get('last_serial'),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get serializable record."""
+        return {
+            'name': self.name,
+            'version': self.version,
+            'requires': list(self.requires),
+            'artifacts': [x.to_dict() for x in self.artifacts],
+            'dev': self.is_dev,
+            'optional': self.is_optional,
+            'prerelease': self.allow_prerelease,
+            'last_serial': self.last_serial,
+        }
+
+    @property
+    def name(self) -> str:
+        """Get name."""
+        return self._name
+
+    @property
+    def version(self) -> str:
+        """Get version."""
+        return self._version
+
+    @property
+    def key(self) -> str:
+        """Get case-insensitive name."""
+        return self._name.lower()
+
+    @property
+    def digests(self) -> Tuple[Dict[str, str]]:
+        """Get digests of each artifact."""
+        return tuple(  # type: ignore
+            x.digests for x in self.artifacts if x.sha256
+        )
+
+    @property
+    def url(self) -> str:
+        """Get url."""
+        return ''
+
+    @property
+    def distribution(self) -> Distribution:
+        """Get distlib distribution built on first use."""
+        if self._distribution is None:
+            dist = make_dist(self.name, self.version)
+            dist.metadata.run_requires = [{'requires': list(self.requires)}]
+            for artifact in self.artifacts:
+                dist.download_urls.add(artifact.url)
+                if artifact.sha256:
+                    dist.digests[artifact.url] = ('sha256', artifact.sha256)
+            self._distribution = dist
+        return self._distribution
+
+    def get_release(
+        self, package_type: str = 'bdist_wheel'
+    ) -> Optional[ReleaseFile]:
+        """Get artifact by package type."""
+        return next(
+            (x for x in self.artifacts if x.packagetype == package_type),
+            None,
+        )
+
+
+DependencyBase.register(Candidate)
+
+
 class Dependency(DependencyBase):
     """Manage dependency of a project."""
 
@@ -35,37 +190,41 @@ class Dependency(DependencyBase):
         # path: List[str] = config.PATHS,
         # include_egg: bool = False,
 
+        self.__sequence = sequence
+        self.__distribution: Optional[Distribution] = None
         if isinstance(sequence, InstalledDistribution) or isinstance(
             sequence, EggInfoDistribution
         ):
-            self._distribution = sequence
-        else:
-            # TODO: json/rpc does not include run_requires
-            # package = self.__locator.locate(sequence)
-            self._distribution = locate(
-                sequence, prereleases=self.__prerelease
-            )
+            self.__distribution = sequence
 
     def __getattr__(self, attr: str) -> Any:
         """Provide proxy for distribution."""
+        if attr.startswith('_'):
+            raise AttributeError(attr)
         return getattr(self._distribution, attr)
 
+    @property
+    def _distribution(self) -> Distribution:
+        """Get distribution located on first use."""
+        if self.__distribution is None:
+            # TODO: json/rpc does not include run_requires
+            # package = self.__locator.locate(sequence)
+            self.__distribution = get_locator().locate(
+                self.__sequence, prereleases=self.__prerelease
+            )
+        return self.__distribution
+
     @staticmethod
     def __get_specifier(package: str) -> Tuple[str, str]:
         """Get package name and version."""
-        regex = '^([a-zA-Z0-9][a-zA-Z0-9._-]*)([<!~=>].*)$'
-        package_info = [x for x in re.split(regex, package) if x != '']
-        name = package_info[0]
-        if len(package_info) == 2:
-            version = package_info[1]
-        else:
-            version = '*'
-        return name, version
+        return split_requirement(package)
 
     @property
     def name(self) -> str:
         """Get name."""
-        return self._distribution.name
+        if self.__distribution is None:
+            return self.__get_specifier(self.__sequence)[0]
+        return self.__distribution.name
 
     @property
     def version(self) -> str:
@@ -6,16 +6,18 @@ import logging
 import os
 import site
 import sys
+import threading
 from typing import Any, List, Optional
 
 from distlib.database import Distribution, DistributionPath
 
+from . import config, finder
+
 # from distlib.index import PackageIndex
 # from distlib.locators import locate
 # from distlib.scripts import ScriptMaker
 # from distlib.wheel import Wheel
 
-from . import config
 
 logger = logging.getLogger(__name__)
 
@@ -92,20 +94,49 @@ class LocalDistributionPath(DistributionPathMixin):
             f"{str(sys.version_info.major)}.{str(sys.version_info.minor)}"
         )
         self.__dist_dir = os.path.join(self.pypackages_dir, self.env_version)
+        self.__pth_lock = threading.Lock()
 
         DistributionPath.__init__(self, paths, include_egg)
 
+    @property
+    def dist_dir(self) -> str:
+        """Get versioned pypackages directory."""
+        return self.__dist_dir
+
     def create_dist_pth(self) -> None:
         """Create pth file for distibution version."""
         pth_file = os.path.join(
             self.pypackages_dir, f"proman-{self.env_version}.pth"
         )
-        if not os.path.exists(pth_file):
-            with open(pth_file, 'a+') as f:
-                for subpath in ['lib', 'lib64']:
-                    path = os.path.join(self.env_version, subpath)
-                    f.write(os.linesep)
-                    f.write(path)
+        lines = [
+            os.path.join(self.env_version, subpath)
+            for subpath in ['lib', 'lib64']
+        ]
+        with self.__pth_lock:
+            # zipped wheels stay importable by interpreters without proman
+            libdir = os.path.join(self.__dist_dir, 'lib')
+            if os.path.isdir(libdir):
+                lines += [
+                    os.path.join(self.env_version, 'lib', x)
+                    for x in sorted(os.listdir(libdir))
+                    if x.endswith('.whl')
+                ]
+            # resolve top level imports from the module map when available
+            lines.append(
+                "import importlib.util as u; "
+                "u.find_spec('proman.package_manager') and "
+                "__import__('proman.package_manager.finder', fromlist=['_'])"
+                f".install({os.path.abspath(self.__dist_dir)!r})"
+            )
+            content = os.linesep + os.linesep.join(lines)
+            if os.path.exists(pth_file):
+                with open(pth_file) as f:
+                    if f.read() == content:
+                        return
+            tmp_path = f"{pth_file}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.write(content)
+            os.replace(tmp_path, pth_file)
 
     def create_pypackages_pth(
         self, site_dir: Optional[str] = site.USER_SITE
@@ -143,5 +174,6 @@ class LocalDistributionPath(DistributionPathMixin):
 
     def load_pypackages(self, project_dir: str = os.getcwd()) -> None:
         """Load pypackages into paths."""
+        finder.install(self.__dist_dir)
         site.addsitedir(self.pypackages_dir)
         site.addsitedir(project_dir)
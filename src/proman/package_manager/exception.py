@@ -17,3 +17,23 @@ class PackageManagerConfig(PackageManagerException):
 
 class PackageManagerSettings(PackageManagerException):
     """Provide exception for Settings errors."""
+
+
+class PackageManagerBundle(PackageManagerException):
+    """Provide exception for bundle errors."""
+
+
+class PackageManagerStore(PackageManagerException):
+    """Provide exception for package store errors."""
+
+
+class PackageManagerDaemon(PackageManagerException):
+    """Provide exception for daemon errors."""
+
+
+class PackageManagerResolution(PackageManagerException):
+    """Provide exception for unresolvable requirements."""
+
+
+class PackageManagerNetwork(PackageManagerException):
+    """Provide exception for failed index requests."""
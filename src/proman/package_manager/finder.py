@@ -0,0 +1,193 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Resolve top level imports of pypackages from a precomputed map.
+
+This module is loaded at interpreter startup so it only uses the
+standard library.
+"""
+
+import json
+import os
+import sys
+from importlib.abc import MetaPathFinder
+from importlib.machinery import EXTENSION_SUFFIXES, ModuleSpec, PathFinder
+from importlib.util import spec_from_file_location
+from types import ModuleType
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+__all__: List[str] = ['ModuleMapFinder', 'install', 'write_module_map']
+
+MAP_FORMAT = 1
+MAP_FILENAME = 'proman-modules.json'
+LIB_DIRS = ('lib', 'lib64')
+# wheels installed intact are imported through zipimport
+WHEEL_SUFFIX = '.whl'
+_metadata_suffixes = ('.dist-info', '.egg-info', '.data')
+
+
+def _top_level(relpath: str) -> Optional[Tuple[str, str]]:
+    """Get module name and top level entry of a RECORD path."""
+    entry = relpath.replace('\\', '/').split('/', 1)[0]
+    if entry in ('', '.', '..', '__pycache__') or entry.endswith(
+        _metadata_suffixes
+    ):
+        return None
+    if '/' in relpath.replace('\\', '/'):
+        return (entry, entry) if entry.isidentifier() else None
+    if entry.endswith('.py'):
+        name = entry[:-3]
+    elif any(entry.endswith(x) for x in EXTENSION_SUFFIXES):
+        name = entry.split('.', 1)[0]
+    else:
+        return None
+    return (name, entry) if name.isidentifier() else None
+
+
+def _wheel_modules(filepath: str) -> List[str]:
+    """Get top level module names inside an intact wheel."""
+    # only needed when installing so startup does not import zipfile
+    import zipfile
+
+    try:
+        with zipfile.ZipFile(filepath) as zf:
+            names = zf.namelist()
+    except (OSError, zipfile.BadZipFile):
+        return []
+    return sorted(
+        {x[0] for x in (_top_level(x) for x in names) if x is not None}
+    )
+
+
+def build_module_map(
+    dist_dir: str, files: Iterable[str]
+) -> Dict[str, Optional[str]]:
+    """Map top level module names to locations relative to dist_dir."""
+    modules: Dict[str, Optional[str]] = {}
+    for relpath in files:
+        if relpath.endswith(WHEEL_SUFFIX) and '/' not in relpath:
+            names = None
+            entry = relpath
+        else:
+            top_level = _top_level(relpath)
+            if top_level is None:
+                continue
+            names, entry = [top_level[0]], top_level[1]
+        location = next(
+            (
+                f"{x}/{entry}"
+                for x in LIB_DIRS
+                if os.path.exists(os.path.join(dist_dir, x, entry))
+            ),
+            None,
+        )
+        if location is None:
+            continue
+        if names is None:
+            names = _wheel_modules(os.path.join(dist_dir, location))
+        for name in names:
+            # names provided by several distributions are namespace packages
+            if name in modules and modules[name] != location:
+                modules[name] = None
+            else:
+                modules[name] = location
+    return modules
+
+
+def write_module_map(dist_dir: str, files: Iterable[str]) -> None:
+    """Write module map of installed files atomically."""
+    data = {
+        'format': MAP_FORMAT,
+        'modules': build_module_map(dist_dir, files),
+    }
+    filepath = os.path.join(dist_dir, MAP_FILENAME)
+    tmp_path = f"{filepath}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f, separators=(',', ':'), sort_keys=True)
+    os.replace(tmp_path, filepath)
+
+
+class ModuleMapFinder(MetaPathFinder):
+    """Find top level modules of a pypackages directory without probing."""
+
+    def __init__(self, dist_dir: str) -> None:
+        """Initialize finder for a versioned pypackages directory."""
+        self.dist_dir = os.path.abspath(dist_dir)
+        self.filepath = os.path.join(self.dist_dir, MAP_FILENAME)
+        self.modules: Dict[str, Optional[str]] = {}
+        self.__mtime: Optional[int] = None
+        self.load()
+
+    def load(self) -> None:
+        """Load module map when it changed on disk."""
+        try:
+            mtime = os.stat(self.filepath).st_mtime_ns
+            if mtime == self.__mtime:
+                return
+            with open(self.filepath) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            self.modules = {}
+            self.__mtime = None
+            return
+        modules = (
+            data.get('modules', {}) if data.get('format') == MAP_FORMAT else {}
+        )
+        # stdlib names keep precedence over installed distributions
+        stdlib = getattr(sys, 'stdlib_module_names', ())
+        self.modules = {k: v for k, v in modules.items() if k not in stdlib}
+        self.__mtime = mtime
+
+    def invalidate_caches(self) -> None:
+        """Reload module map after installs in this interpreter."""
+        self.load()
+
+    def find_spec(
+        self,
+        fullname: str,
+        path: Optional[Sequence[str]] = None,
+        target: Optional[ModuleType] = None,
+    ) -> Optional[ModuleSpec]:
+        """Get spec of a mapped top level module."""
+        if path is not None:
+            return None
+        location = self.modules.get(fullname)
+        if location is None:
+            return None
+        filepath = os.path.join(self.dist_dir, *location.split('/'))
+        if location.endswith(WHEEL_SUFFIX):
+            if not os.path.isfile(filepath):
+                return None
+            # submodules are found by the zipimport path hook
+            return PathFinder.find_spec(fullname, [filepath])
+        if os.path.isdir(filepath):
+            init = os.path.join(filepath, '__init__.py')
+            if not os.path.isfile(init):
+                # let the path finder assemble namespace packages
+                return PathFinder.find_spec(
+                    fullname, [os.path.dirname(filepath)]
+                )
+            return spec_from_file_location(
+                fullname, init, submodule_search_locations=[filepath]
+            )
+        if os.path.isfile(filepath):
+            return spec_from_file_location(fullname, filepath)
+        # stale entries fall back to the regular import system
+        return None
+
+
+def install(dist_dir: str) -> ModuleMapFinder:
+    """Register finder of a pypackages directory once."""
+    dist_dir = os.path.abspath(dist_dir)
+    for finder in sys.meta_path:
+        if (
+            isinstance(finder, ModuleMapFinder)
+            and finder.dist_dir == dist_dir
+        ):
+            return finder
+    finder = ModuleMapFinder(dist_dir)
+    position = next(
+        (i for i, x in enumerate(sys.meta_path) if x is PathFinder),
+        len(sys.meta_path),
+    )
+    sys.meta_path.insert(position, finder)
+    return finder
@@ -0,0 +1,203 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Persist index of installed distributions."""
+
+import json
+import logging
+import os
+import threading
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, Optional
+
+from packaging.utils import canonicalize_name
+
+from .finder import write_module_map
+
+if TYPE_CHECKING:
+    from distlib.database import Distribution
+
+log = logging.getLogger(__name__)
+
+__all__: List[str] = ['InstalledIndex', 'InstalledRecord']
+
+INDEX_FORMAT = 1
+INDEX_FILENAME = 'proman-installed.json'
+LIB_DIRS = ('lib', 'lib64')
+
+
+class InstalledRecord:
+    """Provide compact record of an installed distribution."""
+
+    __slots__ = ('name', 'version', 'files', 'requires')
+
+    def __init__(
+        self,
+        name: str,
+        version: str,
+        files: Iterable[str] = (),
+        requires: Iterable[str] = (),
+    ) -> None:
+        """Initialize installed record."""
+        self.name = name
+        self.version = version
+        self.files = tuple(files)
+        self.requires = tuple(requires)
+
+    def __repr__(self) -> str:
+        """Get representation of installed record."""
+        return f"InstalledRecord({self.name!r}, {self.version!r})"
+
+    @property
+    def key(self) -> str:
+        """Get normalized name."""
+        return canonicalize_name(self.name)
+
+    @classmethod
+    def from_distribution(cls, dist: 'Distribution') -> 'InstalledRecord':
+        """Create record from an installed distribution."""
+        files = (
+            [x[0] for x in dist.list_installed_files()]
+            if hasattr(dist, 'list_installed_files')
+            else []
+        )
+        return cls(
+            name=dist.name,
+            version=dist.version,
+            files=files,
+            requires=sorted(dist.run_requires),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get serializable record."""
+        return {
+            'name': self.name,
+            'version': self.version,
+            'files': list(self.files),
+            'requires': list(self.requires),
+        }
+
+
+class InstalledIndex:
+    """Manage index of distributions installed in pypackages."""
+
+    def __init__(self, dist_dir: str) -> None:
+        """Initialize installed index for a versioned pypackages directory."""
+        self.dist_dir = dist_dir
+        self.filepath = os.path.join(dist_dir, INDEX_FILENAME)
+        self.__lock = threading.RLock()
+        self.__records: Optional[Dict[str, InstalledRecord]] = None
+        self.__dirty = False
+        self.__mtimes: Dict[str, int] = {}
+
+    def _get_mtimes(self) -> Dict[str, int]:
+        """Get modification times of library directories."""
+        mtimes = {}
+        for subdir in LIB_DIRS:
+            path = os.path.join(self.dist_dir, subdir)
+            if os.path.isdir(path):
+                mtimes[subdir] = os.stat(path).st_mtime_ns
+        return mtimes
+
+    def _read(self) -> Optional[Dict[str, InstalledRecord]]:
+        """Read index when it is consistent with library directories."""
+        try:
+            with open(self.filepath) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('format') != INDEX_FORMAT:
+            return None
+        if data.get('mtimes') != self._get_mtimes():
+            log.info('installed index is stale')
+            return None
+        self.__mtimes = data['mtimes']
+        return {
+            k: InstalledRecord(**v)
+            for k, v in data.get('distributions', {}).items()
+        }
+
+    def rebuild(self) -> None:
+        """Rebuild index by scanning installed distributions."""
+        # only the slow path needs distlib
+        from distlib.database import DistributionPath
+
+        paths = [
+            os.path.join(self.dist_dir, x)
+            for x in LIB_DIRS
+            if os.path.isdir(os.path.join(self.dist_dir, x))
+        ]
+        with self.__lock:
+            self.__records = {}
+            if paths:
+                for dist in DistributionPath(paths).get_distributions():
+                    record = InstalledRecord.from_distribution(dist)
+                    self.__records[record.key] = record
+            self.__dirty = True
+            self.save()
+
+    def invalidate(self) -> bool:
+        """Drop loaded records when changed by another process."""
+        with self.__lock:
+            if self.__records is None or self.__dirty:
+                return False
+            if self._get_mtimes() == self.__mtimes:
+                return False
+            self.__records = None
+            return True
+
+    @property
+    def records(self) -> Dict[str, InstalledRecord]:
+        """Get installed records by normalized name."""
+        self.load()
+        return self.__records or {}
+
+    def load(self) -> None:
+        """Load installed state before it is modified."""
+        with self.__lock:
+            if self.__records is None:
+                self.__records = self._read()
+                if self.__records is None:
+                    self.rebuild()
+
+    def get(self, name: str) -> Optional[InstalledRecord]:
+        """Get installed record of a distribution."""
+        return self.records.get(canonicalize_name(name))
+
+    def add(self, dist: 'Distribution') -> None:
+        """Add installed distribution to index."""
+        record = InstalledRecord.from_distribution(dist)
+        with self.__lock:
+            self.records[record.key] = record
+            self.__dirty = True
+
+    def remove(self, name: str) -> None:
+        """Remove distribution from index."""
+        with self.__lock:
+            if self.records.pop(canonicalize_name(name), None):
+                self.__dirty = True
+
+    def save(self) -> None:
+        """Write index atomically with current directory state."""
+        with self.__lock:
+            if not self.__dirty or self.__records is None:
+                return
+            if not os.path.isdir(self.dist_dir):
+                return
+            mtimes = self._get_mtimes()
+            data = {
+                'format': INDEX_FORMAT,
+                'mtimes': mtimes,
+                'distributions': {
+                    k: v.to_dict() for k, v in sorted(self.__records.items())
+                },
+            }
+            tmp_path = f"{self.filepath}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f, separators=(',', ':'))
+            os.replace(tmp_path, self.filepath)
+            # keep import map consistent with installed distributions
+            write_module_map(
+                self.dist_dir,
+                (x for v in self.__records.values() for x in v.files),
+            )
+            self.__mtimes = mtimes
+            self.__dirty = False
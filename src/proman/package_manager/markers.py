@@ -0,0 +1,125 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Evaluate environment markers for a target interpreter and platform."""
+
+from functools import lru_cache
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from packaging.markers import Marker, default_environment
+from packaging.requirements import Requirement
+
+__all__: List[str] = [
+    'TargetEnvironment',
+    'get_environment',
+    'get_platform_markers',
+    'get_python_markers',
+]
+
+# operating system markers by sys.platform value
+PLATFORMS = {
+    'linux': {
+        'sys_platform': 'linux',
+        'platform_system': 'Linux',
+        'os_name': 'posix',
+    },
+    'darwin': {
+        'sys_platform': 'darwin',
+        'platform_system': 'Darwin',
+        'os_name': 'posix',
+    },
+    'win32': {
+        'sys_platform': 'win32',
+        'platform_system': 'Windows',
+        'os_name': 'nt',
+    },
+}
+ARCHITECTURES = (
+    'x86_64',
+    'aarch64',
+    'arm64',
+    'amd64',
+    'i686',
+    'ppc64le',
+    's390x',
+    'armv7l',
+)
+
+
+def get_python_markers(python: str) -> Dict[str, str]:
+    """Get markers of a Python version such as 3.8 or 3.8.10."""
+    parts = python.strip().split('.')
+    if len(parts) < 2 or not all(x.isdigit() for x in parts[:2]):
+        raise ValueError(f"invalid Python version {python!r}")
+    full_version = '.'.join(parts) if len(parts) > 2 else f"{python}.0"
+    return {
+        'python_version': '.'.join(parts[:2]),
+        'python_full_version': full_version,
+        'implementation_version': full_version,
+    }
+
+
+def get_platform_markers(platform: str) -> Dict[str, str]:
+    """Get markers of a platform given as sys.platform or a wheel tag."""
+    tag = platform.strip().lower().replace('-', '_').replace('.', '_')
+    if tag.startswith('win'):
+        system = 'win32'
+    elif tag.startswith(('macosx', 'darwin')):
+        system = 'darwin'
+    elif 'linux' in tag:
+        system = 'linux'
+    else:
+        raise ValueError(f"unsupported platform {platform!r}")
+    markers = dict(PLATFORMS[system])
+    machine = next((x for x in ARCHITECTURES if tag.endswith(x)), None)
+    if machine:
+        # windows reports machines in upper case
+        markers['platform_machine'] = (
+            machine.upper() if system == 'win32' else machine
+        )
+    return markers
+
+
+class TargetEnvironment:
+    """Evaluate environment markers of a target memoizing each result."""
+
+    def __init__(
+        self, python: Optional[str] = None, platform: Optional[str] = None
+    ) -> None:
+        """Initialize environment overriding the running interpreter."""
+        self.markers: Dict[str, Any] = dict(default_environment())
+        if python:
+            self.markers.update(get_python_markers(python))
+        if platform:
+            self.markers.update(get_platform_markers(platform))
+        self.__results: Dict[Tuple[str, str], bool] = {}
+
+    @property
+    def python(self) -> str:
+        """Get full Python version of the target."""
+        return self.markers['python_full_version']
+
+    def evaluate(self, marker: Marker, extra: str = '') -> bool:
+        """Evaluate marker with an extra requested."""
+        key = (str(marker), extra)
+        result = self.__results.get(key)
+        if result is None:
+            result = self.__results[key] = marker.evaluate(
+                {**self.markers, 'extra': extra}
+            )
+        return result
+
+    def applies(
+        self, requirement: Requirement, extras: Iterable[str] = ()
+    ) -> bool:
+        """Check requirement is needed on the target with given extras."""
+        if requirement.marker is None:
+            return True
+        return any(self.evaluate(requirement.marker, x) for x in ('', *extras))
+
+
+@lru_cache(maxsize=None)
+def get_environment(
+    python: Optional[str] = None, platform: Optional[str] = None
+) -> TargetEnvironment:
+    """Get shared target environment so marker results are reused."""
+    return TargetEnvironment(python, platform)
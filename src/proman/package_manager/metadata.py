@@ -0,0 +1,383 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Read package index metadata with bounded memory."""
+
+import codecs
+import json
+import re
+import sys
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+
+from .specifiers import VersionSet
+
+__all__: List[str] = [
+    'ProjectMetadata',
+    'ReleaseFile',
+    'read_fields',
+    'read_project',
+]
+
+CHUNK_SIZE = 64 * 1024
+INFO_FIELDS = (
+    'name',
+    'version',
+    'summary',
+    'requires_dist',
+    'requires_python',
+    'keywords',
+    'classifiers',
+)
+
+_significant = re.compile(r'[^ \t\n\r]')
+# content up to the next bracket outside of complete strings
+_flat = re.compile(r'(?:[^"\[\]{}]+|"[^"\\]*(?:\\.[^"\\]*)*")*', re.DOTALL)
+
+
+class ReleaseFile:
+    """Provide compact record of a release artifact."""
+
+    __slots__ = (
+        'filename',
+        'url',
+        'packagetype',
+        'sha256',
+        'requires_python',
+        'size',
+        'yanked',
+    )
+
+    def __init__(
+        self,
+        filename: str,
+        url: str,
+        packagetype: str,
+        sha256: Optional[str] = None,
+        requires_python: Optional[str] = None,
+        size: int = 0,
+        yanked: bool = False,
+    ) -> None:
+        """Initialize release file."""
+        self.filename = filename
+        self.url = url
+        self.packagetype = sys.intern(packagetype)
+        self.sha256 = sha256
+        self.requires_python = requires_python
+        self.size = size
+        self.yanked = yanked
+
+    def __repr__(self) -> str:
+        """Get representation of release file."""
+        return f"ReleaseFile({self.filename!r})"
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> 'ReleaseFile':
+        """Create release file from index file entry."""
+        return cls(
+            filename=data['filename'],
+            url=data['url'],
+            packagetype=data['packagetype'],
+            sha256=(data.get('digests') or {}).get('sha256'),
+            requires_python=data.get('requires_python'),
+            size=data.get('size') or 0,
+            yanked=data.get('yanked', False),
+        )
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get index file entry of the release file."""
+        return {
+            'filename': self.filename,
+            'url': self.url,
+            'packagetype': self.packagetype,
+            'digests': self.digests,
+            'requires_python': self.requires_python,
+            'size': self.size,
+            'yanked': self.yanked,
+        }
+
+    @property
+    def digests(self) -> Dict[str, str]:
+        """Get digests of the release file."""
+        return {'sha256': self.sha256} if self.sha256 else {}
+
+
+class ProjectMetadata:
+    """Provide compact record of a project from the package index."""
+
+    __slots__ = (
+        'name',
+        'version',
+        'summary',
+        'requires_dist',
+        'requires_python',
+        'keywords',
+        'classifiers',
+        'releases',
+        'last_serial',
+        '_version_set',
+    )
+
+    def __init__(
+        self,
+        name: str,
+        version: str,
+        summary: Optional[str] = None,
+        requires_dist: Tuple[str, ...] = (),
+        requires_python: Optional[str] = None,
+        keywords: Optional[str] = None,
+        classifiers: Tuple[str, ...] = (),
+        releases: Optional[Dict[str, Tuple[ReleaseFile, ...]]] = None,
+        last_serial: Optional[int] = None,
+    ) -> None:
+        """Initialize project metadata."""
+        self.name = name
+        self.version = version
+        self.summary = summary
+        self.requires_dist = requires_dist
+        self.requires_python = requires_python
+        self.keywords = keywords
+        self.classifiers = classifiers
+        self.releases = releases or {}
+        self.last_serial = last_serial
+        self._version_set: Optional[VersionSet] = None
+
+    def __repr__(self) -> str:
+        """Get representation of project metadata."""
+        return f"ProjectMetadata({self.name!r}, {self.version!r})"
+
+    @property
+    def versions(self) -> List[str]:
+        """Get versions with at least one artifact."""
+        return [k for k, v in self.releases.items() if v]
+
+    @property
+    def version_set(self) -> VersionSet:
+        """Get parsed candidate versions for filtering."""
+        if self._version_set is None:
+            self._version_set = VersionSet(self.versions)
+        return self._version_set
+
+    def get_release(
+        self,
+        version: Optional[str] = None,
+        package_type: str = 'bdist_wheel',
+    ) -> Optional[ReleaseFile]:
+        """Get first artifact of a release by package type."""
+        return next(
+            (
+                x
+                for x in self.releases.get(version or self.version, ())
+                if x.packagetype == package_type
+            ),
+            None,
+        )
+
+
+class _StreamDecoder:
+    """Decode top level members of a JSON document from chunks."""
+
+    def __init__(self, chunks: Iterable[bytes]) -> None:
+        """Initialize stream decoder."""
+        self.__chunks = iter(chunks)
+        self.__decoder = json.JSONDecoder()
+        self.__utf8 = codecs.getincrementaldecoder('utf-8')()
+        self.__exhausted = False
+        self.buffer = ''
+        self.pos = 0
+
+    def fill(self, size: int = 1) -> bool:
+        """Read at least size characters into the buffer."""
+        # drop consumed content so memory stays bounded by the open value
+        consumed, self.pos = self.pos, 0
+        self.buffer = self.buffer[consumed:]
+        target = len(self.buffer) + size
+        while not self.__exhausted and len(self.buffer) < target:
+            chunk = next(self.__chunks, None)
+            if chunk is None:
+                self.__exhausted = True
+                self.buffer += self.__utf8.decode(b'', final=True)
+            else:
+                self.buffer += self.__utf8.decode(chunk)
+        return len(self.buffer) >= target
+
+    def peek(self) -> str:
+        """Get next significant character."""
+        while True:
+            match = _significant.search(self.buffer, self.pos)
+            if match:
+                self.pos = match.start()
+                return self.buffer[self.pos]
+            self.pos = len(self.buffer)
+            if not self.fill():
+                raise ValueError('unexpected end of metadata document')
+
+    def expect(self, char: str) -> None:
+        """Consume expected character."""
+        if self.peek() != char:
+            raise ValueError(f"expected {char!r} at position {self.pos}")
+        self.pos += 1
+
+    def more(self) -> None:
+        """Grow the buffer failing when the document ended early."""
+        remaining = len(self.buffer) - self.pos
+        # grow geometrically so large values are not rescanned often
+        self.fill(max(CHUNK_SIZE, remaining))
+        if len(self.buffer) - self.pos <= remaining:
+            raise ValueError('unexpected end of metadata document')
+
+    def skip(self) -> None:
+        """Consume next value scanning over it without building objects."""
+        if self.peek() not in '{[':
+            # scalars are small enough to be decoded
+            self.value()
+            return
+        depth = 0
+        buffer, pos = self.buffer, self.pos
+        while True:
+            pos = _flat.match(buffer, pos).end()  # type: ignore
+            # strings may also be cut short by the chunk boundary
+            if pos == len(buffer) or buffer[pos] == '"':
+                self.pos = pos
+                self.more()
+                buffer, pos = self.buffer, self.pos
+                continue
+            depth += 1 if buffer[pos] in '{[' else -1
+            pos += 1
+            if depth == 0:
+                self.pos = pos
+                return
+
+    def value(self) -> Any:
+        """Decode next complete value."""
+        self.peek()
+        while True:
+            try:
+                obj, end = self.__decoder.raw_decode(self.buffer, self.pos)
+                # scalars may be cut short by the chunk boundary
+                if end < len(self.buffer) or self.__exhausted:
+                    self.pos = end
+                    return obj
+            except json.JSONDecodeError:
+                if self.__exhausted:
+                    raise
+            # grow geometrically so large values are not reparsed often
+            self.fill(max(CHUNK_SIZE, len(self.buffer) - self.pos))
+
+    def members(self) -> Iterator[str]:
+        """Iterate keys of an object leaving the value unread."""
+        self.expect('{')
+        if self.peek() == '}':
+            self.pos += 1
+            return
+        while True:
+            key = self.value()
+            self.expect(':')
+            yield key
+            char = self.peek()
+            self.pos += 1
+            if char == '}':
+                return
+            if char != ',':
+                raise ValueError(f"expected ',' at position {self.pos}")
+
+
+def read_project(
+    chunks: Iterable[bytes],
+    file_filter: Optional[Callable[[Dict[str, Any]], bool]] = None,
+) -> ProjectMetadata:
+    """Read project metadata keeping only fields used for resolution.
+
+    Parameters
+    ----------
+    chunks: Iterable[bytes]
+        raw chunks of a JSON API project document
+    file_filter: Callable, optional
+        predicate selecting release files to be kept
+
+    """
+    stream = _StreamDecoder(chunks)
+    info: Dict[str, Any] = {}
+    releases: Dict[str, Tuple[ReleaseFile, ...]] = {}
+    urls: Tuple[ReleaseFile, ...] = ()
+    last_serial = None
+    for key in stream.members():
+        if key == 'urls':
+            urls = tuple(
+                ReleaseFile.from_dict(x)
+                for x in stream.value()
+                if file_filter is None or file_filter(x)
+            )
+        elif key == 'releases':
+            for version in stream.members():
+                releases[version] = tuple(
+                    ReleaseFile.from_dict(x)
+                    for x in stream.value()
+                    if file_filter is None or file_filter(x)
+                )
+        elif key == 'info':
+            info = {
+                k: v for k, v in stream.value().items() if k in INFO_FIELDS
+            }
+        elif key == 'last_serial':
+            last_serial = stream.value()
+        else:
+            stream.skip()
+    # version documents only list the files of that release
+    if info.get('version') and info['version'] not in releases:
+        releases[info['version']] = urls
+    return ProjectMetadata(
+        name=info.get('name', ''),
+        version=info.get('version', ''),
+        summary=info.get('summary'),
+        requires_dist=tuple(info.get('requires_dist') or ()),
+        requires_python=info.get('requires_python'),
+        keywords=info.get('keywords'),
+        classifiers=tuple(info.get('classifiers') or ()),
+        releases=releases,
+        last_serial=last_serial,
+    )
+
+
+def _project_field(value: Any, path: List[str]) -> Any:
+    """Get value at dotted path mapping over lists."""
+    for part in path:
+        if isinstance(value, dict):
+            value = value.get(part)
+        elif isinstance(value, list):
+            value = [x.get(part) for x in value if isinstance(x, dict)]
+        else:
+            return None
+    return value
+
+
+def read_fields(
+    chunks: Iterable[bytes], fields: Iterable[str]
+) -> Dict[str, Any]:
+    """Read selected dotted fields of a JSON API project document.
+
+    Parameters
+    ----------
+    chunks: Iterable[bytes]
+        raw chunks of a JSON API project document
+    fields: Iterable[str]
+        dotted paths such as info.version or urls.filename
+
+    """
+    paths = {x: x.split('.') for x in fields}
+    wanted = {x[0] for x in paths.values()}
+    stream = _StreamDecoder(chunks)
+    members = {}
+    for key in stream.members():
+        if key in wanted:
+            members[key] = stream.value()
+        else:
+            stream.skip()
+    return {k: _project_field(members, v) for k, v in paths.items()}
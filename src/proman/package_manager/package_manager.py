@@ -6,38 +6,92 @@
 import json
 import logging
 import os
+import re
 import shutil
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import time
+from concurrent.futures import as_completed
+from contextlib import contextmanager
+from functools import wraps
 from tempfile import TemporaryDirectory
-from typing import Any, Dict, List, Optional, Union, TYPE_CHECKING
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypeVar,
+    Union,
+    cast,
+)
 from urllib.parse import urljoin
 
-import urllib3
 from distlib import DistlibException
-from distlib.database import Distribution
-from distlib.index import PackageIndex
+from distlib.database import Distribution, InstalledDistribution
 from distlib.locators import Locator  # , locate
 from distlib.scripts import ScriptMaker
 from distlib.wheel import Wheel
-from packaging.specifiers import SpecifierSet
+from packaging.utils import canonicalize_name
+from proman.common.dependencies import DependencyBase
 from proman.common.packaging_bases import PackageManagerBase
 
-from . import config
-from .dependencies import Dependency
+from . import bundle, config, stamp
+from .budget import DOWNLOAD_FILES, INSTALL_FILES, Budgets, parse_size
+from .check import check_environment
+from .dependencies import Candidate, Dependency
+from .exception import PackageManagerException, PackageManagerResolution
+from .installed import InstalledIndex, InstalledRecord
+from .metadata import ProjectMetadata, ReleaseFile, read_fields, read_project
+from .prefetch import Prefetcher, evict
+from .resolution import ResolutionCache, fingerprint
+from .resolver import IndexProvider, Resolver
+from .scheduler import Scheduler
+from .search import SEARCH_FIELDS, SearchIndex, normalize
+from .session import session
+from .specifiers import parse_requirement, parse_version
+from .store import PackageStore
+from .sync import SyncPlan, SyncTransaction, plan_sync, record_paths
+from .zipped import get_unsafe_reason, install_zipped
 
 if TYPE_CHECKING:
     from distlib.database import (
         DistributionPath,
         EggInfoDistribution,
-        InstalledDistribution,
     )
     from proman.common.manifest import Manifest
 
 log = logging.getLogger(__name__)
-http = urllib3.PoolManager(maxsize=16)
+_metadata_cache: Dict[
+    Tuple[str, Optional[str]], Tuple[float, ProjectMetadata]
+] = {}
 
 __all__: List[str] = ['PackageManager']
 
+INFO_FIELDS = ['info.name', 'info.version', 'info.summary', 'urls.filename']
+
+F = TypeVar('F', bound=Callable[..., Any])
+
+
+def _no_files(entry: Dict[str, Any]) -> bool:
+    """Skip release files of documents read for their info."""
+    return False
+
+
+def _scoped(method: F) -> F:
+    """Send requests of a command with the settings of its manager."""
+
+    @wraps(method)
+    def wrapper(self: 'PackageManager', *args: Any, **options: Any) -> Any:
+        deadline = options.pop('deadline', None) or self.deadline
+        with session.using(self.session_settings), session.within(deadline):
+            return method(self, *args, **options)
+
+    return cast(F, wrapper)
+
 
 class PackageManager(PackageManagerBase):
     """Perform package managment tasks for a project."""
@@ -53,6 +107,48 @@ class PackageManager(PackageManagerBase):
         self.__manifest = manifest
         self.__locator = locator
         self.distribution_path = distribution_path
+        self.lock_path = options.get('lock_path', config.lock_path)
+        self.installed = InstalledIndex(distribution_path.dist_dir)
+        self.__search_index: Optional[SearchIndex] = None
+        # workspace members share limits and downloads
+        self.scheduler = options.get('scheduler') or Scheduler.from_config(
+            options.get('concurrency')
+        )
+        self.resolutions = ResolutionCache(
+            os.path.join(config.CACHE_DIR, 'resolutions'),
+            config.RESOLUTION_TTL,
+        )
+        self.store = (
+            PackageStore(os.path.join(config.CACHE_DIR, 'store'))
+            if options.get('store', True)
+            else None
+        )
+        self.budgets = Budgets.from_config(options.get('budgets'))
+        self.__owns_prefetcher = 'prefetcher' not in options
+        # a bounded temp disk keeps artifacts out of the persistent cache
+        self.prefetcher = options.get('prefetcher') or (
+            Prefetcher(
+                os.path.join(config.CACHE_DIR, 'artifacts'),
+                self.download,
+                self.scheduler,
+            )
+            if options.get('prefetch', True)
+            and self.budgets.temp_disk.capacity is None
+            else None
+        )
+        network = options.get('network') or {}
+        self.deadline: Optional[float] = network.get('deadline')
+        # requests of this manager are sent with its own limits
+        self.session_settings: Dict[str, Any] = {
+            **network,
+            # let every network slot hold its own pooled connection
+            'maxsize': self.scheduler.network.maximum,
+        }
+        if self.budgets.memory.capacity is not None:
+            self.session_settings['memory'] = self.budgets.memory
+
+        # pure Python wheels are installed intact when zip safe
+        self.zipped = options.get('zipped', False)
 
         self.pypackages_enabled = options.get('pypackages_enabled', True)
         if self.pypackages_enabled:
@@ -66,20 +162,66 @@ class PackageManager(PackageManagerBase):
             log_handler = options.pop('log_handler')
             log.addHandler(logging.StreamHandler(log_handler))
 
+    def refresh(self) -> None:
+        """Drop cached installed state changed outside this process."""
+        if self.installed.invalidate():
+            self.distribution_path.clear_cache()
+
     # Repository
     @staticmethod
     def _lookup_package(name: str) -> Dict[str, Any]:
         """Get package metadata."""
         # TODO: refactor to distlib
         url_path = urljoin(config.INDEX_URL, f"pypi/{name}/json")
-        rsp = http.request('GET', url_path)
+        rsp = session.request('GET', url_path)
         if rsp.status == 200:
-            data = json.loads(rsp.data.decode('utf-8'))
+            data = json.loads(rsp.data)
             return data
         else:
             log.error(f"{name} package not found")
             return {}
 
+    @staticmethod
+    def _lookup_metadata(
+        name: str,
+        version: Optional[str] = None,
+        file_filter: Optional[Callable[[Dict[str, Any]], bool]] = None,
+    ) -> Optional[ProjectMetadata]:
+        """Get reduced package metadata used for resolution."""
+        key = (canonicalize_name(name), version)
+        # filtered metadata is incomplete so only full documents are reused
+        if file_filter is None and key in _metadata_cache:
+            loaded, metadata = _metadata_cache[key]
+            if time.monotonic() - loaded < config.METADATA_TTL:
+                return metadata
+        path = (
+            f"pypi/{name}/{version}/json" if version else f"pypi/{name}/json"
+        )
+        url_path = urljoin(config.INDEX_URL, path)
+        rsp = session.parse(url_path, read_project, file_filter)
+        if rsp.status == 200:
+            metadata = rsp.parsed
+            if file_filter is None:
+                _metadata_cache[key] = (time.monotonic(), metadata)
+            return metadata
+        log.error(f"{name} package not found")
+        return None
+
+    @staticmethod
+    def _lookup_latest(
+        name: str, etag: Optional[str] = None
+    ) -> Tuple[Optional[str], Optional[str]]:
+        """Get latest version unless unchanged since etag."""
+        url_path = urljoin(config.INDEX_URL, f"pypi/{name}/json")
+        headers = {'If-None-Match': etag} if etag else {}
+        rsp = session.parse(url_path, read_project, _no_files, headers=headers)
+        if rsp.status == 304:
+            return None, etag
+        if rsp.status == 200:
+            return rsp.parsed.version, rsp.headers.get('ETag')
+        log.error(f"{name} package not found")
+        return None, None
+
     @staticmethod
     def info(
         name: str,
@@ -93,71 +235,277 @@ class PackageManager(PackageManagerBase):
         else:
             return rst
 
+    @staticmethod
+    def _lookup_fields(
+        name: str, fields: List[str]
+    ) -> Optional[Dict[str, Any]]:
+        """Get selected fields of package metadata."""
+        url_path = urljoin(config.INDEX_URL, f"pypi/{name}/json")
+        rsp = session.parse(url_path, read_fields, tuple(fields))
+        if rsp.status == 200:
+            return rsp.parsed
+        log.error(f"{name} package not found")
+        return None
+
+    def get_infos(
+        self, *names: str, fields: Optional[List[str]] = None, **options: Any
+    ) -> Dict[str, Optional[Dict[str, Any]]]:
+        """Get selected information of many packages concurrently."""
+        selected = fields or INFO_FIELDS
+
+        def lookup(name: str) -> Optional[Dict[str, Any]]:
+            with self.scheduler.network.slot():
+                return self._lookup_fields(name, selected)
+
+        with self.scheduler.executor() as executor:
+            return dict(zip(names, executor.map(lookup, names)))
+
     @staticmethod
     def get_release(
         package: 'Distribution',
         package_type: str = 'bdist_wheel',
-    ) -> Optional[Dict[str, Any]]:
+    ) -> Optional[ReleaseFile]:
         """Get release from index."""
         # TODO: refactor to distlib
-        pkg_data = PackageManager._lookup_package(package.name)
-        # from pprint import pprint
-        # pprint(pkg_data)
-        if pkg_data != {}:
-            release = next(
-                (
-                    r
-                    for r in pkg_data['releases'][package.version]
-                    if r['packagetype'] == package_type
-                ),
-                None,
-            )
-            return release
+        metadata = PackageManager._lookup_metadata(package.name)
+        if metadata:
+            return metadata.get_release(package.version, package_type)
         else:
             return None
 
     @staticmethod
     def download(
-        package: Union['Distribution', Dict[str, Any]],
+        package: Union['Distribution', ReleaseFile, Dict[str, Any]],
         dest: str = '.',
         digests: List[str] = [],
     ) -> Optional[str]:
         """Execute package download."""
+        release: Optional[ReleaseFile]
         if isinstance(package, Distribution):
             release = PackageManager.get_release(package)
+        elif isinstance(package, dict):
+            release = ReleaseFile.from_dict(package)
         else:
             release = package
 
         # TODO create locator
         if release:
-            filepath = os.path.join(dest, release['filename'])
-            index = PackageIndex(url=urljoin(config.INDEX_URL, 'pypi'))
-            index.download_file(
-                release['url'], filepath, digest=None, reporthook=None
-            )
+            filepath = os.path.join(dest, release.filename)
+            session.download(release.url, filepath)
             return filepath
         else:
             return None
 
     @staticmethod
-    def search(query: Any, **options: Any) -> Dict[str, Any]:
-        """Search PyPI for packages."""
-        operation = options.get('operation', None)
-        url = options.get('url', urljoin(config.INDEX_URL, 'pypi'))
-        index = PackageIndex(url=url)
-        return index.search(
-            {k: v for k, v in query.items() if v is not None}, operation
+    def _lookup_projects(
+        etag: Optional[str] = None,
+    ) -> Tuple[Optional[List[Tuple[str, int]]], Optional[str], Optional[int]]:
+        """Get project listing from the simple API unless unchanged."""
+        url_path = urljoin(config.INDEX_URL, 'simple/')
+        headers = {'Accept': 'application/vnd.pypi.simple.v1+json'}
+        if etag:
+            headers['If-None-Match'] = etag
+        rsp = session.request('GET', url_path, headers)
+        if rsp.status == 304:
+            return None, etag, None
+        if rsp.status != 200:
+            log.error(f"project listing unavailable {rsp.status}")
+            return None, None, None
+
+        if 'json' in rsp.headers.get('Content-Type', ''):
+            data = json.loads(rsp.data)
+            projects = [
+                (x['name'], x.get('_last-serial', 0)) for x in data['projects']
+            ]
+            last_serial = data.get('meta', {}).get('_last-serial')
+        else:
+            # PEP 503 listing does not provide serials
+            projects = [
+                (x, 0)
+                for x in re.findall(r'<a[^>]*>([^<]+)</a>', rsp.data.decode())
+            ]
+            last_serial = rsp.headers.get('X-PyPI-Last-Serial')
+        return projects, rsp.headers.get('ETag'), last_serial
+
+    def get_search_index(self, refresh: bool = False) -> SearchIndex:
+        """Get local search index synced from the package index."""
+        if self.__search_index is None:
+            self.__search_index = SearchIndex(
+                os.path.join(config.CACHE_DIR, 'search')
+            )
+            if not self.__search_index.load():
+                refresh = True
+
+        index = self.__search_index
+        if refresh:
+            projects, etag, last_serial = self._lookup_projects(index.etag)
+            if projects is not None:
+                changed = index.update(projects, etag, last_serial)
+                log.info(f"search index updated {changed} projects")
+                index.save()
+        return index
+
+    def _fill_search_details(
+        self, index: SearchIndex, names: List[str]
+    ) -> None:
+        """Cache searchable fields of projects from the package index."""
+
+        def lookup(name: str) -> Optional[ProjectMetadata]:
+            with self.scheduler.network.slot():
+                return self._lookup_metadata(name, file_filter=lambda y: False)
+
+        with self.scheduler.executor() as executor:
+            for metadata in executor.map(lookup, names):
+                if metadata:
+                    index.set_details(
+                        metadata.name,
+                        version=metadata.version,
+                        summary=metadata.summary,
+                        keywords=metadata.keywords,
+                        classifiers=list(metadata.classifiers),
+                    )
+        index.save()
+
+    @_scoped
+    def search(self, query: Any, **options: Any) -> List[Dict[str, Any]]:
+        """Search local index of packages."""
+        index = self.get_search_index(options.get('refresh', False))
+        limit = options.get('limit', 20)
+        operation = any if options.get('operation') == 'or' else all
+        fields = {k: query.get(k) for k in SEARCH_FIELDS if query.get(k)}
+        names = index.query(query.get('name') or '', limit * 5)
+
+        # field filters need details beyond the displayed results
+        size = len(names) if fields else limit
+        missing = [
+            x for x in names[:size] if normalize(x) not in index.details
+        ]
+        if missing:
+            self._fill_search_details(index, missing)
+
+        results = []
+        for name in names:
+            if fields and not operation(
+                index.matches(name, **{k: v}) for k, v in fields.items()
+            ):
+                continue
+            details = index.details.get(normalize(name), {})
+            results.append(
+                {
+                    'name': name,
+                    'version': details.get('version', ''),
+                    'summary': details.get('summary', ''),
+                }
+            )
+            if len(results) >= limit:
+                break
+        return results
+
+    @staticmethod
+    def get_candidate(requirement: str, **options: Any) -> Optional[Candidate]:
+        """Get candidate best matching a requirement."""
+        req = parse_requirement(requirement)
+        metadata = PackageManager._lookup_metadata(req.name)
+        if metadata is None:
+            return None
+
+        version = metadata.version_set.best_match(
+            str(req.specifier), options.get('prerelease', False)
+        )
+        if version is None:
+            log.error(f"no release of {req.name} matches {req.specifier}")
+            return None
+
+        # requirements are only published for the latest release
+        requires = metadata.requires_dist
+        if version != metadata.version:
+            release = PackageManager._lookup_metadata(req.name, version)
+            requires = release.requires_dist if release else ()
+        return Candidate.from_metadata(
+            metadata, version, requires=requires, **options
         )
 
     @staticmethod
-    def get_dependencies(package: 'Distribution') -> List['Distribution']:
-        """Get package dependencies."""
+    def _lookup_serial(name: str) -> Optional[int]:
+        """Get last serial of a project from the package index."""
+        url_path = urljoin(config.INDEX_URL, f"simple/{name}/")
+        rsp = session.request('HEAD', url_path)
+        serial = rsp.headers.get('X-PyPI-Last-Serial')
+        if rsp.status == 200 and serial:
+            return int(serial)
+        # mirrors without the header still publish it in the JSON API
+        fields = PackageManager._lookup_fields(name, ['last_serial'])
+        return fields.get('last_serial') if fields else None
+
+    def _check_serials(self, serials: Dict[str, int]) -> bool:
+        """Check projects are unchanged since they were resolved."""
+
+        def check(name: str) -> bool:
+            with self.scheduler.network.slot():
+                return self._lookup_serial(name) == serials[name]
+
+        with self.scheduler.executor() as executor:
+            return all(executor.map(check, serials))
+
+    @_scoped
+    def resolve(self, *requirements: str, **options: Any) -> List[Candidate]:
+        """Resolve candidates reusing results for identical inputs."""
+        transitive = options.pop('transitive', True)
+        key = fingerprint(
+            requirements, config.INDEX_URL, transitive=transitive, **options
+        )
+        if not options.pop('refresh', False):
+            cached = self.resolutions.get(key, self._check_serials)
+            if cached is not None:
+                log.info(f"reusing cached resolution {key[:12]}")
+                return cached
+
+        candidates: List[Candidate] = []
+        if transitive:
+            provider = IndexProvider(
+                self._lookup_metadata,
+                python=options.get('python'),
+                prefetcher=self.prefetcher,
+            )
+            resolver = Resolver(provider, **options)
+            for name, version in resolver.resolve(requirements).items():
+                candidate = provider.get_candidate(name, version, **options)
+                if candidate is not None:
+                    candidates.append(candidate)
+            log.info(
+                f"resolved {len(candidates)} packages "
+                f"after {resolver.decisions} decisions"
+            )
+        else:
+            for requirement in requirements:
+                candidate = self.get_candidate(requirement, **options)
+                if candidate is not None:
+                    candidates.append(candidate)
+                    # exact pins cannot change so fetch while looking up rest
+                    if self.prefetcher and str(
+                        parse_requirement(requirement).specifier
+                    ).startswith('=='):
+                        release = candidate.get_release()
+                        if release:
+                            self.prefetcher.submit(release)
+        self.resolutions.put(key, candidates)
+        return candidates
+
+    def _get_installed_dependencies(
+        self, package: 'Distribution', seen: Optional[Set[str]] = None
+    ) -> List[Dependency]:
+        """Get dependencies of an installed package without network."""
+        seen = seen or {canonicalize_name(package.name)}
         dependencies = []
         for sequence in package.run_requires:
-            dependency = Dependency(sequence)
-            dependencies.append(dependency)
-            sub_dependencies = PackageManager.get_dependencies(dependency)
-            dependencies = dependencies + sub_dependencies
+            requirement = parse_requirement(sequence)
+            key = canonicalize_name(requirement.name)
+            installed = self.distribution_path.get_distribution(key)
+            if key in seen or installed is None:
+                continue
+            seen.add(key)
+            dependencies.append(Dependency(installed))
+            dependencies += self._get_installed_dependencies(installed, seen)
         return dependencies
 
     def get_digests(self, sequence: str) -> Dict[str, Any]:
@@ -170,6 +518,24 @@ class PackageManager(PackageManagerBase):
         if self.__manifest:
             self.__manifest.source_tree.save()
             self.__manifest.lockfile.save()
+            self._write_stamp()
+
+    def _clear_stamp(self) -> None:
+        """Invalidate stamp before the environment is changed."""
+        stamp.clear_stamp(self.distribution_path.dist_dir)
+
+    def _write_stamp(self) -> None:
+        """Stamp environment when installed distributions match the lock."""
+        dist_dir = self.distribution_path.dist_dir
+        if not self.__manifest or not os.path.isdir(dist_dir):
+            return
+        lockfile = self.__manifest.lockfile
+        locks = lockfile.get_locks(False)
+        records = self.installed.records
+        if not plan_sync(records, locks + lockfile.get_locks(True)):
+            stamp.write_stamp(dist_dir, self.lock_path, dev=True)
+        elif not plan_sync(records, locks):
+            stamp.write_stamp(dist_dir, self.lock_path, dev=False)
 
     # def get_install(
     #     self,
@@ -196,6 +562,17 @@ class PackageManager(PackageManagerBase):
         wheel = Wheel(filepath)
         try:
             wheel.verify()
+            if options.get('zipped') or self.zipped:
+                reason = get_unsafe_reason(wheel)
+                if reason is None:
+                    installed = install_zipped(
+                        wheel,
+                        self.distribution_path.paths,
+                        ScriptMaker(None, None),
+                    )
+                    self.distribution_path.create_dist_pth()
+                    return installed
+                log.info(f"unpacking {wheel.filename}: {reason}")
             return wheel.install(
                 paths=self.distribution_path.paths,
                 maker=ScriptMaker(None, None),
@@ -213,39 +590,140 @@ class PackageManager(PackageManagerBase):
         log.warning('sdist is here')
         return None
 
+    def _fetch(self, release: ReleaseFile, dest: str) -> Optional[str]:
+        """Get artifact from the prefetch cache or download it."""
+        # downloads complete atomically so an existing file is whole
+        existing = os.path.join(dest, release.filename)
+        if os.path.isfile(existing):
+            return existing
+        if self.prefetcher and release.sha256:
+            self.prefetcher.submit(release)
+            filepath = self.prefetcher.get(release)
+            if filepath:
+                return filepath
+        with self.scheduler.network.slot():
+            return self.download(release, dest)
+
+    @contextmanager
+    def _artifact(
+        self, release: ReleaseFile, dest: str, reserved: bool = False
+    ) -> Iterator[Optional[str]]:
+        """Hold artifact within budgets deleting it once installed."""
+        # callers downloading ahead already hold the temp disk it takes
+        size = 0 if reserved else release.size or config.CHUNK_SIZE
+        with self.budgets.temp_disk.reserve(size):
+            with self.budgets.open_files.reserve(DOWNLOAD_FILES):
+                filepath = self._fetch(release, dest)
+            try:
+                yield filepath
+            finally:
+                # artifacts in the shared cache outlive the install
+                if filepath and os.path.dirname(filepath) == dest:
+                    os.remove(filepath)
+
+    def _use_store(self, release: ReleaseFile, **options: Any) -> bool:
+        """Check artifact is installed by linking from the package store."""
+        # zipped wheels are cheaper to place than stored trees to link
+        return bool(
+            self.store
+            and release.packagetype == 'bdist_wheel'
+            and release.sha256
+            and not (options.get('zipped') or self.zipped)
+        )
+
+    def _is_stored(self, package: Candidate, **options: Any) -> bool:
+        """Check candidate is linked from the store without a download."""
+        release = package.get_release() or package.get_release('sdist')
+        if (
+            release is None
+            or release.sha256 is None
+            or self.store is None
+            or not self._use_store(release, **options)
+        ):
+            return False
+        key = self.store.get_key(
+            package.name, package.version, release.filename, release.sha256
+        )
+        python = os.path.basename(
+            os.path.normpath(self.distribution_path.dist_dir)
+        )
+        return self.store.get_entry(key, python) is not None
+
+    def __install_stored(
+        self,
+        package: Union[Candidate, 'Distribution'],
+        release: ReleaseFile,
+        **options: Any,
+    ) -> Optional['Dependency']:
+        """Link wheel from the package store unpacking it only once."""
+        assert self.store and release.sha256
+        dist_dir = self.distribution_path.dist_dir
+        python = os.path.basename(os.path.normpath(dist_dir))
+        key = self.store.get_key(
+            package.name, package.version, release.filename, release.sha256
+        )
+        if self.store.get_entry(key, python) is None:
+            with self._artifact(
+                release, options['temp_dir'], bool(options.get('reserved'))
+            ) as filepath:
+                if not filepath:
+                    log.error('package could not be downloaded')
+                    return None
+                with self.budgets.open_files.reserve(INSTALL_FILES):
+                    with self.scheduler.disk.slot():
+                        self.store.add(filepath, key, python, release.sha256)
+        with self.scheduler.disk.slot():
+            path = self.store.link(key, dist_dir)
+        return Dependency(InstalledDistribution(path))
+
     def _install_package(
-        self, package: 'Distribution', **options: str
+        self, package: Union[Candidate, 'Distribution'], **options: str
     ) -> Optional['Dependency']:
         """Perform package installation."""
-        release = self.get_release(package) or self.get_release(
-            package, package_type='sdist'
-        )
+        if isinstance(package, Candidate):
+            release = package.get_release() or package.get_release('sdist')
+        else:
+            with self.scheduler.network.slot():
+                release = self.get_release(package) or self.get_release(
+                    package, package_type='sdist'
+                )
+        if release and self._use_store(release, **options):
+            return self.__install_stored(package, release, **options)
         if release:
-            # TODO: download all packages before install
-            # print('---', release)
-            digests = list(options.get('digests', []))
-            filepath = self.download(
-                release, options['temp_dir'], digests=digests
-            )
-            if filepath:
-                if release['packagetype'] == 'bdist_wheel':
-                    installed = Dependency(
-                        self.__install_wheel(filepath, **options)
-                    )
-                elif release['packagetype'] == 'sdist':
-                    installed = Dependency(
-                        self.__install_sdist(filepath, **options)
-                    )
+            with self._artifact(
+                release, options['temp_dir'], bool(options.get('reserved'))
+            ) as filepath:
+                if filepath:
+                    installed: Optional[Dependency] = None
+                    with self.budgets.open_files.reserve(INSTALL_FILES):
+                        if release.packagetype == 'bdist_wheel':
+                            with self.scheduler.disk.slot():
+                                installed = Dependency(
+                                    self.__install_wheel(filepath, **options)
+                                )
+                        elif release.packagetype == 'sdist':
+                            with self.scheduler.disk.slot():
+                                installed = Dependency(
+                                    self.__install_sdist(filepath, **options)
+                                )
+                        else:
+                            log.error('no supported distribution found')
+                    return installed
                 else:
-                    log.error('no supported distribution found')
-                return installed
-            else:
-                log.error('package could not be downloaded')
-                return None
+                    log.error('package could not be downloaded')
+                    return None
         else:
             log.error('package not found')
             return None
 
+    @staticmethod
+    def _artifact_size(package: Union[Candidate, 'Distribution']) -> int:
+        """Get size of the artifact a candidate would download."""
+        if isinstance(package, Candidate):
+            release = package.get_release() or package.get_release('sdist')
+            return release.size if release else 0
+        return 0
+
     def _perform_install(
         self, package: 'Distribution', **options: Any
     ) -> Optional['Dependency']:
@@ -272,58 +750,156 @@ class PackageManager(PackageManagerBase):
                 options['digests'] = lock['digests']
 
             installed = self._install_package(package, **options)
-            print('---', type(installed))
+            if installed:
+                self.installed.add(installed)
             if installed and not locked:
-                if installed.digests == {}:
-                    # TODO: need to add missing digests
-                    # installed.digests = self.get_digests(package.name)
-                    pass
                 if self.__manifest:
-                    self.__manifest.lockfile.add_lock(installed)
+                    # candidates carry the digests published by the index
+                    self.__manifest.lockfile.add_lock(
+                        cast(DependencyBase, package)
+                        if isinstance(package, Candidate)
+                        else installed
+                    )
         else:
             if self.__manifest and not locked:
                 self.__manifest.lockfile.add_lock(installed)
         return installed
 
+    def _get_locks(self, production: bool = False) -> List[Dict[str, Any]]:
+        """Get release locks and development locks unless for production."""
+        if not self.__manifest:
+            return []
+        locks = list(self.__manifest.lockfile.get_locks(False))
+        if not production:
+            locks += self.__manifest.lockfile.get_locks(True)
+        return locks
+
+    def _get_all_locks(self) -> List[Dict[str, Any]]:
+        """Get release and development locks."""
+        if self.__manifest:
+            return self.__manifest.lockfile.get_locks(
+                False
+            ) + self.__manifest.lockfile.get_locks(True)
+        return []
+
+    def bundle(self, dest: str, **options: Any) -> str:
+        """Create portable bundle of the locked environment."""
+        wheel_dir = options.get('wheel_dir')
+        wheels = (
+            [
+                os.path.join(wheel_dir, x)
+                for x in os.listdir(wheel_dir)
+                if x.endswith('.whl')
+            ]
+            if wheel_dir
+            else []
+        )
+        return bundle.create_bundle(
+            self.distribution_path.dist_dir,
+            dest,
+            self._get_all_locks(),
+            wheels=wheels,
+        )
+
+    def _install_bundle(self, filepath: str, **options: Any) -> None:
+        """Restore environment from bundle without network access."""
+        with TemporaryDirectory() as temp_dir:
+            wheels = bundle.restore_bundle(
+                filepath,
+                self.distribution_path.dist_dir,
+                locks=self._get_all_locks() if self.__manifest else None,
+                wheel_dir=temp_dir,
+                max_workers=options.get('max_workers'),
+            )
+            # the tree may hold zipped wheels listed by the path file
+            self.distribution_path.create_dist_pth()
+            self.distribution_path.clear_cache()
+            self.installed.rebuild()
+            for wheel in wheels:
+                installed = self.__install_wheel(wheel, **options)
+                if installed:
+                    self.installed.add(installed)
+        self.installed.save()
+        self._write_stamp()
+
+    def _add_roots(
+        self, packages: Iterable[str], dependencies: Iterable[Candidate]
+    ) -> None:
+        """Add requested packages to the project dependencies."""
+        roots = {
+            canonicalize_name(parse_requirement(x).name) for x in packages
+        }
+        for dependency in dependencies:
+            key = canonicalize_name(dependency.name)
+            if self.__manifest and key in roots:
+                self.__manifest.source_tree.add_dependency(dependency)
+
+    def _get_lock_requirements(self, dev: bool = False) -> List[str]:
+        """Get requirements pinning every locked release."""
+        if self.__manifest:
+            return [
+                f"{x['name']}=={x['version']}"
+                for x in self.__manifest.lockfile.get_locks(dev)
+            ]
+        return []
+
+    @_scoped
     def install(self, *packages: Any, **options: Any) -> None:
-        """Install package and dependencies."""
+        """Install package and dependencies.
+
+        Raises
+        ------
+        PackageManagerResolution
+            requirements that cannot be satisfied together
+
+        """
         dev = options.get('dev', False)
 
         # create distribution paths
         self.distribution_path.create_pypackages()
+        # load installed state before it is modified
+        self.installed.load()
+        self._clear_stamp()
 
-        dependencies = []
-        if packages:
-            for package in packages:
-                # TODO: json/rpc does not include run_requires
-                # package = self.__locator.locate(sequence)
-                dependency = Dependency(package, **options)
-                log.debug(
-                    'package specifier:',
-                    SpecifierSet(f">={dependency.version}"),
-                )
-                if self.__manifest:
-                    self.__manifest.source_tree.add_dependency(dependency)
-                dependencies += [dependency] + self.get_dependencies(
-                    dependency
+        if options.get('from_bundle'):
+            self._install_bundle(options['from_bundle'], **options)
+            return
+
+        dependencies: List[Candidate] = []
+        try:
+            if packages:
+                dependencies = self.resolve(*packages, **options)
+                self._add_roots(packages, dependencies)
+                log.debug('installing dependencies: %s', dependencies)
+            elif self.__manifest:
+                # locks already include every transitive dependency
+                dependencies = self.resolve(
+                    *self._get_lock_requirements(dev),
+                    dev=dev,
+                    refresh=options.get('refresh', False),
+                    transitive=False,
                 )
-                log.debug('installing dependencies:', dependencies)
-        elif self.__manifest:
-            for lock in self.__manifest.lockfile.get_locks(dev):
-                # TODO: need better load from lockfile
-                dependencies.append(Dependency(lock['name']))
-        else:
-            log.error('no depdencies found')
+            else:
+                log.error('no depdencies found')
+        except PackageManagerResolution:
+            # downloads of the abandoned resolution are not waited on
+            if self.prefetcher and self.__owns_prefetcher:
+                self.prefetcher.close()
+            raise
 
         if dependencies != []:
             with TemporaryDirectory() as temp_dir:
                 options['temp_dir'] = temp_dir
-                with ThreadPoolExecutor(max_workers=8) as executor:
+                with self.scheduler.executor() as executor:
+                    # large artifacts start first so small ones fill the
+                    # remaining budget around them
                     jobs = [
                         executor.submit(
                             self._perform_install, dependency, **options
                         )
-                        for dependency in dependencies
+                        for dependency in sorted(
+                            dependencies, key=self._artifact_size, reverse=True
+                        )
                     ]
                     for future in as_completed(jobs):
                         result = future.result()
@@ -336,7 +912,182 @@ class PackageManager(PackageManagerBase):
                                 x for x in dependencies if x.key == result.key
                             ][0]
                             print('installed', installed)
-            self.save()
+            self.installed.save()
+            if options.get('save', True):
+                self.save()
+        if self.prefetcher and self.__owns_prefetcher:
+            # unclaimed speculative downloads remain in the artifact cache
+            self.prefetcher.close()
+
+    @_scoped
+    def sync(self, **options: Any) -> SyncPlan:
+        """Reconcile pypackages with the lock applying only the difference.
+
+        Parameters
+        ----------
+        production: bool
+            exclude development locks
+        dry_run: bool
+            compute the plan without changing the environment
+
+        """
+        if not self.__manifest:
+            raise PackageManagerException('sync requires a lockfile')
+        locks = self._get_locks(options.get('production', False))
+        self.distribution_path.create_pypackages()
+        self.installed.load()
+        plan = plan_sync(self.installed.records, locks)
+        if options.get('dry_run', False):
+            return plan
+        if not plan:
+            self._write_stamp()
+            return plan
+
+        requirements = [f"{x['name']}=={x['version']}" for x in plan.locks]
+        candidates = self.resolve(*requirements, transitive=False)
+        if len(candidates) != len(requirements):
+            found = {canonicalize_name(x.name) for x in candidates}
+            missing = [
+                x['name']
+                for x in plan.locks
+                if canonicalize_name(x['name']) not in found
+            ]
+            raise PackageManagerException(
+                f"locked packages not found: {', '.join(missing)}"
+            )
+
+        dist_dir = self.distribution_path.dist_dir
+        self._clear_stamp()
+        transaction = SyncTransaction(dist_dir)
+        added: List[InstalledRecord] = []
+
+        def add(installed: 'Dependency') -> None:
+            record = InstalledRecord.from_distribution(installed)
+            transaction.add(record_paths(dist_dir, record))
+            added.append(record)
+            self.installed.add(installed)
+
+        transaction.begin()
+        try:
+            for record in plan.records:
+                with self.scheduler.disk.slot():
+                    transaction.remove(record_paths(dist_dir, record))
+                self.installed.remove(record.name)
+
+            with TemporaryDirectory() as temp_dir:
+                with self.scheduler.executor() as executor:
+                    jobs = {
+                        executor.submit(
+                            self._install_package, x, temp_dir=temp_dir
+                        ): x
+                        for x in candidates
+                    }
+                    pending = set(jobs)
+                    try:
+                        for future in as_completed(jobs):
+                            pending.discard(future)
+                            installed = future.result()
+                            if not installed:
+                                raise PackageManagerException(
+                                    f"could not install {jobs[future].name}"
+                                )
+                            add(installed)
+                    finally:
+                        # installs still running are recorded for rollback
+                        for future in pending:
+                            if future.cancel():
+                                continue
+                            try:
+                                installed = future.result()
+                            except BaseException:
+                                continue
+                            if installed:
+                                add(installed)
+        except BaseException:
+            transaction.rollback()
+            for record in added:
+                self.__release_stored(record)
+            self.distribution_path.clear_cache()
+            self.installed.rebuild()
+            raise
+        transaction.commit()
+        self.distribution_path.clear_cache()
+        for record in plan.records:
+            self.__release_stored(record)
+        self.installed.save()
+        self._write_stamp()
+        if self.prefetcher and self.__owns_prefetcher:
+            self.prefetcher.close()
+        return plan
+
+    def check(self, **options: Any) -> Dict[str, Any]:
+        """Verify installed files against RECORD and versions against lock.
+
+        Parameters
+        ----------
+        production: bool
+            exclude development locks
+        incremental: bool
+            skip files unchanged since the last verified run
+
+        """
+        production = options.pop('production', False)
+        return check_environment(
+            self.distribution_path.dist_dir,
+            self._get_locks(production) if self.__manifest else None,
+            **options,
+        )
+
+    def list_installed(self) -> List[InstalledRecord]:
+        """List installed distributions from the installed index."""
+        return sorted(self.installed.records.values(), key=lambda x: x.key)
+
+    @_scoped
+    def outdated(self, **options: Any) -> List[Dict[str, str]]:
+        """List installed distributions with newer releases."""
+        cache_path = os.path.join(config.CACHE_DIR, 'latest-versions.json')
+        try:
+            with open(cache_path) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            cache = {}
+
+        def check(record: InstalledRecord) -> Optional[Dict[str, str]]:
+            cached = cache.get(record.key, {})
+            with self.scheduler.network.slot():
+                latest, etag = self._lookup_latest(
+                    record.name, cached.get('etag')
+                )
+            if latest is None:
+                latest = cached.get('version')
+            elif etag:
+                cache[record.key] = {'version': latest, 'etag': etag}
+            latest_version = parse_version(latest) if latest else None
+            installed_version = parse_version(record.version)
+            if (
+                latest
+                and latest_version
+                and installed_version
+                and latest_version > installed_version
+            ):
+                return {
+                    'name': record.name,
+                    'version': record.version,
+                    'latest': latest,
+                }
+            return None
+
+        with self.scheduler.executor() as executor:
+            results = [
+                x for x in executor.map(check, self.list_installed()) if x
+            ]
+
+        os.makedirs(config.CACHE_DIR, exist_ok=True)
+        tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(cache, f)
+        os.replace(tmp_path, cache_path)
+        return results
 
     # Uninstall package
     def __remove_package(self, package: 'Distribution') -> None:
@@ -365,6 +1116,34 @@ class PackageManager(PackageManagerBase):
             else:
                 log.info(f"{package.name} uninstall path does not exist")
 
+    def __release_stored(
+        self, package: Union['Distribution', InstalledRecord]
+    ) -> None:
+        """Drop reference of the environment to a stored distribution."""
+        if self.store:
+            dist_dir = self.distribution_path.dist_dir
+            key = self.store.find(
+                package.name,
+                package.version,
+                os.path.basename(os.path.normpath(dist_dir)),
+            )
+            if key:
+                self.store.release(key, dist_dir)
+
+    def collect(self) -> List[str]:
+        """Remove unreferenced stored distributions and stale artifacts."""
+        removed = self.store.collect() if self.store else []
+        max_size = parse_size(config.ARTIFACT_MAX_SIZE)
+        if self.prefetcher:
+            removed += self.prefetcher.evict(max_size, config.ARTIFACT_MAX_AGE)
+        else:
+            removed += evict(
+                os.path.join(config.CACHE_DIR, 'artifacts'),
+                max_size,
+                config.ARTIFACT_MAX_AGE,
+            )
+        return removed
+
     def _uninstall_package(
         self, package: 'Distribution', **options: Any
     ) -> Optional[Union['EggInfoDistribution', 'InstalledDistribution']]:
@@ -372,7 +1151,10 @@ class PackageManager(PackageManagerBase):
         installed = None
         if self.distribution_path.is_installed(package.name):
             installed = self.distribution_path.get_distribution(package.name)
-            self.__remove_package(installed)
+            with self.scheduler.disk.slot():
+                self.__remove_package(installed)
+            self.installed.remove(package.name)
+            self.__release_stored(installed)
             log.info('package uninstalled:', installed)
         else:
             log.info('could not uninstall non-existent package:', package.name)
@@ -387,15 +1169,15 @@ class PackageManager(PackageManagerBase):
             log.info('package unlocked:', locked)
         return installed
 
-    def uninstall(self, *packages: Any, **options: Any) -> None:
-        """Uninstall package and dependencies."""
+    def _get_removals(
+        self, packages: Iterable[Any], dev: bool = False
+    ) -> List[Dependency]:
+        """Get packages to uninstall dropping them from the project."""
         # TODO: compare removed dependencies with remaining
-        dev = options.get('dev', False)
+        dependencies: List[Dependency] = []
         if packages:
             for package in packages:
-                # TODO: json/rpc does not include run_requires
-                # package = self.__locator.locate(sequence)
-                dependency = Dependency(packages[0])
+                dependency = Dependency(package)
 
                 if (
                     dependency
@@ -403,16 +1185,27 @@ class PackageManager(PackageManagerBase):
                     and self.__manifest.source_tree.is_dependency(dependency)
                 ):
                     self.__manifest.source_tree.remove_dependency(dependency)
-                dependencies = [dependency] + self.get_dependencies(dependency)
+                dependencies.append(dependency)
+                installed = self.distribution_path.get_distribution(
+                    dependency.name
+                )
+                if installed:
+                    dependencies += self._get_installed_dependencies(installed)
         else:
-            dependencies = []
             if self.__manifest:
                 for lock in self.__manifest.lockfile.get_locks(dev):
                     # TODO: need better load from lockfile
                     dependencies.append(Dependency(lock['name']))
+        return dependencies
 
+    @_scoped
+    def uninstall(self, *packages: Any, **options: Any) -> None:
+        """Uninstall package and dependencies."""
+        self.installed.load()
+        self._clear_stamp()
+        dependencies = self._get_removals(packages, options.get('dev', False))
         if dependencies != []:
-            with ThreadPoolExecutor(max_workers=8) as executor:
+            with self.scheduler.executor() as executor:
                 jobs = [
                     executor.submit(
                         self._uninstall_package, dependency, **options
@@ -423,9 +1216,11 @@ class PackageManager(PackageManagerBase):
                     result = future.result()
                     if result:
                         print('result', result)
+            self.installed.save()
             self.save()
 
     # Upgrade package
+    @_scoped
     def update(self, *packages: Any, **options: Any) -> None:
         """Upgrade/downgrade package and dependencies."""
         # self.distribution_path.clear_cache()
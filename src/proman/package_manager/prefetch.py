@@ -0,0 +1,228 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Download artifacts in the background while resolution continues."""
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextvars import copy_context
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+from .metadata import ReleaseFile
+from .scheduler import Scheduler
+
+log = logging.getLogger(__name__)
+
+__all__: List[str] = ['Prefetcher', 'evict']
+
+CHUNK_SIZE = 1024 * 1024
+# staging directories older than this were left by interrupted downloads
+STAGE_AGE = 24 * 60 * 60
+
+
+def _scan(directory: str) -> Tuple[float, int, List[str]]:
+    """Get last use, size and filenames of a cached artifact."""
+    used, size, filenames = 0.0, 0, []
+    for entry in os.scandir(directory):
+        if entry.is_file():
+            stat = entry.stat()
+            used = max(used, stat.st_mtime)
+            size += stat.st_size
+            filenames.append(entry.name)
+    return used, size, filenames
+
+
+def evict(
+    path: str,
+    max_size: Optional[int] = None,
+    max_age: Optional[float] = None,
+    keep: Iterable[str] = (),
+) -> List[str]:
+    """Remove least recently used artifacts from the cache.
+
+    Parameters
+    ----------
+    path: str
+        artifact cache directory
+    max_size: int, optional
+        total size in bytes the remaining artifacts are kept within
+    max_age: float, optional
+        seconds an artifact is kept since it was last used
+    keep: Iterable[str]
+        digests of artifacts being downloaded
+
+    """
+    if not os.path.isdir(path):
+        return []
+    now = time.time()
+    kept = set(keep)
+    artifacts = []
+    for entry in os.scandir(path):
+        if not entry.is_dir() or entry.name in kept:
+            continue
+        try:
+            if entry.name.startswith('.part-'):
+                if now - entry.stat().st_mtime > STAGE_AGE:
+                    shutil.rmtree(entry.path, ignore_errors=True)
+                continue
+            artifacts.append((*_scan(entry.path), entry.path))
+        except FileNotFoundError:
+            continue
+    artifacts.sort()
+    total = sum(x[1] for x in artifacts)
+    removed = []
+    for used, size, filenames, directory in artifacts:
+        if (max_age is None or now - used <= max_age) and (
+            max_size is None or total <= max_size
+        ):
+            break
+        shutil.rmtree(directory, ignore_errors=True)
+        total -= size
+        removed.extend(filenames)
+    if removed:
+        log.info(f"evicted {len(removed)} cached artifacts")
+    return removed
+
+
+class Prefetcher:
+    """Queue downloads of confident picks into the artifact cache.
+
+    Only artifacts with a published sha256 are prefetched so a cached
+    file can be verified and reused by any later install.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        download: Callable[[ReleaseFile, str], Optional[str]],
+        scheduler: Scheduler,
+    ) -> None:
+        """Initialize prefetcher storing artifacts in a directory."""
+        self.path = path
+        self.download = download
+        self.scheduler = scheduler
+        self.__executor: Optional[ThreadPoolExecutor] = None
+        self.__futures: Dict[str, 'Future[Optional[str]]'] = {}
+        self.__lock = threading.Lock()
+
+    def _filepath(self, release: ReleaseFile) -> str:
+        """Get cache path of an artifact."""
+        assert release.sha256
+        return os.path.join(self.path, release.sha256, release.filename)
+
+    def cached(self, release: ReleaseFile) -> Optional[str]:
+        """Get cached artifact path when already downloaded."""
+        if not release.sha256:
+            return None
+        filepath = self._filepath(release)
+        if not os.path.isfile(filepath):
+            return None
+        try:
+            # reuse renews the artifact so eviction takes unused ones first
+            os.utime(filepath)
+        except OSError:
+            pass
+        return filepath
+
+    def _fetch(self, release: ReleaseFile) -> Optional[str]:
+        """Download artifact verifying it before it enters the cache."""
+        os.makedirs(self.path, exist_ok=True)
+        stage = tempfile.mkdtemp(prefix='.part-', dir=self.path)
+        try:
+            with self.scheduler.network.slot():
+                filepath = self.download(release, stage)
+            if not filepath:
+                return None
+            digest = hashlib.sha256()
+            with open(filepath, 'rb') as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+            if digest.hexdigest() != release.sha256:
+                log.warning(f"discarding {release.filename}: digest mismatch")
+                return None
+            target = self._filepath(release)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(filepath, target)
+            return target
+        finally:
+            shutil.rmtree(stage, ignore_errors=True)
+
+    def submit(self, release: ReleaseFile) -> bool:
+        """Queue download of an artifact unless cached or queued."""
+        if not release.sha256 or self.cached(release):
+            return False
+        with self.__lock:
+            if release.sha256 in self.__futures:
+                return False
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(
+                    max_workers=self.scheduler.network.maximum,
+                    thread_name_prefix='prefetch',
+                )
+            log.debug(f"prefetching {release.filename}")
+            # the pool outlives commands so each download runs in the
+            # context of the one that queued it such as its deadline
+            future = self.__executor.submit(
+                copy_context().run, self._fetch, release
+            )
+            self.__futures[release.sha256] = future
+        # finished downloads are found in the cache or may be retried
+        future.add_done_callback(
+            lambda x: self._discard(release.sha256 or '', x)
+        )
+        return True
+
+    def _discard(self, sha256: str, future: 'Future[Optional[str]]') -> None:
+        """Forget finished download unless replaced by another."""
+        with self.__lock:
+            if self.__futures.get(sha256) is future:
+                del self.__futures[sha256]
+
+    def cancel(self, release: ReleaseFile) -> bool:
+        """Cancel queued download invalidated by backtracking.
+
+        Downloads already running are left to complete into the cache.
+        """
+        with self.__lock:
+            future = self.__futures.pop(release.sha256 or '', None)
+        if future is None:
+            return False
+        cancelled = future.cancel()
+        if cancelled:
+            log.debug(f"cancelled prefetch of {release.filename}")
+        return cancelled
+
+    def get(self, release: ReleaseFile) -> Optional[str]:
+        """Get cached artifact waiting for a pending download."""
+        with self.__lock:
+            # concurrent installs of one artifact share a single download
+            future = self.__futures.get(release.sha256 or '')
+        if future is not None and not future.cancelled():
+            try:
+                future.result()
+            except Exception as err:
+                log.warning(f"prefetch of {release.filename} failed: {err}")
+        return self.cached(release)
+
+    def evict(
+        self, max_size: Optional[int] = None, max_age: Optional[float] = None
+    ) -> List[str]:
+        """Remove least recently used artifacts not being downloaded."""
+        with self.__lock:
+            pending = list(self.__futures)
+        return evict(self.path, max_size, max_age, pending)
+
+    def close(self) -> None:
+        """Cancel queued downloads and wait for running ones."""
+        with self.__lock:
+            futures, self.__futures = self.__futures, {}
+            executor, self.__executor = self.__executor, None
+        for future in futures.values():
+            future.cancel()
+        if executor is not None:
+            executor.shutdown(wait=True)
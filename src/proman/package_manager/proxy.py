@@ -0,0 +1,499 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Serve the artifact and metadata cache as a read-through index proxy.
+
+Nodes pointing their index at the proxy share one upstream fetch of
+each document and artifact. Project documents are served by the JSON
+API and both the PEP 503 and PEP 691 forms of the simple API with file
+URLs rewritten to the proxy.
+"""
+
+import hashlib
+import html
+import json
+import logging
+import os
+import re
+import shutil
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from urllib.parse import urljoin, urlsplit
+
+from packaging.utils import canonicalize_name
+
+from . import config
+from .budget import parse_size
+from .exception import PackageManagerNetwork
+from .metadata import ReleaseFile
+from .prefetch import Prefetcher
+from .scheduler import Scheduler
+from .session import Response, session
+
+log = logging.getLogger(__name__)
+
+__all__: List[str] = ['CacheProxy', 'serve']
+
+SIMPLE_JSON = 'application/vnd.pypi.simple.v1+json'
+SIMPLE_HTML = 'application/vnd.pypi.simple.v1+html'
+# header fields kept with cached upstream documents
+CACHED_HEADERS = ('Content-Type', 'ETag', 'X-PyPI-Last-Serial')
+
+# seconds between evictions from the artifact cache
+EVICT_INTERVAL = 60
+
+_segment = re.compile(r'^[A-Za-z0-9][A-Za-z0-9._+!-]*$')
+_digest = re.compile(r'^[0-9a-f]{64}$')
+
+
+def _download(release: ReleaseFile, dest: str) -> Optional[str]:
+    """Download artifact from its upstream URL."""
+    filepath = os.path.join(dest, release.filename)
+    session.download(release.url, filepath)
+    return filepath
+
+
+def _get_project(filename: str) -> str:
+    """Get project name from a wheel or sdist filename."""
+    if filename.endswith('.whl'):
+        return filename.split('-', 1)[0]
+    return filename.rsplit('-', 1)[0]
+
+
+def _iter_files(data: Dict[str, Any]) -> Iterator[Dict[str, Any]]:
+    """Iterate file entries of a JSON API project document."""
+    yield from data.get('urls') or ()
+    for files in (data.get('releases') or {}).values():
+        yield from files
+
+
+class CacheProxy:
+    """Serve index documents and artifacts reading through a cache.
+
+    Documents are revalidated once older than the metadata TTL and a
+    stale copy is served while upstream is unavailable. Artifacts are
+    fetched into the prefetch cache so they are verified once and then
+    shared with local installs.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        upstream: Optional[str] = None,
+        url: Optional[str] = None,
+        **options: Any,
+    ) -> None:
+        """Initialize proxy over a cache directory.
+
+        Parameters
+        ----------
+        path: str, optional
+            cache directory shared with the package manager
+        upstream: str, optional
+            package index documents and artifacts are read from
+        url: str, optional
+            public URL of the proxy used in file links
+        max_size: int | str, optional
+            total size of cached artifacts kept
+        max_age: float, optional
+            seconds an unused artifact is kept
+
+        """
+        self.path = path or config.CACHE_DIR
+        self.upstream = upstream or config.INDEX_URL
+        if not self.upstream.endswith('/'):
+            self.upstream += '/'
+        self.url = url
+        self.ttl: float = options.get('ttl', config.METADATA_TTL)
+        self.max_size = parse_size(
+            options.get('max_size', config.ARTIFACT_MAX_SIZE)
+        )
+        self.max_age: Optional[float] = options.get(
+            'max_age', config.ARTIFACT_MAX_AGE
+        )
+        self.prefetcher = options.get('prefetcher') or Prefetcher(
+            os.path.join(self.path, 'artifacts'),
+            _download,
+            options.get('scheduler') or Scheduler(),
+        )
+        # let every download slot hold its own pooled connection
+        session.resize(self.prefetcher.scheduler.network.maximum)
+        self.__releases: Dict[str, ReleaseFile] = {}
+        self.__locks: Dict[str, threading.Lock] = {}
+        self.__lock = threading.Lock()
+        self.__evicted: Optional[float] = None
+
+    def _key_lock(self, key: str) -> threading.Lock:
+        """Get lock serializing revalidation of a document."""
+        with self.__lock:
+            lock = self.__locks.get(key)
+            if lock is None:
+                lock = self.__locks[key] = threading.Lock()
+            return lock
+
+    def _read(self, filepath: str) -> Optional[Response]:
+        """Read cached document."""
+        try:
+            with open(f"{filepath}.headers") as f:
+                headers = json.load(f)
+            with open(filepath, 'rb') as f:
+                data = f.read()
+        except (OSError, ValueError):
+            return None
+        return Response(filepath, 200, headers, data)
+
+    def _write(self, filepath: str, rsp: Response) -> Response:
+        """Cache document with the header fields needed to serve it."""
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        headers = {
+            x: rsp.headers[x] for x in CACHED_HEADERS if x in rsp.headers
+        }
+        tmp_path = f"{filepath}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(headers, f)
+        os.replace(tmp_path, f"{filepath}.headers")
+        with open(tmp_path, 'wb') as f:
+            f.write(rsp.data)
+        os.replace(tmp_path, filepath)
+        return Response(filepath, 200, headers, rsp.data)
+
+    def _fetch(
+        self, key: str, path: str, accept: Optional[str] = None
+    ) -> Optional[Response]:
+        """Get upstream document through the cache.
+
+        Concurrent requests for one document wait for a single fetch.
+        Returns None when upstream does not have the document.
+        """
+        filepath = os.path.join(self.path, 'index', key)
+        with self._key_lock(key):
+            cached = self._read(filepath)
+            if cached and time.time() - os.path.getmtime(filepath) < self.ttl:
+                return cached
+            headers = {'Accept': accept} if accept else {}
+            if cached and 'ETag' in cached.headers:
+                headers['If-None-Match'] = cached.headers['ETag']
+            try:
+                rsp = session.request(
+                    'GET', urljoin(self.upstream, path), headers
+                )
+            except PackageManagerNetwork as err:
+                rsp = Response(path, 502, {}, str(err).encode('utf-8'))
+            if rsp.status == 304 and cached:
+                os.utime(filepath)
+                return cached
+            if rsp.status == 200:
+                return self._write(filepath, rsp)
+            if rsp.status in (404, 410):
+                return None
+            if cached:
+                log.warning(f"serving stale {path}: upstream {rsp.status}")
+                return cached
+            raise PackageManagerNetwork(f"{path} returned {rsp.status}")
+
+    def base_url(self, host: Optional[str]) -> str:
+        """Get URL of the proxy as seen by a client."""
+        if self.url:
+            return self.url if self.url.endswith('/') else f"{self.url}/"
+        return f"http://{host or 'localhost'}/"
+
+    def project(
+        self, name: str, version: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Get JSON API document of a project recording its artifacts."""
+        project = canonicalize_name(name)
+        if version:
+            key = os.path.join('pypi', project, f"{version}.json")
+            path = f"pypi/{project}/{version}/json"
+        else:
+            key = os.path.join('pypi', f"{project}.json")
+            path = f"pypi/{project}/json"
+        rsp = self._fetch(key, path)
+        if rsp is None:
+            return None
+        data: Dict[str, Any] = json.loads(rsp.data)
+        releases = {}
+        for entry in _iter_files(data):
+            release = ReleaseFile.from_dict(entry)
+            if release.sha256:
+                releases[release.sha256] = release
+        with self.__lock:
+            self.__releases.update(releases)
+        return data
+
+    def _link(self, base_url: str, entry: Dict[str, Any]) -> str:
+        """Get proxy URL of an artifact verifiable by its digest."""
+        sha256 = (entry.get('digests') or {}).get('sha256')
+        if not sha256:
+            # artifacts without a digest cannot be verified in the cache
+            return entry['url']
+        return f"{base_url}files/{sha256}/{entry['filename']}"
+
+    def project_json(
+        self, name: str, version: Optional[str], base_url: str
+    ) -> Optional[Dict[str, Any]]:
+        """Get JSON API document with file URLs of the proxy."""
+        data = self.project(name, version)
+        if data is None:
+            return None
+        for entry in _iter_files(data):
+            entry['url'] = self._link(base_url, entry)
+        return data
+
+    def simple_project(
+        self, name: str, base_url: str
+    ) -> Optional[Tuple[Dict[str, Any], Optional[int]]]:
+        """Get PEP 691 project page built from the JSON API document."""
+        data = self.project(name)
+        if data is None:
+            return None
+        files = []
+        seen = set()
+        for entry in _iter_files(data):
+            if entry['filename'] in seen:
+                continue
+            seen.add(entry['filename'])
+            files.append(
+                {
+                    'filename': entry['filename'],
+                    'url': self._link(base_url, entry),
+                    'hashes': entry.get('digests') or {},
+                    'requires-python': entry.get('requires_python'),
+                    'yanked': (
+                        entry.get('yanked_reason') or True
+                        if entry.get('yanked')
+                        else False
+                    ),
+                }
+            )
+        serial = data.get('last_serial')
+        page = {
+            'meta': {'api-version': '1.0', '_last-serial': serial},
+            'name': canonicalize_name(name),
+            'files': files,
+        }
+        return page, serial
+
+    def simple_index(self, accept: Optional[str]) -> Response:
+        """Get project listing of upstream."""
+        html_only = SIMPLE_JSON not in (accept or '')
+        key = os.path.join('simple', 'index.html' if html_only else 'index')
+        rsp = self._fetch(key, 'simple/', None if html_only else SIMPLE_JSON)
+        if rsp is None:
+            raise PackageManagerNetwork('simple/ returned 404')
+        return rsp
+
+    def artifact(self, sha256: str, filename: str) -> Optional[str]:
+        """Get cached artifact downloading it once for all clients."""
+        release = ReleaseFile(filename, '', 'unknown', sha256=sha256)
+        filepath = self.prefetcher.cached(release)
+        if filepath:
+            return filepath
+        with self.__lock:
+            known = self.__releases.get(sha256)
+        if known is None:
+            # locate the upstream URL after the proxy was restarted
+            self.project(_get_project(filename))
+            with self.__lock:
+                known = self.__releases.get(sha256)
+        if known is None or known.filename != filename:
+            return None
+        self.prefetcher.submit(known)
+        filepath = self.prefetcher.get(known)
+        if filepath is None:
+            raise PackageManagerNetwork(f"{known.url} could not be fetched")
+        self._evict()
+        return filepath
+
+    def _evict(self) -> None:
+        """Keep the artifact cache within its limits as it grows."""
+        now = time.monotonic()
+        with self.__lock:
+            if self.__evicted and now - self.__evicted < EVICT_INTERVAL:
+                return
+            self.__evicted = now
+        self.prefetcher.evict(self.max_size, self.max_age)
+
+    def close(self) -> None:
+        """Wait for running downloads."""
+        self.prefetcher.close()
+
+
+def _render_html(page: Dict[str, Any]) -> str:
+    """Render PEP 503 project page."""
+    name = html.escape(page['name'])
+    lines = [
+        '<!DOCTYPE html>',
+        '<html>',
+        '<head>',
+        '<meta name="pypi:repository-version" content="1.0">',
+        f"<title>Links for {name}</title>",
+        '</head>',
+        '<body>',
+        f"<h1>Links for {name}</h1>",
+    ]
+    for entry in page['files']:
+        url = entry['url']
+        if 'sha256' in entry['hashes']:
+            url = f"{url}#sha256={entry['hashes']['sha256']}"
+        attributes = f' href="{html.escape(url)}"'
+        if entry['requires-python']:
+            requires = html.escape(entry['requires-python'])
+            attributes += f' data-requires-python="{requires}"'
+        if entry['yanked']:
+            reason = (
+                entry['yanked'] if isinstance(entry['yanked'], str) else ''
+            )
+            attributes += f' data-yanked="{html.escape(reason)}"'
+        lines.append(
+            f"<a{attributes}>{html.escape(entry['filename'])}</a><br>"
+        )
+    lines += ['</body>', '</html>', '']
+    return '\n'.join(lines)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Route index requests to the proxy."""
+
+    protocol_version = 'HTTP/1.1'
+    server: '_Server'
+
+    def log_message(self, format: str, *args: Any) -> None:
+        """Log requests at debug level."""
+        log.debug(format % args)
+
+    def _send(
+        self,
+        status: int,
+        body: bytes = b'',
+        headers: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Send response honouring conditional requests."""
+        headers = dict(headers or {})
+        if status == 200:
+            etag = headers.setdefault(
+                'ETag', f'"{hashlib.sha256(body).hexdigest()[:32]}"'
+            )
+            if etag in self.headers.get('If-None-Match', ''):
+                status, body = 304, b''
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, str(value))
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if self.command != 'HEAD':
+            self.wfile.write(body)
+
+    def _send_json(
+        self,
+        data: Any,
+        content_type: str = 'application/json',
+        serial: Optional[int] = None,
+    ) -> None:
+        """Send JSON document."""
+        headers: Dict[str, Any] = {'Content-Type': content_type}
+        if serial is not None:
+            headers['X-PyPI-Last-Serial'] = serial
+        self._send(200, json.dumps(data).encode('utf-8'), headers)
+
+    def _send_file(self, filepath: str, sha256: str) -> None:
+        """Send immutable artifact."""
+        etag = f'"{sha256}"'
+        if etag in self.headers.get('If-None-Match', ''):
+            self._send(304, headers={'ETag': etag})
+            return
+        with open(filepath, 'rb') as f:
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/octet-stream')
+            self.send_header(
+                'Content-Length', str(os.fstat(f.fileno()).st_size)
+            )
+            self.send_header('ETag', etag)
+            self.send_header('Cache-Control', 'max-age=31536000, immutable')
+            self.end_headers()
+            if self.command != 'HEAD':
+                shutil.copyfileobj(f, self.wfile, config.CHUNK_SIZE)
+
+    def _route(self) -> None:
+        """Serve request by path."""
+        proxy = self.server.proxy
+        base_url = proxy.base_url(self.headers.get('Host'))
+        parts = [x for x in urlsplit(self.path).path.split('/') if x]
+        if not all(_segment.match(x) for x in parts):
+            self._send(404)
+        elif parts == ['simple']:
+            rsp = proxy.simple_index(self.headers.get('Accept'))
+            self._send(
+                200,
+                rsp.data,
+                {k: v for k, v in rsp.headers.items() if k != 'ETag'},
+            )
+        elif len(parts) == 2 and parts[0] == 'simple':
+            result = proxy.simple_project(parts[1], base_url)
+            if result is None:
+                self._send(404)
+            elif SIMPLE_JSON in self.headers.get('Accept', ''):
+                self._send_json(result[0], SIMPLE_JSON, result[1])
+            else:
+                headers: Dict[str, Any] = {'Content-Type': SIMPLE_HTML}
+                if result[1] is not None:
+                    headers['X-PyPI-Last-Serial'] = result[1]
+                body = _render_html(result[0]).encode('utf-8')
+                self._send(200, body, headers)
+        elif (
+            parts[:1] == ['pypi']
+            and parts[-1:] == ['json']
+            and (len(parts) in (3, 4))
+        ):
+            version = parts[2] if len(parts) == 4 else None
+            data = proxy.project_json(parts[1], version, base_url)
+            if data is None:
+                self._send(404)
+            else:
+                self._send_json(data, serial=data.get('last_serial'))
+        elif (
+            len(parts) == 3 and parts[0] == 'files' and _digest.match(parts[1])
+        ):
+            filepath = proxy.artifact(parts[1], parts[2])
+            if filepath is None:
+                self._send(404)
+            else:
+                self._send_file(filepath, parts[1])
+        else:
+            self._send(404)
+
+    def do_GET(self) -> None:
+        """Serve GET request."""
+        try:
+            self._route()
+        except PackageManagerNetwork as err:
+            log.warning(f"upstream unavailable: {err}")
+            self._send(502, str(err).encode('utf-8'))
+
+    do_HEAD = do_GET
+
+
+class _Server(ThreadingHTTPServer):
+    """Serve each client connection from its own thread."""
+
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], proxy: CacheProxy) -> None:
+        """Initialize server for a proxy."""
+        self.proxy = proxy
+        super().__init__(address, _Handler)
+
+
+def serve(host: str = '127.0.0.1', port: int = 8080, **options: Any) -> None:
+    """Serve cache as an index proxy until interrupted."""
+    proxy = CacheProxy(**options)
+    server = _Server((host, port), proxy)
+    log.info(f"proxying {proxy.upstream} on http://{host}:{port}/")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        proxy.close()
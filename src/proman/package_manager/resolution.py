@@ -0,0 +1,107 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Cache resolution results keyed by a fingerprint of their inputs."""
+
+import hashlib
+import json
+import logging
+import os
+import sys
+import sysconfig
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from .dependencies import Candidate
+from .specifiers import parse_requirement
+
+log = logging.getLogger(__name__)
+
+__all__: List[str] = ['ResolutionCache', 'fingerprint']
+
+CACHE_FORMAT = 1
+RESOLUTION_OPTIONS = ('dev', 'python', 'platform', 'prerelease', 'transitive')
+
+
+def fingerprint(
+    requirements: Iterable[str], index_url: str, **options: Any
+) -> str:
+    """Get digest of every input affecting a resolution."""
+    inputs = {
+        'format': CACHE_FORMAT,
+        'requirements': sorted(
+            str(parse_requirement(x)) for x in requirements
+        ),
+        'options': {k: options.get(k) for k in RESOLUTION_OPTIONS},
+        'interpreter': [
+            sys.implementation.name,
+            list(sys.version_info[:2]),
+            sysconfig.get_platform(),
+        ],
+        'index_url': index_url,
+    }
+    content = json.dumps(inputs, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+class ResolutionCache:
+    """Manage resolved candidates stored per input fingerprint."""
+
+    def __init__(self, path: str, ttl: int = 3600) -> None:
+        """Initialize resolution cache stored in a directory."""
+        self.path = path
+        self.ttl = ttl
+
+    def _filepath(self, key: str) -> str:
+        """Get path of a cached resolution."""
+        return os.path.join(self.path, f"{key}.json")
+
+    def get(
+        self,
+        key: str,
+        validate: Optional[Callable[[Dict[str, int]], bool]] = None,
+    ) -> Optional[List[Candidate]]:
+        """Get cached candidates while the index has not changed.
+
+        Parameters
+        ----------
+        key: str
+            fingerprint of the resolution inputs
+        validate: Callable, optional
+            check project serials once the TTL has expired
+
+        """
+        try:
+            with open(self._filepath(key)) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('format') != CACHE_FORMAT:
+            return None
+
+        candidates = [Candidate.from_dict(x) for x in data['candidates']]
+        if time.time() - data['created'] > self.ttl:
+            serials = {
+                x.name: x.last_serial
+                for x in candidates
+                if x.last_serial is not None
+            }
+            if validate is None or not validate(serials):
+                log.info(f"cached resolution {key[:12]} is stale")
+                return None
+            # projects are unchanged so the result is valid for another TTL
+            self.put(key, candidates)
+        return candidates
+
+    def put(self, key: str, candidates: Iterable[Candidate]) -> None:
+        """Store resolved candidates atomically."""
+        os.makedirs(self.path, exist_ok=True)
+        data = {
+            'format': CACHE_FORMAT,
+            'created': time.time(),
+            'candidates': [x.to_dict() for x in candidates],
+        }
+        filepath = self._filepath(key)
+        tmp_path = f"{filepath}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f, separators=(',', ':'))
+        os.replace(tmp_path, filepath)
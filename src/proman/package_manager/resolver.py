@@ -0,0 +1,743 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Resolve dependencies with conflict driven clause learning (PubGrub).
+
+Version sets are bitmasks over the known versions of each package where
+bit zero is the newest version. A package requested with extras such as
+``name[extra]`` is solved as its own package depending on the same
+version of the base package.
+"""
+
+import logging
+from abc import ABCMeta, abstractmethod
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from packaging.requirements import Requirement
+from packaging.utils import canonicalize_name
+
+from .dependencies import Candidate
+from .exception import PackageManagerResolution
+from .markers import get_environment
+from .metadata import ProjectMetadata, ReleaseFile
+from .prefetch import Prefetcher
+from .specifiers import (
+    VersionSet,
+    get_specifier,
+    parse_requirement,
+    parse_version,
+)
+
+log = logging.getLogger(__name__)
+
+__all__: List[str] = ['IndexProvider', 'Provider', 'Resolver']
+
+ROOT = '<root>'
+
+SATISFIED = 'satisfied'
+CONTRADICTED = 'contradicted'
+INCONCLUSIVE = 'inconclusive'
+
+
+class Provider(metaclass=ABCMeta):
+    """Provide versions and dependencies of packages to the resolver."""
+
+    @abstractmethod
+    def get_versions(self, name: str) -> List[str]:
+        """Get candidate versions of a package newest first."""
+
+    @abstractmethod
+    def get_dependencies(self, name: str, version: str) -> List[str]:
+        """Get requirements of a package version."""
+
+    def prefetch(self, name: str, version: str) -> None:
+        """Start fetching a version that is unlikely to be revisited."""
+
+    def cancel(self, name: str, version: str) -> None:
+        """Stop fetching a version invalidated by backtracking."""
+
+
+class IndexProvider(Provider):
+    """Provide releases published on the package index."""
+
+    def __init__(
+        self,
+        lookup: Callable[..., Optional[ProjectMetadata]],
+        python: Optional[str] = None,
+        prefetcher: Optional[Prefetcher] = None,
+    ) -> None:
+        """Initialize provider from a metadata lookup."""
+        self.lookup = lookup
+        self.python = get_environment(python).python
+        self.prefetcher = prefetcher
+
+    def _supported(self, metadata: ProjectMetadata, version: str) -> bool:
+        """Check any artifact of a release supports the interpreter."""
+        files = metadata.releases.get(version, ())
+        return not files or any(
+            x.requires_python is None
+            or get_specifier(x.requires_python).contains(
+                self.python, prereleases=True
+            )
+            for x in files
+        )
+
+    def get_versions(self, name: str) -> List[str]:
+        """Get versions of a project supporting the interpreter."""
+        metadata = self.lookup(name)
+        if metadata is None:
+            return []
+        return [
+            x
+            for x in metadata.version_set.filter('*', True)
+            if self._supported(metadata, x)
+        ]
+
+    def get_dependencies(self, name: str, version: str) -> List[str]:
+        """Get requirements of a release."""
+        metadata = self.lookup(name)
+        if metadata is None:
+            return []
+        # requirements are only published for the latest release
+        if version != metadata.version:
+            metadata = self.lookup(name, version)
+        return list(metadata.requires_dist) if metadata else []
+
+    def _get_release(self, name: str, version: str) -> Optional[ReleaseFile]:
+        """Get artifact of a release that would be installed."""
+        metadata = self.lookup(name)
+        if metadata is None:
+            return None
+        candidate = Candidate.from_metadata(metadata, version, requires=())
+        return candidate.get_release() or candidate.get_release('sdist')
+
+    def prefetch(self, name: str, version: str) -> None:
+        """Queue artifact download of a confident pick."""
+        if self.prefetcher:
+            release = self._get_release(name, version)
+            if release:
+                self.prefetcher.submit(release)
+
+    def cancel(self, name: str, version: str) -> None:
+        """Cancel queued artifact download of a retracted pick."""
+        if self.prefetcher:
+            release = self._get_release(name, version)
+            if release:
+                self.prefetcher.cancel(release)
+
+    def get_candidate(
+        self, name: str, version: str, **options: Any
+    ) -> Optional[Candidate]:
+        """Get installable candidate of a selected release."""
+        metadata = self.lookup(name)
+        if metadata is None:
+            return None
+        return Candidate.from_metadata(
+            metadata,
+            version,
+            requires=self.get_dependencies(name, version),
+            **options,
+        )
+
+
+class Term:
+    """Provide statement that a package is or is not within a version set."""
+
+    __slots__ = ('package', 'mask', 'positive')
+
+    def __init__(self, package: str, mask: int, positive: bool = True):
+        """Initialize term."""
+        self.package = package
+        self.mask = mask
+        self.positive = positive
+
+    def __eq__(self, other: object) -> bool:
+        """Check terms allow the same selections."""
+        return (
+            isinstance(other, Term)
+            and self.package == other.package
+            and self.mask == other.mask
+            and self.positive == other.positive
+        )
+
+    def __hash__(self) -> int:
+        """Get hash of term."""
+        return hash((self.package, self.mask, self.positive))
+
+    def negate(self) -> 'Term':
+        """Get inverse of term."""
+        return Term(self.package, self.mask, not self.positive)
+
+    def intersect(self, other: 'Term') -> 'Term':
+        """Get term allowing selections allowed by both terms."""
+        if self.positive and other.positive:
+            return Term(self.package, self.mask & other.mask)
+        if self.positive:
+            return Term(self.package, self.mask & ~other.mask)
+        if other.positive:
+            return Term(self.package, other.mask & ~self.mask)
+        return Term(self.package, self.mask | other.mask, False)
+
+    def satisfies(self, other: 'Term') -> bool:
+        """Check every selection allowed by term is allowed by other."""
+        return self.intersect(other) == self
+
+    @property
+    def is_empty(self) -> bool:
+        """Check term allows no selection."""
+        return self.positive and self.mask == 0
+
+
+class Incompatibility:
+    """Provide set of terms that must not all be true."""
+
+    __slots__ = ('terms', 'cause', 'causes', 'dependency')
+
+    def __init__(
+        self,
+        terms: Iterable[Term],
+        cause: str,
+        causes: Tuple['Incompatibility', ...] = (),
+        dependency: Optional[str] = None,
+    ) -> None:
+        """Initialize incompatibility merging terms of the same package."""
+        merged: Dict[str, Term] = {}
+        for term in terms:
+            if term.package in merged:
+                term = merged[term.package].intersect(term)
+            merged[term.package] = term
+        self.terms = merged
+        self.cause = cause
+        self.causes = causes
+        self.dependency = dependency
+
+
+class Assignment:
+    """Provide decision or derivation recorded in the partial solution."""
+
+    __slots__ = ('term', 'level', 'cause', 'index')
+
+    def __init__(
+        self,
+        term: Term,
+        level: int,
+        index: int,
+        cause: Optional[Incompatibility] = None,
+    ) -> None:
+        """Initialize assignment."""
+        self.term = term
+        self.level = level
+        self.index = index
+        self.cause = cause
+
+    @property
+    def is_decision(self) -> bool:
+        """Check assignment is a decision."""
+        return self.cause is None
+
+
+class PartialSolution:
+    """Track assignments and their accumulated terms per package."""
+
+    def __init__(self) -> None:
+        """Initialize empty partial solution."""
+        self.assignments: List[Assignment] = []
+        self.terms: Dict[str, Term] = {}
+        self.decisions: Dict[str, int] = {}
+        self.level = 0
+
+    def _add(self, term: Term, cause: Optional[Incompatibility]) -> None:
+        """Record assignment."""
+        self.assignments.append(
+            Assignment(term, self.level, len(self.assignments), cause)
+        )
+        previous = self.terms.get(term.package)
+        self.terms[term.package] = (
+            previous.intersect(term) if previous else term
+        )
+
+    def decide(self, package: str, mask: int) -> None:
+        """Select a single version of a package."""
+        self.level += 1
+        self.decisions[package] = mask
+        self._add(Term(package, mask), None)
+
+    def derive(self, term: Term, cause: Incompatibility) -> None:
+        """Record term implied by an incompatibility."""
+        self._add(term, cause)
+
+    def backtrack(self, level: int) -> None:
+        """Remove assignments made after a decision level."""
+        assignments = [x for x in self.assignments if x.level <= level]
+        self.assignments, self.terms, self.decisions = [], {}, {}
+        for assignment in assignments:
+            self.level = assignment.level
+            if assignment.is_decision:
+                self.decisions[assignment.term.package] = assignment.term.mask
+            self._add(assignment.term, assignment.cause)
+        self.level = level
+
+    def relation(self, term: Term) -> str:
+        """Get relation of the accumulated term of a package to term."""
+        current = self.terms.get(term.package)
+        if current is None:
+            return INCONCLUSIVE
+        if current.satisfies(term):
+            return SATISFIED
+        if current.intersect(term).is_empty:
+            return CONTRADICTED
+        return INCONCLUSIVE
+
+    def satisfier(self, term: Term) -> Assignment:
+        """Get earliest assignment after which term is satisfied."""
+        current: Optional[Term] = None
+        for assignment in self.assignments:
+            if assignment.term.package != term.package:
+                continue
+            current = (
+                current.intersect(assignment.term)
+                if current
+                else assignment.term
+            )
+            if current.satisfies(term):
+                return assignment
+        raise LookupError(f"{term.package} is not satisfied")
+
+    def unsatisfied(self) -> List[Term]:
+        """Get positive terms of packages without a decision."""
+        return [
+            v
+            for k, v in self.terms.items()
+            if v.positive and k not in self.decisions
+        ]
+
+
+class Resolver:
+    """Find versions satisfying all requirements or explain why not."""
+
+    def __init__(self, provider: Provider, **options: Any) -> None:
+        """Initialize resolver for the python and platform of a target."""
+        self.provider = provider
+        self.prerelease = options.get('prerelease', False)
+        self.environment = get_environment(
+            options.get('python'), options.get('platform')
+        )
+        self.versions: Dict[str, List[str]] = {ROOT: ['']}
+        self.names: Dict[str, str] = {ROOT: ROOT}
+        self.__extras: Dict[str, Tuple[str, Tuple[str, ...]]] = {}
+        self.__version_sets: Dict[str, VersionSet] = {}
+        self.__masks: Dict[Tuple[str, str], int] = {}
+        self.__requirements: List[str] = []
+        self.incompatibilities: Dict[str, List[Incompatibility]] = {}
+        self.solution = PartialSolution()
+        self.decisions = 0
+        self.__prefetched: Dict[str, int] = {}
+
+    # Packages
+    def _key(self, requirement: Requirement) -> str:
+        """Get package of a requirement registering requested extras."""
+        name = canonicalize_name(requirement.name)
+        self.names.setdefault(name, requirement.name)
+        if not requirement.extras:
+            return name
+        extras = tuple(
+            sorted(canonicalize_name(x) for x in requirement.extras)
+        )
+        key = f"{name}[{','.join(extras)}]"
+        self.names.setdefault(key, f"{requirement.name}[{','.join(extras)}]")
+        self.__extras.setdefault(key, (name, extras))
+        return key
+
+    def _project(self, package: str) -> str:
+        """Get project name of a package."""
+        return self.names[self.__extras.get(package, (package,))[0]]
+
+    # Version sets
+    def _load(self, package: str) -> List[str]:
+        """Load versions of a package newest first."""
+        if package not in self.versions:
+            version_set = VersionSet(
+                self.provider.get_versions(self._project(package))
+            )
+            self.__version_sets[package] = version_set
+            self.versions[package] = list(version_set.filter('*', True))
+        return self.versions[package]
+
+    def _full(self, package: str) -> int:
+        """Get mask of every known version."""
+        return (1 << len(self._load(package))) - 1
+
+    def _mask(self, package: str, specifier: str) -> int:
+        """Get mask of versions matching a specifier."""
+        key = (package, specifier)
+        if key not in self.__masks:
+            versions = self._load(package)
+            matches = set(
+                self.__version_sets[package].filter(specifier, self.prerelease)
+            )
+            self.__masks[key] = sum(
+                1 << i for i, x in enumerate(versions) if x in matches
+            )
+        return self.__masks[key]
+
+    def describe(self, package: str, mask: int) -> str:
+        """Get readable version set of a package."""
+        if package == ROOT:
+            return 'the project'
+        versions = self.versions.get(package, [])
+        name = self.names.get(package, package)
+        full = (1 << len(versions)) - 1
+        if mask & full == full:
+            return name
+        selected = [x for i, x in enumerate(versions) if mask >> i & 1]
+        if not selected:
+            return f"{name} (no versions)"
+        if len(selected) == 1:
+            return f"{name} ({selected[0]})"
+        # bits are contiguous when the set is a single range
+        lowest = mask & -mask
+        if (mask // lowest) & ((mask // lowest) + 1) == 0:
+            if mask & 1:
+                return f"{name} (>={selected[-1]})"
+            if mask & full == full & ~(lowest - 1):
+                return f"{name} (<={selected[0]})"
+            return f"{name} (>={selected[-1]},<={selected[0]})"
+        if len(selected) <= 4:
+            return f"{name} ({', '.join(reversed(selected))})"
+        return (
+            f"{name} ({selected[-1]}, ..., {selected[0]}; "
+            f"{len(selected)} versions)"
+        )
+
+    def describe_term(self, term: Term) -> str:
+        """Get readable term."""
+        if term.positive:
+            return self.describe(term.package, term.mask)
+        full = self._full(term.package)
+        if term.mask & full == full:
+            return f"no version of {self.describe(term.package, full)}"
+        return self.describe(term.package, ~term.mask & full)
+
+    # Incompatibilities
+    def _add_incompatibility(self, incompatibility: Incompatibility) -> None:
+        """Index incompatibility by each package it refers to."""
+        for package in incompatibility.terms:
+            self.incompatibilities.setdefault(package, []).append(
+                incompatibility
+            )
+
+    def _dependencies(
+        self, package: str, version_index: int
+    ) -> List[Incompatibility]:
+        """Get incompatibilities of a package version with its needs."""
+        version = self.versions[package][version_index]
+        mask = 1 << version_index
+        extras: Tuple[str, ...] = ()
+        if package == ROOT:
+            requirements = self.__requirements
+        else:
+            project = self._project(package)
+            requirements = self.provider.get_dependencies(project, version)
+            if package in self.__extras:
+                extras = self.__extras[package][1]
+                # extras select the same version of the project itself
+                requirements = [f"{project}=={version}", *requirements]
+
+        incompatibilities = []
+        for sequence in requirements:
+            requirement = parse_requirement(sequence)
+            # requirements of other targets are never looked up
+            if not self.environment.applies(requirement, extras):
+                continue
+            dependency = self._key(requirement)
+            if dependency == package:
+                continue
+            specifier = str(requirement.specifier) or '*'
+            dependency_mask = self._mask(dependency, specifier)
+            terms = [Term(package, mask)]
+            if dependency_mask:
+                terms.append(Term(dependency, dependency_mask, False))
+            # a requirement no version satisfies forbids the version itself
+            incompatibilities.append(
+                Incompatibility(
+                    terms,
+                    'dependency',
+                    dependency=(
+                        self.describe(dependency, dependency_mask)
+                        if dependency_mask
+                        else f"{requirement.name} ({specifier}) which has "
+                        'no matching versions'
+                    ),
+                )
+            )
+        return incompatibilities
+
+    # Solving
+    def _propagate(self, package: str) -> None:
+        """Derive terms implied by incompatibilities until a fixed point."""
+        changed = {package}
+        while changed:
+            current = changed.pop()
+            for incompatibility in reversed(
+                self.incompatibilities.get(current, [])
+            ):
+                result = self._propagate_incompatibility(incompatibility)
+                if result is SATISFIED:
+                    root_cause = self._resolve_conflict(incompatibility)
+                    changed = {
+                        str(self._propagate_incompatibility(root_cause))
+                    }
+                    break
+                if result is not None:
+                    changed.add(result)
+
+    def _propagate_incompatibility(
+        self, incompatibility: Incompatibility
+    ) -> Optional[str]:
+        """Derive inverse of the only inconclusive term of incompatibility."""
+        unsatisfied = None
+        for term in incompatibility.terms.values():
+            relation = self.solution.relation(term)
+            if relation == CONTRADICTED:
+                return None
+            if relation == INCONCLUSIVE:
+                if unsatisfied is not None:
+                    return None
+                unsatisfied = term
+        if unsatisfied is None:
+            return SATISFIED
+        self.solution.derive(unsatisfied.negate(), incompatibility)
+        return unsatisfied.package
+
+    def _is_failure(self, incompatibility: Incompatibility) -> bool:
+        """Check incompatibility makes the root unsolvable."""
+        terms = incompatibility.terms
+        return not terms or (len(terms) == 1 and ROOT in terms)
+
+    def _resolve_conflict(
+        self, incompatibility: Incompatibility
+    ) -> Incompatibility:
+        """Learn root cause of a conflict and backjump before it."""
+        original = incompatibility
+        while not self._is_failure(incompatibility):
+            recent_term: Optional[Term] = None
+            recent: Optional[Assignment] = None
+            difference: Optional[Term] = None
+            previous_level = 1
+            for term in incompatibility.terms.values():
+                satisfier = self.solution.satisfier(term)
+                if recent is None or recent.index < satisfier.index:
+                    if recent is not None:
+                        previous_level = max(previous_level, recent.level)
+                    recent_term, recent = term, satisfier
+                    difference = None
+                else:
+                    previous_level = max(previous_level, satisfier.level)
+                if recent_term is term:
+                    difference = recent.term.intersect(term.negate())
+                    if difference.is_empty:
+                        difference = None
+                    else:
+                        previous_level = max(
+                            previous_level,
+                            self.solution.satisfier(difference.negate()).level,
+                        )
+            assert recent is not None and recent_term is not None
+
+            if recent.is_decision or previous_level != recent.level:
+                if incompatibility is not original:
+                    self._add_incompatibility(incompatibility)
+                self._backtrack(previous_level)
+                return incompatibility
+
+            assert recent.cause is not None
+            terms = [
+                x for x in incompatibility.terms.values() if x != recent_term
+            ] + [
+                x
+                for x in recent.cause.terms.values()
+                if x.package != recent.term.package
+            ]
+            if difference is not None:
+                terms.append(difference.negate())
+            incompatibility = Incompatibility(
+                terms, 'conflict', (incompatibility, recent.cause)
+            )
+        raise PackageManagerResolution(self.explain(incompatibility))
+
+    def _backtrack(self, level: int) -> None:
+        """Backjump cancelling prefetches of retracted decisions."""
+        self.solution.backtrack(level)
+        for package, mask in list(self.__prefetched.items()):
+            # picks forced by requirements still standing stay queued
+            term = self.solution.terms.get(package)
+            if term is None or not term.satisfies(Term(package, mask)):
+                del self.__prefetched[package]
+                version = self.versions[package][mask.bit_length() - 1]
+                self.provider.cancel(self._project(package), version)
+
+    def _best_version(self, package: str, mask: int) -> Optional[int]:
+        """Get index of newest allowed version preferring final releases."""
+        fallback = None
+        for index, version in enumerate(self._load(package)):
+            if not mask >> index & 1:
+                continue
+            parsed = parse_version(version)
+            if self.prerelease or not (parsed and parsed.is_prerelease):
+                return index
+            if fallback is None:
+                fallback = index
+        return fallback
+
+    def _decide(self) -> Optional[str]:
+        """Choose next package version returning its package."""
+        unsatisfied = self.solution.unsatisfied()
+        if not unsatisfied:
+            return None
+        # the most constrained package is least likely to need revisiting
+        term = min(
+            unsatisfied,
+            key=lambda x: bin(x.mask & self._full(x.package)).count('1'),
+        )
+        index = self._best_version(term.package, term.mask)
+        if index is None:
+            self._add_incompatibility(Incompatibility([term], 'no_versions'))
+            return term.package
+
+        conflict = False
+        for incompatibility in self._dependencies(term.package, index):
+            self._add_incompatibility(incompatibility)
+            conflict = conflict or all(
+                x.package == term.package
+                or self.solution.relation(x) == SATISFIED
+                for x in incompatibility.terms.values()
+            )
+        if not conflict:
+            self.decisions += 1
+            self.solution.decide(term.package, 1 << index)
+            # a pick without alternatives is only undone by earlier choices
+            if (
+                term.package != ROOT
+                and term.mask & self._full(term.package) == 1 << index
+                and term.package not in self.__prefetched
+            ):
+                self.__prefetched[term.package] = 1 << index
+                self.provider.prefetch(
+                    self._project(term.package),
+                    self.versions[term.package][index],
+                )
+        return term.package
+
+    def resolve(self, requirements: Iterable[str]) -> Dict[str, str]:
+        """Get selected version of every required package."""
+        self.__requirements = list(requirements)
+        root = Incompatibility([Term(ROOT, 1, False)], 'root')
+        self._add_incompatibility(root)
+        package: Optional[str] = ROOT
+        while package is not None:
+            self._propagate(package)
+            package = self._decide()
+        return {
+            self.names[k]: self.versions[k][v.bit_length() - 1]
+            for k, v in self.solution.decisions.items()
+            if k != ROOT and k not in self.__extras
+        }
+
+    # Reporting
+    def _describe_incompatibility(
+        self, incompatibility: Incompatibility
+    ) -> str:
+        """Get readable statement of an incompatibility."""
+        terms = list(incompatibility.terms.values())
+        if incompatibility.cause == 'dependency':
+            depender = next(x for x in terms if x.positive)
+            return (
+                f"{self.describe_term(depender)} depends on "
+                f"{incompatibility.dependency}"
+            )
+        if incompatibility.cause == 'no_versions':
+            return f"no versions of {self.describe_term(terms[0])} exist"
+        if not terms:
+            return 'version solving failed'
+        if len(terms) == 1:
+            term = terms[0]
+            if term.package == ROOT:
+                return 'the project cannot be resolved'
+            if term.positive:
+                return f"{self.describe_term(term)} is forbidden"
+            return f"{self.describe_term(term)} is required"
+        positive = [x for x in terms if x.positive]
+        negative = [x for x in terms if not x.positive]
+        if len(positive) == 1 and len(negative) == 1:
+            return (
+                f"{self.describe_term(positive[0])} requires "
+                f"{self.describe_term(negative[0].negate())}"
+            )
+        if not negative:
+            return (
+                ' and '.join(self.describe_term(x) for x in positive)
+                + ' are incompatible'
+            )
+        return (
+            'one of '
+            + ', '.join(self.describe_term(x) for x in terms)
+            + ' must be false'
+        )
+
+    def _summarize(self, incompatibility: Incompatibility) -> Optional[str]:
+        """Summarize versions of a package forbidden by one requirement."""
+        if len(incompatibility.terms) != 1 or not incompatibility.causes:
+            return None
+        package, term = next(iter(incompatibility.terms.items()))
+        dependencies = set()
+        pending = [incompatibility]
+        while pending:
+            current = pending.pop()
+            if len(current.terms) != 1 or package not in current.terms:
+                return None
+            if current.cause == 'dependency':
+                dependencies.add(current.dependency)
+            elif current.causes:
+                pending.extend(current.causes)
+            else:
+                return None
+        if len(dependencies) != 1:
+            return None
+        return (
+            f"Because {self.describe_term(term)} depends on "
+            f"{dependencies.pop()}, "
+            f"{self._describe_incompatibility(incompatibility)}."
+        )
+
+    def explain(self, incompatibility: Incompatibility) -> str:
+        """Get numbered derivation of why resolution failed."""
+        lines: List[str] = []
+        numbers: Dict[int, int] = {}
+
+        def reference(cause: Incompatibility) -> str:
+            statement = self._describe_incompatibility(cause)
+            if id(cause) in numbers:
+                return f"{statement} [{numbers[id(cause)]}]"
+            return statement
+
+        def visit(current: Incompatibility) -> None:
+            summary = self._summarize(current)
+            if summary:
+                lines.append(summary)
+                numbers[id(current)] = len(lines)
+                return
+            for cause in current.causes:
+                if cause.causes and id(cause) not in numbers:
+                    visit(cause)
+            first, second = current.causes
+            lines.append(
+                f"Because {reference(first)} and {reference(second)}, "
+                f"{self._describe_incompatibility(current)}."
+            )
+            numbers[id(current)] = len(lines)
+
+        if incompatibility.causes:
+            visit(incompatibility)
+            body = [f"[{i}] {x}" for i, x in enumerate(lines, 1)]
+        else:
+            body = [self._describe_incompatibility(incompatibility) + '.']
+        return '\n'.join(['version solving failed:'] + body)
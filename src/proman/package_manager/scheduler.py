@@ -0,0 +1,177 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Schedule network and disk work with adaptive concurrency."""
+
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from contextvars import Context, copy_context
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+log = logging.getLogger(__name__)
+
+__all__: List[str] = ['AdaptiveLimiter', 'Scheduler']
+
+DEFAULT_NETWORK = {'min': 2, 'max': 32, 'initial': 8}
+DEFAULT_DISK = {'min': 1, 'max': os.cpu_count() or 1, 'initial': 4}
+
+
+def _enter_context(context: Context) -> None:
+    """Set context variables of a worker thread from a caller."""
+    for variable, value in context.items():
+        variable.set(value)
+
+
+class AdaptiveLimiter:
+    """Limit concurrent work adapting to observed latency.
+
+    The limit grows additively while latency and throughput hold and is
+    cut multiplicatively when they degrade.
+    """
+
+    def __init__(
+        self,
+        minimum: int = 1,
+        maximum: int = 8,
+        initial: Optional[int] = None,
+        **options: Any,
+    ) -> None:
+        """Initialize limiter within bounds."""
+        if minimum < 1 or maximum < minimum:
+            raise ValueError(f"invalid concurrency bounds {minimum}-{maximum}")
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = min(max(initial or minimum, minimum), maximum)
+        self.tolerance: float = options.get('tolerance', 1.5)
+        self.backoff: float = options.get('backoff', 0.5)
+        self.clock: Callable[[], float] = options.get('clock', time.monotonic)
+        self.__condition = threading.Condition()
+        self.__active = 0
+        self.__baseline: Optional[float] = None
+        self.__throughput: Optional[float] = None
+        self.__window_start = self.clock()
+        self.__latencies: List[float] = []
+        self.__errors = 0
+
+    @property
+    def active(self) -> int:
+        """Get number of slots in use."""
+        return self.__active
+
+    def acquire(self) -> None:
+        """Wait for a free slot."""
+        with self.__condition:
+            while self.__active >= self.limit:
+                self.__condition.wait()
+            self.__active += 1
+
+    def release(self) -> None:
+        """Return slot to the limiter."""
+        with self.__condition:
+            self.__active -= 1
+            self.__condition.notify()
+
+    @contextmanager
+    def slot(self) -> Iterator[None]:
+        """Run work within a slot recording its outcome."""
+        self.acquire()
+        start = self.clock()
+        error = False
+        try:
+            yield
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.release()
+            self.record(self.clock() - start, error)
+
+    def record(self, latency: float, error: bool = False) -> None:
+        """Record completed work adjusting the limit once per window."""
+        with self.__condition:
+            self.__latencies.append(latency)
+            self.__errors += int(error)
+            # a window spans one completion per slot at the current limit
+            if len(self.__latencies) >= self.limit:
+                self._adjust()
+
+    def _adjust(self) -> None:
+        """Tune limit from the completed window."""
+        now = self.clock()
+        elapsed = max(now - self.__window_start, 1e-9)
+        mean = sum(self.__latencies) / len(self.__latencies)
+        throughput = len(self.__latencies) / elapsed
+        previous = self.limit
+
+        if self.__baseline is None or mean < self.__baseline:
+            self.__baseline = mean
+        else:
+            # drift slowly so a permanently slower backend is accepted
+            self.__baseline += (mean - self.__baseline) * 0.1
+
+        if self.__errors or mean > self.__baseline * self.tolerance:
+            self.limit = max(self.minimum, int(self.limit * self.backoff))
+        elif (
+            self.__throughput is None or throughput >= self.__throughput * 0.9
+        ):
+            self.limit = min(self.maximum, self.limit + 1)
+
+        if self.limit != previous:
+            log.debug(f"concurrency limit {previous} -> {self.limit}")
+            self.__condition.notify_all()
+        self.__throughput = throughput
+        self.__window_start = now
+        self.__latencies = []
+        self.__errors = 0
+
+
+class Scheduler:
+    """Provide separate network and disk limiters over one worker pool."""
+
+    def __init__(
+        self,
+        network: Optional[Dict[str, int]] = None,
+        disk: Optional[Dict[str, int]] = None,
+    ) -> None:
+        """Initialize scheduler from concurrency settings."""
+        self.network = self._get_limiter(DEFAULT_NETWORK, network)
+        self.disk = self._get_limiter(DEFAULT_DISK, disk)
+
+    @staticmethod
+    def _get_limiter(
+        defaults: Dict[str, int], settings: Optional[Dict[str, int]]
+    ) -> AdaptiveLimiter:
+        """Create limiter from settings overriding defaults."""
+        bounds = {**defaults, **(settings or {})}
+        maximum = max(bounds['max'], bounds['min'])
+        return AdaptiveLimiter(
+            bounds['min'],
+            maximum,
+            min(bounds['initial'], maximum),
+        )
+
+    @classmethod
+    def from_config(cls, settings: Optional[Dict[str, Any]]) -> 'Scheduler':
+        """Create scheduler from the tool.proman.concurrency table."""
+        settings = settings or {}
+        return cls(network=settings.get('network'), disk=settings.get('disk'))
+
+    @property
+    def max_workers(self) -> int:
+        """Get worker count able to saturate both limiters."""
+        return self.network.maximum + self.disk.maximum
+
+    def executor(self) -> ThreadPoolExecutor:
+        """Get worker pool whose concurrency is gated by the limiters.
+
+        Workers start with the context variables of the caller such as
+        the deadline of the running command.
+        """
+        return ThreadPoolExecutor(
+            max_workers=self.max_workers,
+            initializer=_enter_context,
+            initargs=(copy_context(),),
+        )
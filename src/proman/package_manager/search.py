@@ -0,0 +1,216 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Provide local searchable index of package names."""
+
+import json
+import logging
+import os
+import re
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from heapq import nsmallest
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+log = logging.getLogger(__name__)
+
+__all__: List[str] = ['SearchIndex', 'normalize']
+
+INDEX_FORMAT = 1
+NGRAM_SIZE = 3
+SEARCH_FIELDS = ('summary', 'keywords', 'classifiers')
+
+_separators = re.compile(r'[-_.]+')
+
+
+def normalize(name: str) -> str:
+    """Normalize project name for matching."""
+    return _separators.sub('-', name).lower()
+
+
+def ngrams(text: str) -> List[str]:
+    """Get distinct padded n-grams of text."""
+    padded = f"^{text}$"
+    grams = set()
+    for start in range(max(len(padded) - NGRAM_SIZE + 1, 1)):
+        end = start + NGRAM_SIZE
+        grams.add(padded[start:end])
+    return sorted(grams)
+
+
+class SearchIndex:
+    """Manage n-gram and prefix index of project names."""
+
+    def __init__(self, path: str) -> None:
+        """Initialize search index stored in a directory."""
+        self.path = path
+        self.etag: Optional[str] = None
+        self.last_serial: Optional[int] = None
+        self.keys: List[str] = []
+        self.serials: List[int] = []
+        self.display: Dict[str, str] = {}
+        self.details: Dict[str, Dict[str, Any]] = {}
+        self.__offsets: Dict[str, Tuple[int, int]] = {}
+        self.__postings = array('I')
+
+    @property
+    def metadata_path(self) -> str:
+        """Get path of project metadata."""
+        return os.path.join(self.path, 'projects.json')
+
+    @property
+    def postings_path(self) -> str:
+        """Get path of n-gram postings."""
+        return os.path.join(self.path, 'ngrams.bin')
+
+    def __len__(self) -> int:
+        """Get number of indexed projects."""
+        return len(self.keys)
+
+    def load(self) -> bool:
+        """Load index from disk."""
+        try:
+            with open(self.metadata_path) as f:
+                data = json.load(f)
+            with open(self.postings_path, 'rb') as f:
+                postings = array('I')
+                postings.frombytes(f.read())
+        except (OSError, ValueError):
+            return False
+        if data.get('format') != INDEX_FORMAT:
+            return False
+        self.etag = data['etag']
+        self.last_serial = data['last_serial']
+        self.keys = data['keys']
+        self.serials = data['serials']
+        self.display = data['display']
+        self.details = data['details']
+        self.__offsets = {k: tuple(v) for k, v in data['ngrams'].items()}
+        self.__postings = postings
+        return True
+
+    def save(self) -> None:
+        """Write index to disk atomically."""
+        os.makedirs(self.path, exist_ok=True)
+        data = {
+            'format': INDEX_FORMAT,
+            'etag': self.etag,
+            'last_serial': self.last_serial,
+            'keys': self.keys,
+            'serials': self.serials,
+            'display': self.display,
+            'details': self.details,
+            'ngrams': self.__offsets,
+        }
+        for filepath, mode, content in (
+            (self.postings_path, 'wb', self.__postings.tobytes()),
+            (self.metadata_path, 'w', json.dumps(data)),
+        ):
+            tmp_path = f"{filepath}.{os.getpid()}.tmp"
+            with open(tmp_path, mode) as f:
+                f.write(content)
+            os.replace(tmp_path, filepath)
+
+    def _build_ngrams(self) -> None:
+        """Build n-gram postings of the sorted project keys."""
+        grams: Dict[str, array] = {}
+        for position, key in enumerate(self.keys):
+            for gram in ngrams(key):
+                if gram not in grams:
+                    grams[gram] = array('I')
+                grams[gram].append(position)
+        self.__offsets = {}
+        self.__postings = array('I')
+        for gram, positions in grams.items():
+            self.__offsets[gram] = (len(self.__postings), len(positions))
+            self.__postings.extend(positions)
+
+    def update(
+        self,
+        projects: Iterable[Tuple[str, int]],
+        etag: Optional[str] = None,
+        last_serial: Optional[int] = None,
+    ) -> int:
+        """Merge project listing into the index returning changed count."""
+        previous = dict(zip(self.keys, self.serials))
+        listing = sorted((normalize(x), x, y) for x, y in projects)
+        self.keys = [x[0] for x in listing]
+        self.serials = [x[2] for x in listing]
+        # only names differing from their key are stored for display
+        self.display = {x[0]: x[1] for x in listing if x[0] != x[1]}
+
+        # cached details are stale once a project changes or is removed
+        current = dict(zip(self.keys, self.serials))
+        changed = {k for k, v in current.items() if previous.get(k) != v}
+        changed |= set(previous) - set(current)
+        self.details = {
+            k: v for k, v in self.details.items() if k not in changed
+        }
+        self.etag = etag
+        self.last_serial = last_serial
+        if set(previous) != set(current) or not self.__offsets:
+            self._build_ngrams()
+        return len(changed)
+
+    def set_details(self, name: str, **details: Any) -> None:
+        """Cache searchable fields of a project."""
+        self.details[normalize(name)] = {
+            k: v for k, v in details.items() if v is not None
+        }
+
+    def _prefix(self, text: str) -> range:
+        """Get positions of keys starting with text."""
+        start = bisect_left(self.keys, text)
+        end = bisect_left(self.keys, text + '\uffff')
+        return range(start, end)
+
+    def _fuzzy(self, text: str) -> Counter:
+        """Get positions sharing n-grams with text."""
+        counts: Counter = Counter()
+        for gram in ngrams(text):
+            if gram in self.__offsets:
+                offset, size = self.__offsets[gram]
+                end = offset + size
+                counts.update(self.__postings[offset:end])
+        return counts
+
+    def query(self, text: str, limit: int = 20) -> List[str]:
+        """Get project names matching text by prefix and similarity."""
+        text = normalize(text)
+        if not text:
+            return []
+        # shorter keys are closer prefix matches
+        ranked = nsmallest(
+            limit, self._prefix(text), key=lambda x: (len(self.keys[x]), x)
+        )
+        if len(ranked) < limit:
+            grams = len(ngrams(text))
+            threshold = max(1, grams // 2)
+            scores: Dict[int, float] = {}
+            for position, count in self._fuzzy(text).items():
+                if count >= threshold and position not in ranked:
+                    # dice coefficient where a padded key has len(key) grams
+                    scores[position] = (
+                        2 * count / (grams + len(self.keys[position]))
+                    )
+            ranked += nsmallest(
+                limit - len(ranked),
+                scores,
+                key=lambda x: (-scores[x], len(self.keys[x]), x),
+            )
+        return [self.display.get(self.keys[x], self.keys[x]) for x in ranked]
+
+    def matches(self, name: str, **fields: Optional[str]) -> bool:
+        """Check cached fields of a project contain each value."""
+        details = self.details.get(normalize(name), {})
+        for field, value in fields.items():
+            if value is None:
+                continue
+            content = details.get(field)
+            if content is None:
+                return False
+            if isinstance(content, list):
+                content = ' '.join(content)
+            if value.lower() not in str(content).lower():
+                return False
+        return True
@@ -0,0 +1,534 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Share one connection pool and coalesce identical index requests."""
+
+import logging
+import os
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
+from contextlib import contextmanager
+from contextvars import ContextVar, copy_context
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    Optional,
+    Set,
+    Tuple,
+)
+from urllib.parse import urljoin, urlsplit
+
+import urllib3
+
+from . import config
+from .budget import Budget
+from .exception import PackageManagerNetwork
+
+if TYPE_CHECKING:
+    from distlib.locators import Locator
+
+log = logging.getLogger(__name__)
+
+__all__: List[str] = [
+    'LatencyTracker',
+    'Response',
+    'Session',
+    'get_locator',
+    'session',
+]
+
+# requests without side effects can be shared by concurrent callers
+COALESCED_METHODS = ('GET', 'HEAD')
+# stalled reads are hedged or fail rather than being sent again
+RETRIES = urllib3.Retry(connect=2, read=False, redirect=5)
+HEDGE_PERCENTILE = 0.95
+# parser and its arguments applied to a body while it streams
+Parser = Tuple[Callable[..., Any], Tuple[Any, ...]]
+# settings a caller may apply to its own requests on the shared session
+SCOPED_SETTINGS = (
+    'timeout',
+    'mirrors',
+    'hedge_percentile',
+    'memory',
+    'maxsize',
+)
+
+
+class Response:
+    """Provide read or parsed response that coalesced callers can share."""
+
+    __slots__ = ('url', 'status', 'headers', 'data', 'parsed', '__weakref__')
+
+    def __init__(
+        self,
+        url: str,
+        status: int,
+        headers: Mapping[str, str],
+        data: bytes,
+        parsed: Any = None,
+    ) -> None:
+        """Initialize response."""
+        self.url = url
+        self.status = status
+        self.headers = headers
+        self.data = data
+        self.parsed = parsed
+
+    def stream(self, amt: int = config.CHUNK_SIZE) -> Iterator[bytes]:
+        """Iterate body in chunks for incremental parsers."""
+        for start in range(0, len(self.data), amt):
+            end = start + amt
+            yield self.data[start:end]
+
+    def release_conn(self) -> None:
+        """Keep interface of streamed responses."""
+
+    # urllib response interface used by distlib locators
+    def read(self) -> bytes:
+        """Get body."""
+        return self.data
+
+    def info(self) -> Mapping[str, str]:
+        """Get headers."""
+        return self.headers
+
+    def geturl(self) -> str:
+        """Get requested URL."""
+        return self.url
+
+
+class LatencyTracker:
+    """Track recent latencies of a host to estimate percentiles."""
+
+    def __init__(self, size: int = 200, minimum: int = 20) -> None:
+        """Initialize tracker estimating once minimum samples are seen."""
+        self.minimum = minimum
+        self.__samples: Deque[float] = deque(maxlen=size)
+        self.__lock = threading.Lock()
+
+    def record(self, seconds: float) -> None:
+        """Record latency of a completed request."""
+        with self.__lock:
+            self.__samples.append(seconds)
+
+    def percentile(self, fraction: float) -> Optional[float]:
+        """Get latency below which a fraction of requests completed."""
+        with self.__lock:
+            if len(self.__samples) < self.minimum:
+                return None
+            samples = sorted(self.__samples)
+        return samples[min(int(len(samples) * fraction), len(samples) - 1)]
+
+
+class _Call:
+    """Track request in flight shared by coalesced callers."""
+
+    __slots__ = ('event', 'response', 'error')
+
+    def __init__(self) -> None:
+        """Initialize pending call."""
+        self.event = threading.Event()
+        self.response: Optional[Response] = None
+        self.error: Optional[BaseException] = None
+
+
+class Session:
+    """Send index requests over shared keep-alive connections.
+
+    Identical GET and HEAD requests already in flight are coalesced so
+    concurrent callers share a single network round trip. Index requests
+    slower than the usual latency of the index are duplicated to mirrors
+    and the first answer wins.
+    """
+
+    def __init__(self, maxsize: int = 16, **options: Any) -> None:
+        """Initialize session with a pool of connections per host.
+
+        Parameters
+        ----------
+        maxsize: int
+            pooled connections per host
+        timeout: float, optional
+            seconds a single request may take
+        mirrors: List[str], optional
+            secondary indexes receiving hedged requests
+        hedge_percentile: float, optional
+            latency percentile after which a request is hedged
+
+        """
+        self.timeout: Optional[float] = options.pop(
+            'timeout', config.REQUEST_TIMEOUT
+        )
+        self.mirrors: List[str] = list(
+            options.pop('mirrors', config.MIRROR_URLS)
+        )
+        self.hedge_percentile: float = options.pop(
+            'hedge_percentile', HEDGE_PERCENTILE
+        )
+        self.pool = urllib3.PoolManager(
+            maxsize=maxsize, retries=RETRIES, **options
+        )
+        self.__pool_options = options
+        # callers needing more connections than the pool get their own
+        self.__pools: Dict[int, urllib3.PoolManager] = {}
+        self.__settings: ContextVar[Dict[str, Any]] = ContextVar('settings')
+        # bodies held by live responses count against the memory budget
+        self.memory = Budget('memory')
+        # monotonic time by which the command of each calling context must
+        # finish so concurrent commands keep their own deadlines
+        self.__deadline: ContextVar[Optional[float]] = ContextVar(
+            'deadline', default=None
+        )
+        self.requests = 0
+        self.coalesced = 0
+        self.hedged = 0
+        self.__latencies: Dict[str, LatencyTracker] = {}
+        self.__executor: Optional[ThreadPoolExecutor] = None
+        self.__inflight: Dict[Tuple[Any, ...], _Call] = {}
+        self.__lock = threading.Lock()
+
+    @contextmanager
+    def using(self, settings: Optional[Dict[str, Any]]) -> Iterator[None]:
+        """Apply settings to requests of the calling context.
+
+        Parameters
+        ----------
+        settings: Dict[str, Any], optional
+            timeout, mirrors and hedge_percentile of the network table
+            with the memory budget and pooled connections per host of the
+            caller overriding those of the session
+
+        """
+        scoped = dict(self.__settings.get({}))
+        for name, value in (settings or {}).items():
+            if name in SCOPED_SETTINGS:
+                scoped[name] = list(value) if name == 'mirrors' else value
+        token = self.__settings.set(scoped)
+        try:
+            yield
+        finally:
+            self.__settings.reset(token)
+
+    def _get(self, name: str) -> Any:
+        """Get setting of the calling context or of the session."""
+        settings = self.__settings.get({})
+        return settings[name] if name in settings else getattr(self, name)
+
+    def _pool(self) -> urllib3.PoolManager:
+        """Get connection pool sized for the calling context."""
+        maxsize = self.__settings.get({}).get('maxsize')
+        size = self.pool.connection_pool_kw.get('maxsize', 1)
+        if maxsize is None or maxsize <= size:
+            return self.pool
+        with self.__lock:
+            pool = self.__pools.get(maxsize)
+            if pool is None:
+                pool = self.__pools[maxsize] = urllib3.PoolManager(
+                    maxsize=maxsize, retries=RETRIES, **self.__pool_options
+                )
+            return pool
+
+    @property
+    def deadline(self) -> Optional[float]:
+        """Get monotonic time by which requests of the caller must end."""
+        return self.__deadline.get()
+
+    @contextmanager
+    def within(self, seconds: Optional[float]) -> Iterator[None]:
+        """Fail requests of the calling context outstanding after seconds."""
+        deadline = self.deadline
+        if seconds is not None:
+            limit = time.monotonic() + seconds
+            deadline = limit if deadline is None else min(deadline, limit)
+        token = self.__deadline.set(deadline)
+        try:
+            yield
+        finally:
+            self.__deadline.reset(token)
+
+    def _timeout(self, url: str) -> Optional[float]:
+        """Get seconds a request may take within the deadline."""
+        timeout: Optional[float] = self._get('timeout')
+        if self.deadline is None:
+            return timeout
+        remaining = self.deadline - time.monotonic()
+        if remaining <= 0:
+            raise PackageManagerNetwork(f"deadline exceeded before {url}")
+        return remaining if timeout is None else min(timeout, remaining)
+
+    def latency(self, url: str) -> LatencyTracker:
+        """Get latency tracker of the host serving a URL."""
+        host = urlsplit(url).netloc
+        with self.__lock:
+            tracker = self.__latencies.get(host)
+            if tracker is None:
+                tracker = self.__latencies[host] = LatencyTracker()
+            return tracker
+
+    def resize(self, maxsize: int) -> None:
+        """Allow at least maxsize pooled connections per host."""
+        self.pool.connection_pool_kw['maxsize'] = max(
+            self.pool.connection_pool_kw.get('maxsize', 1), maxsize
+        )
+
+    def _send(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[Dict[str, str]],
+        parser: Optional[Parser] = None,
+    ) -> Response:
+        """Send request reading the whole response or parsing its body."""
+        with self.__lock:
+            self.requests += 1
+        start = time.monotonic()
+        memory: Budget = self._get('memory')
+        try:
+            rsp = self._pool().request(
+                method,
+                url,
+                headers=headers,
+                preload_content=False,
+                timeout=self._timeout(url),
+            )
+        except urllib3.exceptions.HTTPError as err:
+            raise PackageManagerNetwork(f"{method} {url}: {err}") from err
+        # parsed bodies are never held beyond the chunk being decoded
+        streamed = parser is not None and rsp.status == 200
+        length = rsp.headers.get('Content-Length')
+        reserved = memory.acquire(
+            int(length) if length and not streamed else config.CHUNK_SIZE
+        )
+        data, parsed = b'', None
+        try:
+            if parser is not None and streamed:
+                parse, args = parser
+                parsed = parse(rsp.stream(config.CHUNK_SIZE), *args)
+                rsp.drain_conn()
+            else:
+                data = rsp.read()
+        except BaseException as err:
+            memory.release(reserved)
+            # a partly read body cannot be left on a pooled connection
+            rsp.close()
+            if isinstance(err, urllib3.exceptions.HTTPError):
+                message = f"{method} {url}: {err}"
+                raise PackageManagerNetwork(message) from err
+            raise
+        finally:
+            rsp.release_conn()
+        if streamed:
+            memory.release(reserved)
+            reserved = 0
+        if rsp.status < 500:
+            self.latency(url).record(time.monotonic() - start)
+        response = Response(url, rsp.status, rsp.headers, data, parsed)
+        if reserved:
+            weakref.finalize(response, memory.release, reserved)
+        return response
+
+    def _alternates(self, url: str) -> List[str]:
+        """Get URLs of the same index resource on mirrors."""
+        index_url = config.INDEX_URL.rstrip('/') + '/'
+        if not url.startswith(index_url):
+            return []
+        start = len(index_url)
+        return [f"{x.rstrip('/')}/{url[start:]}" for x in self._get('mirrors')]
+
+    def _hedge(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[Dict[str, str]],
+        parser: Optional[Parser] = None,
+    ) -> Response:
+        """Send request duplicating it to mirrors when it is slow.
+
+        Mirrors are also tried in turn when the index fails.
+        """
+        alternates = self._alternates(url)
+        if not alternates:
+            return self._send(method, url, headers, parser)
+        with self.__lock:
+            if self.__executor is None:
+                self.__executor = ThreadPoolExecutor(
+                    thread_name_prefix='hedge'
+                )
+            executor = self.__executor
+        delay = self.latency(url).percentile(self._get('hedge_percentile'))
+        # duplicates are bound by the deadline of the caller
+        context = copy_context()
+        pending: Set['Future[Response]'] = {
+            executor.submit(
+                context.copy().run, self._send, method, url, headers, parser
+            )
+        }
+        failure: Optional[Response] = None
+        error: Optional[BaseException] = None
+        while pending:
+            done, pending = wait(
+                pending,
+                timeout=delay if alternates else None,
+                return_when=FIRST_COMPLETED,
+            )
+            for future in done:
+                try:
+                    rsp = future.result()
+                except PackageManagerNetwork as err:
+                    error = err
+                    continue
+                if rsp.status < 500:
+                    # slower duplicates finish in the background
+                    return rsp
+                failure = rsp
+            if alternates:
+                if not done:
+                    log.debug(f"hedging {url} after {delay:.3f}s")
+                    with self.__lock:
+                        self.hedged += 1
+                pending.add(
+                    executor.submit(
+                        context.copy().run,
+                        self._send,
+                        method,
+                        alternates.pop(0),
+                        headers,
+                        parser,
+                    )
+                )
+        if failure is not None:
+            return failure
+        assert error is not None
+        raise error
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Response:
+        """Send request sharing responses of identical ones in flight."""
+        if method not in COALESCED_METHODS:
+            return self._send(method, url, headers)
+        return self._coalesce(method, url, headers)
+
+    def parse(
+        self,
+        url: str,
+        parser: Callable[..., Any],
+        *args: Any,
+        headers: Optional[Dict[str, str]] = None,
+    ) -> Response:
+        """Send GET request parsing a successful body as it streams.
+
+        The body is never read in full. Callers parsing the same document
+        with the same parser and arguments share the parsed result.
+
+        Parameters
+        ----------
+        url: str
+            document to be requested
+        parser: Callable[..., Any]
+            parser of the body chunks stored as the response parsed value
+        args: Any
+            hashable arguments passed to the parser after the chunks
+        headers: Dict[str, str], optional
+            request headers
+
+        """
+        return self._coalesce('GET', url, headers, (parser, args))
+
+    def _coalesce(
+        self,
+        method: str,
+        url: str,
+        headers: Optional[Dict[str, str]],
+        parser: Optional[Parser] = None,
+    ) -> Response:
+        """Send request unless an identical one is in flight."""
+        key = (method, url, tuple(sorted((headers or {}).items())), parser)
+        with self.__lock:
+            call = self.__inflight.get(key)
+            leader = call is None
+            if call is None:
+                call = self.__inflight[key] = _Call()
+        if not leader:
+            call.event.wait()
+            with self.__lock:
+                self.coalesced += 1
+            if call.error is not None:
+                raise call.error
+            assert call.response is not None
+            return call.response
+        try:
+            call.response = self._hedge(method, url, headers, parser)
+            return call.response
+        except BaseException as err:
+            call.error = err
+            raise
+        finally:
+            with self.__lock:
+                del self.__inflight[key]
+            call.event.set()
+
+    def download(self, url: str, filepath: str) -> None:
+        """Stream a file to disk over the shared pool."""
+        tmp_path = f"{filepath}.{os.getpid()}.{threading.get_ident()}.part"
+        try:
+            rsp = self._pool().request(
+                'GET', url, preload_content=False, timeout=self._timeout(url)
+            )
+            try:
+                if rsp.status != 200:
+                    message = f"{url} returned {rsp.status}"
+                    raise PackageManagerNetwork(message)
+                with open(tmp_path, 'wb') as f:
+                    for chunk in rsp.stream(config.CHUNK_SIZE):
+                        f.write(chunk)
+                os.replace(tmp_path, filepath)
+            finally:
+                rsp.release_conn()
+        except urllib3.exceptions.HTTPError as err:
+            raise PackageManagerNetwork(f"GET {url}: {err}") from err
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def open(self, url: Any, timeout: Optional[float] = None) -> Response:
+        """Open URL like a urllib opener so distlib shares the session."""
+        headers = None
+        if hasattr(url, 'full_url'):
+            headers = dict(url.header_items())
+            url = url.full_url
+        rsp = self.request('GET', url, headers)
+        if rsp.status >= 400:
+            raise PackageManagerNetwork(f"{url} returned {rsp.status}")
+        return rsp
+
+
+session = Session()
+_locator: Optional['Locator'] = None
+
+
+def get_locator() -> 'Locator':
+    """Get distlib locator of the package index using the shared session."""
+    global _locator
+    if _locator is None:
+        from distlib.locators import PyPIJSONLocator
+
+        _locator = PyPIJSONLocator(urljoin(config.INDEX_URL, 'pypi'))
+        _locator.opener = session
+    return _locator
@@ -0,0 +1,104 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Provide memoized version and specifier evaluation."""
+
+import re
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from packaging.requirements import Requirement
+from packaging.specifiers import InvalidSpecifier, SpecifierSet
+from packaging.version import InvalidVersion, Version
+
+__all__: List[str] = [
+    'VersionSet',
+    'get_specifier',
+    'parse_requirement',
+    'parse_version',
+    'split_requirement',
+]
+
+CACHE_SIZE = 65536
+
+_requirement = re.compile(r'^([a-zA-Z0-9][a-zA-Z0-9._-]*)([<!~=>].*)$')
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_version(version: str) -> Optional[Version]:
+    """Get parsed version or None when not PEP 440 compliant."""
+    try:
+        return Version(version)
+    except InvalidVersion:
+        return None
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def get_specifier(specifier: str) -> SpecifierSet:
+    """Get compiled specifier set."""
+    try:
+        return SpecifierSet('' if specifier == '*' else specifier)
+    except InvalidSpecifier:
+        return SpecifierSet(f"=={specifier}")
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def split_requirement(requirement: str) -> Tuple[str, str]:
+    """Get package name and version specifier from requirement."""
+    match = _requirement.match(requirement.replace(' ', ''))
+    if match:
+        return match.group(1), match.group(2)
+    return requirement.strip(), '*'
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def parse_requirement(requirement: str) -> Requirement:
+    """Get parsed requirement which must be treated as read only."""
+    return Requirement(requirement)
+
+
+class VersionSet:
+    """Provide vectorized filtering over candidate versions of a project."""
+
+    __slots__ = ('__versions', '__results')
+
+    def __init__(self, versions: Iterable[str]) -> None:
+        """Initialize version set parsing each version once."""
+        parsed = [(parse_version(x), x) for x in versions]
+        self.__versions: List[Tuple[Version, str]] = sorted(
+            ((v, x) for v, x in parsed if v is not None), reverse=True
+        )
+        self.__results: Dict[Tuple[str, bool], Tuple[str, ...]] = {}
+
+    def __len__(self) -> int:
+        """Get number of valid versions."""
+        return len(self.__versions)
+
+    def filter(
+        self, specifier: str = '*', prereleases: bool = False
+    ) -> Tuple[str, ...]:
+        """Get versions matching a specifier newest first."""
+        key = (specifier, prereleases)
+        if key not in self.__results:
+            spec = get_specifier(specifier)
+            allowed = prereleases or spec.prereleases
+            matches = tuple(
+                x
+                for v, x in self.__versions
+                if (allowed or not v.is_prerelease)
+                and spec.contains(v, prereleases=True)
+            )
+            # follow PEP 440 by falling back to prereleases when nothing else
+            if not matches and not allowed:
+                matches = tuple(
+                    x
+                    for v, x in self.__versions
+                    if spec.contains(v, prereleases=True)
+                )
+            self.__results[key] = matches
+        return self.__results[key]
+
+    def best_match(
+        self, specifier: str = '*', prereleases: bool = False
+    ) -> Optional[str]:
+        """Get newest version matching a specifier."""
+        return next(iter(self.filter(specifier, prereleases)), None)
@@ -0,0 +1,122 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Check pypackages matches the lock without reading distributions.
+
+Only the standard library is used so application entry points can
+confirm their environment at startup.
+"""
+
+import hashlib
+import json
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+from . import config
+
+__all__: List[str] = [
+    'clear_stamp',
+    'get_dist_dir',
+    'is_current',
+    'read_stamp',
+    'stamp_status',
+    'write_stamp',
+]
+
+STAMP_FORMAT = 1
+STAMP_FILENAME = 'proman-stamp.json'
+# entries of these directories change with any install or removal
+STAMP_DIRS = ('lib', 'lib64', 'bin')
+# created ahead so importing top level modules does not touch lib
+CACHE_DIRS = ('lib', 'lib64')
+
+CURRENT = 'current'
+MISSING = 'missing'
+LOCK_CHANGED = 'lock changed'
+ENVIRONMENT_CHANGED = 'environment changed'
+
+
+def get_dist_dir(pypackages_dir: Optional[str] = None) -> str:
+    """Get versioned pypackages directory of the running interpreter."""
+    version = f"{sys.version_info.major}.{sys.version_info.minor}"
+    return os.path.join(pypackages_dir or config.pypackages_dir, version)
+
+
+def hash_lock(lock_path: str) -> Optional[str]:
+    """Get content hash of a lock file."""
+    try:
+        with open(lock_path, 'rb') as f:
+            return hashlib.sha256(f.read()).hexdigest()
+    except OSError:
+        return None
+
+
+def _get_mtimes(dist_dir: str) -> Dict[str, int]:
+    """Get modification times of installation directories."""
+    mtimes = {}
+    for subdir in STAMP_DIRS:
+        path = os.path.join(dist_dir, subdir)
+        try:
+            mtimes[subdir] = os.stat(path).st_mtime_ns
+        except OSError:
+            continue
+    return mtimes
+
+
+def read_stamp(dist_dir: str) -> Optional[Dict[str, Any]]:
+    """Read stamp of an environment."""
+    try:
+        with open(os.path.join(dist_dir, STAMP_FILENAME)) as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return data if data.get('format') == STAMP_FORMAT else None
+
+
+def write_stamp(dist_dir: str, lock_path: str, **fields: Any) -> None:
+    """Stamp environment as matching the current content of a lock."""
+    for subdir in CACHE_DIRS:
+        path = os.path.join(dist_dir, subdir)
+        if os.path.isdir(path):
+            os.makedirs(os.path.join(path, '__pycache__'), exist_ok=True)
+    data = {
+        'format': STAMP_FORMAT,
+        'lock': hash_lock(lock_path),
+        'mtimes': _get_mtimes(dist_dir),
+        **fields,
+    }
+    filepath = os.path.join(dist_dir, STAMP_FILENAME)
+    tmp_path = f"{filepath}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(data, f)
+    os.replace(tmp_path, filepath)
+
+
+def clear_stamp(dist_dir: str) -> None:
+    """Remove stamp before the environment is changed."""
+    try:
+        os.remove(os.path.join(dist_dir, STAMP_FILENAME))
+    except FileNotFoundError:
+        pass
+
+
+def stamp_status(dist_dir: str, lock_path: str) -> str:
+    """Compare stamp with the lock and installation directories."""
+    stamp = read_stamp(dist_dir)
+    if stamp is None:
+        return MISSING
+    if stamp.get('mtimes') != _get_mtimes(dist_dir):
+        return ENVIRONMENT_CHANGED
+    if stamp.get('lock') != hash_lock(lock_path):
+        return LOCK_CHANGED
+    return CURRENT
+
+
+def is_current(
+    dist_dir: Optional[str] = None, lock_path: Optional[str] = None
+) -> bool:
+    """Check environment of the project matches its lock."""
+    return (
+        stamp_status(dist_dir or get_dist_dir(), lock_path or config.lock_path)
+        == CURRENT
+    )
@@ -0,0 +1,285 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Share unpacked distributions between environments using links."""
+
+import base64
+import hashlib
+import json
+import logging
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional
+
+from packaging.utils import canonicalize_name
+
+from .exception import PackageManagerStore
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None  # type: ignore
+
+log = logging.getLogger(__name__)
+
+__all__: List[str] = ['PackageStore']
+
+STORE_FORMAT = 1
+ENTRY_FILENAME = 'proman-store.json'
+CHUNK_SIZE = 1024 * 1024
+LAYOUT = {
+    'purelib': 'lib',
+    'platlib': 'lib64',
+    'scripts': 'bin',
+    'headers': 'src',
+    'data': 'share',
+}
+# linux ioctl cloning file extents on copy-on-write filesystems
+FICLONE = 0x40049409
+
+
+def _clone_file(src: str, dst: str) -> None:
+    """Link file by hardlink, reflink or copy whichever is possible."""
+    try:
+        os.link(src, dst)
+        return
+    except OSError:
+        pass
+    if fcntl is not None:
+        try:
+            with open(src, 'rb') as s, open(dst, 'wb') as d:
+                fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+            shutil.copymode(src, dst)
+            return
+        except OSError:
+            pass
+    shutil.copy2(src, dst)
+
+
+def _record_hash(content: bytes) -> str:
+    """Get RECORD style digest of content."""
+    digest = hashlib.sha256(content).digest()
+    return 'sha256=' + base64.urlsafe_b64encode(digest).decode().rstrip('=')
+
+
+class PackageStore:
+    """Manage global store of unpacked distributions with refcounts."""
+
+    def __init__(self, path: str) -> None:
+        """Initialize store in a directory."""
+        self.path = path
+        self.__lock = threading.RLock()
+
+    @staticmethod
+    def get_key(name: str, version: str, filename: str, sha256: str) -> str:
+        """Get store key of a wheel from name, version, tag and digest."""
+        stem = filename[:-4] if filename.endswith('.whl') else filename
+        tag = '-'.join(stem.split('-')[-3:])
+        return f"{canonicalize_name(name)}-{version}-{tag}-{sha256[:16]}"
+
+    def _entry_path(self, key: str, python: str) -> str:
+        """Get path of a store entry for a python version."""
+        return os.path.join(self.path, python, key)
+
+    def _refs_path(self, key: str, python: str) -> str:
+        """Get path of the references to a store entry."""
+        return f"{self._entry_path(key, python)}.refs"
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Serialize reference updates between threads and processes."""
+        with self.__lock:
+            os.makedirs(self.path, exist_ok=True)
+            with open(os.path.join(self.path, '.lock'), 'w') as f:
+                if fcntl is not None:
+                    fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    if fcntl is not None:
+                        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def _read_refs(self, key: str, python: str) -> List[str]:
+        """Read environments referencing a store entry."""
+        try:
+            with open(self._refs_path(key, python)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return []
+
+    def _write_refs(self, key: str, python: str, refs: List[str]) -> None:
+        """Write environments referencing a store entry atomically."""
+        filepath = self._refs_path(key, python)
+        tmp_path = f"{filepath}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(sorted(set(refs)), f)
+        os.replace(tmp_path, filepath)
+
+    def get_entry(self, key: str, python: str) -> Optional[Dict[str, Any]]:
+        """Get metadata of a stored distribution."""
+        try:
+            with open(
+                os.path.join(self._entry_path(key, python), ENTRY_FILENAME)
+            ) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            return None
+        return entry if entry.get('format') == STORE_FORMAT else None
+
+    def find(self, name: str, version: str, python: str) -> Optional[str]:
+        """Find store key of an unpacked distribution."""
+        prefix = f"{canonicalize_name(name)}-{version}-"
+        directory = os.path.join(self.path, python)
+        if os.path.isdir(directory):
+            for key in sorted(os.listdir(directory)):
+                if key.startswith(prefix) and self.get_entry(key, python):
+                    return key
+        return None
+
+    def add(
+        self,
+        filepath: str,
+        key: str,
+        python: str,
+        sha256: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        """Unpack wheel into the store once."""
+        entry = self.get_entry(key, python)
+        if entry:
+            return entry
+        if sha256:
+            digest = hashlib.sha256()
+            with open(filepath, 'rb') as f:
+                for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                    digest.update(chunk)
+            if digest.hexdigest() != sha256:
+                raise PackageManagerStore(f"digest mismatch for {filepath}")
+
+        # only unpacking needs distlib
+        from distlib.scripts import ScriptMaker
+        from distlib.wheel import Wheel
+
+        stage = f"{self._entry_path(key, python)}.{os.getpid()}.part"
+        shutil.rmtree(stage, ignore_errors=True)
+        paths = {k: os.path.join(stage, v) for k, v in LAYOUT.items()}
+        paths['prefix'] = stage
+        dist = Wheel(filepath).install(
+            paths=paths, maker=ScriptMaker(None, None)
+        )
+        files = []
+        for root, dirs, filenames in os.walk(stage):
+            dirs.sort()
+            for filename in sorted(filenames):
+                files.append(
+                    os.path.relpath(os.path.join(root, filename), stage)
+                )
+        entry = {
+            'format': STORE_FORMAT,
+            'name': dist.name,
+            'version': dist.version,
+            'prefix': stage,
+            'dist_info': os.path.relpath(dist.path, stage),
+            'files': files,
+        }
+        with open(os.path.join(stage, ENTRY_FILENAME), 'w') as f:
+            json.dump(entry, f)
+        try:
+            os.rename(stage, self._entry_path(key, python))
+        except OSError:
+            # another process stored the same distribution first
+            shutil.rmtree(stage, ignore_errors=True)
+            return self.get_entry(key, python) or entry
+        log.info(f"stored {key}")
+        return entry
+
+    def _write_shared(
+        self, entry: Dict[str, Any], source: str, dist_dir: str
+    ) -> None:
+        """Rewrite prefix dependent metadata for an environment."""
+        dist_info = os.path.join(dist_dir, entry['dist_info'])
+        shared_path = os.path.join(dist_info, 'SHARED')
+        record_path = os.path.join(dist_info, 'RECORD')
+        source_shared = os.path.join(source, entry['dist_info'], 'SHARED')
+        if not os.path.exists(source_shared):
+            return
+        with open(source_shared, 'rb') as f:
+            content = f.read().replace(
+                entry['prefix'].encode(), dist_dir.encode()
+            )
+        for filepath in (shared_path, record_path):
+            if os.path.exists(filepath):
+                os.remove(filepath)
+        with open(shared_path, 'wb') as f:
+            f.write(content)
+
+        relpath = os.path.relpath(shared_path, os.path.dirname(dist_info))
+        line = f"{relpath},{_record_hash(content)},{len(content)}"
+        with open(os.path.join(source, entry['dist_info'], 'RECORD')) as f:
+            lines = [
+                line if x.split(',', 1)[0] == relpath else x
+                for x in f.read().splitlines()
+            ]
+        with open(record_path, 'w') as f:
+            f.write('\n'.join(lines) + '\n')
+
+    def link(self, key: str, dist_dir: str) -> str:
+        """Assemble stored distribution into environment returning its path."""
+        python = os.path.basename(os.path.normpath(dist_dir))
+        entry = self.get_entry(key, python)
+        if entry is None:
+            raise KeyError(key)
+        source = self._entry_path(key, python)
+        for relpath in entry['files']:
+            target = os.path.join(dist_dir, relpath)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            if os.path.lexists(target):
+                os.remove(target)
+            _clone_file(os.path.join(source, relpath), target)
+        self._write_shared(entry, source, dist_dir)
+        with self._locked():
+            refs = self._read_refs(key, python)
+            self._write_refs(key, python, refs + [os.path.abspath(dist_dir)])
+        return os.path.join(dist_dir, entry['dist_info'])
+
+    def release(self, key: str, dist_dir: str) -> int:
+        """Drop reference of an environment returning remaining count."""
+        python = os.path.basename(os.path.normpath(dist_dir))
+        with self._locked():
+            refs = [
+                x
+                for x in self._read_refs(key, python)
+                if x != os.path.abspath(dist_dir)
+            ]
+            self._write_refs(key, python, refs)
+        return len(refs)
+
+    def collect(self) -> List[str]:
+        """Remove entries no longer referenced by any environment."""
+        removed: List[str] = []
+        if not os.path.isdir(self.path):
+            return removed
+        with self._locked():
+            for python in sorted(os.listdir(self.path)):
+                directory = os.path.join(self.path, python)
+                if not os.path.isdir(directory):
+                    continue
+                for key in sorted(os.listdir(directory)):
+                    entry = self.get_entry(key, python)
+                    if entry is None:
+                        continue
+                    # environments deleted outside the tool drop their refs
+                    refs = [
+                        x
+                        for x in self._read_refs(key, python)
+                        if os.path.isdir(os.path.join(x, entry['dist_info']))
+                    ]
+                    if refs:
+                        self._write_refs(key, python, refs)
+                        continue
+                    shutil.rmtree(self._entry_path(key, python))
+                    if os.path.exists(self._refs_path(key, python)):
+                        os.remove(self._refs_path(key, python))
+                    removed.append(key)
+        log.info(f"collected {len(removed)} store entries")
+        return removed
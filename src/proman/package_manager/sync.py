@@ -0,0 +1,230 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Reconcile installed distributions with the lock as one transaction."""
+
+import json
+import logging
+import os
+import shutil
+import threading
+from typing import Any, Dict, Iterable, List, Mapping, Tuple
+
+from packaging.utils import canonicalize_name
+
+from .installed import InstalledRecord
+from .specifiers import parse_version
+
+log = logging.getLogger(__name__)
+
+__all__: List[str] = [
+    'SyncPlan',
+    'SyncTransaction',
+    'plan_sync',
+    'record_paths',
+]
+
+TRANSACTION_DIR = '.proman-sync'
+JOURNAL_FILENAME = 'journal.json'
+LIB_DIRS = ('lib', 'lib64')
+
+
+class SyncPlan:
+    """Provide difference between installed distributions and the lock."""
+
+    def __init__(
+        self,
+        installs: List[Dict[str, Any]],
+        removals: List[InstalledRecord],
+        swaps: List[Tuple[InstalledRecord, Dict[str, Any]]],
+        unchanged: int = 0,
+    ) -> None:
+        """Initialize sync plan."""
+        self.installs = installs
+        self.removals = removals
+        self.swaps = swaps
+        self.unchanged = unchanged
+
+    def __bool__(self) -> bool:
+        """Check plan changes the environment."""
+        return bool(self.installs or self.removals or self.swaps)
+
+    @property
+    def locks(self) -> List[Dict[str, Any]]:
+        """Get locks that must be installed."""
+        return self.installs + [x[1] for x in self.swaps]
+
+    @property
+    def records(self) -> List[InstalledRecord]:
+        """Get installed records that must be removed."""
+        return self.removals + [x[0] for x in self.swaps]
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Get serializable plan."""
+        return {
+            'install': [
+                {'name': x['name'], 'version': str(x['version'])}
+                for x in self.installs
+            ],
+            'remove': [
+                {'name': x.name, 'version': x.version} for x in self.removals
+            ],
+            'swap': [
+                {
+                    'name': x.name,
+                    'installed': x.version,
+                    'locked': str(y['version']),
+                }
+                for x, y in self.swaps
+            ],
+            'unchanged': self.unchanged,
+        }
+
+
+def _same_version(installed: str, locked: str) -> bool:
+    """Compare versions by PEP 440 equality."""
+    parsed = parse_version(installed)
+    return (
+        parsed == parse_version(locked) if parsed is not None else False
+    ) or installed == locked
+
+
+def plan_sync(
+    installed: Mapping[str, InstalledRecord],
+    locks: Iterable[Dict[str, Any]],
+) -> SyncPlan:
+    """Compute installs, removals and version swaps to match locks."""
+    locked = {canonicalize_name(x['name']): x for x in locks}
+    installs, swaps = [], []
+    unchanged = 0
+    for key, lock in sorted(locked.items()):
+        record = installed.get(key)
+        if record is None:
+            installs.append(lock)
+        elif _same_version(record.version, str(lock['version'])):
+            unchanged += 1
+        else:
+            swaps.append((record, lock))
+    removals = [v for k, v in sorted(installed.items()) if k not in locked]
+    return SyncPlan(installs, removals, swaps, unchanged)
+
+
+def record_paths(dist_dir: str, record: InstalledRecord) -> List[str]:
+    """Get installed files of a record relative to the pypackages directory."""
+    dist_info = next(
+        (x for x in record.files if x.endswith('.dist-info/RECORD')), None
+    )
+    subdir = next(
+        (
+            x
+            for x in LIB_DIRS
+            if dist_info
+            and os.path.exists(os.path.join(dist_dir, x, dist_info))
+        ),
+        LIB_DIRS[0],
+    )
+    paths = []
+    for relpath in record.files:
+        path = os.path.normpath(os.path.join(subdir, relpath))
+        # never touch files outside of the environment
+        if not path.startswith(os.pardir):
+            paths.append(path)
+    return paths
+
+
+class SyncTransaction:
+    """Move replaced files aside so a failed sync can be rolled back.
+
+    A journal is written before the environment changes so a sync that
+    was interrupted is rolled back the next time one begins.
+    """
+
+    def __init__(self, dist_dir: str) -> None:
+        """Initialize transaction for a versioned pypackages directory."""
+        self.dist_dir = dist_dir
+        self.path = os.path.join(dist_dir, TRANSACTION_DIR)
+        self.backup = os.path.join(self.path, 'backup')
+        self.journal = os.path.join(self.path, JOURNAL_FILENAME)
+        self.moved: List[str] = []
+        self.added: List[str] = []
+        self.__lock = threading.Lock()
+
+    def _write_journal(self) -> None:
+        """Write journal atomically."""
+        tmp_path = f"{self.journal}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'moved': self.moved, 'added': self.added}, f)
+        os.replace(tmp_path, self.journal)
+
+    def _prune(self, relpaths: Iterable[str]) -> None:
+        """Remove directories emptied by moving files."""
+        parents = {os.path.dirname(x) for x in relpaths}
+        for parent in sorted(parents, key=len, reverse=True):
+            # top level directories such as lib and bin are kept
+            while os.path.dirname(parent):
+                path = os.path.join(self.dist_dir, parent)
+                if not os.path.isdir(path):
+                    parent = os.path.dirname(parent)
+                    continue
+                entries = os.listdir(path)
+                # bytecode is regenerated so it does not need a backup
+                if entries == ['__pycache__']:
+                    shutil.rmtree(os.path.join(path, '__pycache__'))
+                elif entries:
+                    break
+                os.rmdir(path)
+                parent = os.path.dirname(parent)
+
+    def begin(self) -> None:
+        """Start transaction recovering an interrupted one."""
+        if os.path.exists(self.journal):
+            log.warning('rolling back interrupted sync')
+            with open(self.journal) as f:
+                data = json.load(f)
+            self.moved, self.added = data['moved'], data['added']
+            self.rollback()
+        shutil.rmtree(self.path, ignore_errors=True)
+        os.makedirs(self.backup)
+        self._write_journal()
+
+    def remove(self, relpaths: Iterable[str]) -> None:
+        """Move files of a replaced distribution into the backup."""
+        relpaths = [
+            x
+            for x in relpaths
+            if os.path.lexists(os.path.join(self.dist_dir, x))
+        ]
+        with self.__lock:
+            self.moved += relpaths
+            self._write_journal()
+        for relpath in relpaths:
+            target = os.path.join(self.backup, relpath)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            os.replace(os.path.join(self.dist_dir, relpath), target)
+        self._prune(relpaths)
+
+    def add(self, relpaths: Iterable[str]) -> None:
+        """Record files created by an installed distribution."""
+        with self.__lock:
+            self.added += relpaths
+            self._write_journal()
+
+    def rollback(self) -> None:
+        """Restore environment to its state before the transaction."""
+        for relpath in self.added:
+            path = os.path.join(self.dist_dir, relpath)
+            if os.path.lexists(path) and not os.path.isdir(path):
+                os.remove(path)
+        self._prune(self.added)
+        for relpath in self.moved:
+            source = os.path.join(self.backup, relpath)
+            if os.path.lexists(source):
+                target = os.path.join(self.dist_dir, relpath)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(source, target)
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.moved, self.added = [], []
+
+    def commit(self) -> None:
+        """Discard backup of replaced files."""
+        shutil.rmtree(self.path, ignore_errors=True)
+        self.moved, self.added = [], []
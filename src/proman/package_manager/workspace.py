@@ -0,0 +1,99 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Install member projects of a workspace in one run."""
+
+import glob
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Dict, Iterable, List, Optional
+
+from . import config, get_package_manager, get_tool_settings
+from .exception import PackageManagerConfig
+from .package_manager import PackageManager
+from .prefetch import Prefetcher
+from .scheduler import Scheduler
+
+log = logging.getLogger(__name__)
+
+__all__: List[str] = ['Workspace', 'discover_members']
+
+
+def discover_members(base_dir: str, patterns: Iterable[str]) -> List[str]:
+    """Find project directories matching workspace member patterns."""
+    members = set()
+    for pattern in patterns:
+        for path in glob.glob(os.path.join(base_dir, pattern)):
+            if os.path.isfile(os.path.join(path, 'pyproject.toml')):
+                members.add(os.path.realpath(path))
+    return sorted(members)
+
+
+class Workspace:
+    """Manage member projects sharing resolution, downloads and limits."""
+
+    def __init__(
+        self,
+        base_dir: str,
+        members: Iterable[str],
+        concurrency: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        """Initialize workspace of member project directories."""
+        self.base_dir = base_dir
+        self.scheduler = Scheduler.from_config(concurrency)
+        # artifacts are keyed by digest so each is downloaded only once
+        self.prefetcher = Prefetcher(
+            os.path.join(config.CACHE_DIR, 'artifacts'),
+            PackageManager.download,
+            self.scheduler,
+        )
+        self.managers: Dict[str, PackageManager] = {
+            x: get_package_manager(
+                x, scheduler=self.scheduler, prefetcher=self.prefetcher
+            )
+            for x in members
+        }
+
+    @classmethod
+    def from_config(cls, base_dir: Optional[str] = None) -> 'Workspace':
+        """Create workspace from the tool.proman.workspace table."""
+        base_dir = base_dir or config.base_dir
+        pyproject_path = os.path.join(base_dir, 'pyproject.toml')
+        settings = get_tool_settings(pyproject_path)
+        workspace = settings.get('workspace')
+        if not workspace or not workspace.get('members'):
+            raise PackageManagerConfig(
+                f"no workspace members configured in {pyproject_path}"
+            )
+        members = discover_members(base_dir, workspace['members'])
+        return cls(base_dir, members, settings.get('concurrency'))
+
+    def install(self, **options: Any) -> Dict[str, Optional[str]]:
+        """Install every member returning errors by member.
+
+        Locks are only written once every member has been installed.
+        """
+        errors: Dict[str, Optional[str]] = {}
+        try:
+            with ThreadPoolExecutor(
+                max_workers=max(1, len(self.managers))
+            ) as executor:
+                jobs = {
+                    executor.submit(x.install, save=False, **options): k
+                    for k, x in self.managers.items()
+                }
+                for future in as_completed(jobs):
+                    member = jobs[future]
+                    try:
+                        future.result()
+                        errors[member] = None
+                    except Exception as err:
+                        log.error(f"{member}: {err}")
+                        errors[member] = str(err)
+        finally:
+            self.prefetcher.close()
+
+        for member, manager in self.managers.items():
+            if errors.get(member) is None:
+                manager.save()
+        return errors
@@ -0,0 +1,175 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+"""Install pure Python wheels intact to be imported from the archive.
+
+Only the dist-info directory, data files and scripts are extracted. The
+wheel itself is placed in the library directory, recorded in RECORD and
+mapped by the import finder so its modules load through zipimport.
+"""
+
+import io
+import logging
+import os
+import posixpath
+import shutil
+import tempfile
+import zipfile
+from importlib.machinery import EXTENSION_SUFFIXES
+from typing import Any, Dict, List, Optional
+
+from distlib.database import InstalledDistribution
+from distlib.scripts import ScriptMaker
+from distlib.util import read_exports
+from distlib.wheel import Wheel
+
+log = logging.getLogger(__name__)
+
+__all__: List[str] = ['get_unsafe_reason', 'install_zipped']
+
+# data schemes that can be extracted beside an intact wheel
+DATA_SCHEMES = ('scripts', 'data', 'headers')
+# sources using these names expect to live on the filesystem
+UNSAFE_NAMES = (b'__file__',)
+SCRIPT_OPTIONS: Dict[str, Optional[Dict[str, Any]]] = {
+    'console_scripts': None,
+    'gui_scripts': {'gui': True},
+}
+
+
+def _prefix(wheel: Wheel) -> str:
+    """Get name and version prefix of wheel metadata directories."""
+    return f"{wheel.name}-{wheel.version}"
+
+
+def get_unsafe_reason(wheel: Wheel) -> Optional[str]:
+    """Get why a wheel cannot run zipped or None when it can."""
+    if wheel.abi != ['none'] or wheel.arch != ['any']:
+        return 'not a pure Python wheel'
+    if 'py3' not in wheel.pyver:
+        return 'not a pure Python wheel'
+    if wheel.info.get('Root-Is-Purelib', 'true').lower() != 'true':
+        return 'installs into platlib'
+    data_prefix = f"{_prefix(wheel)}.data/"
+    start = len(data_prefix)
+    packages = set()
+    initialized = set()
+    with zipfile.ZipFile(os.path.join(wheel.dirname, wheel.filename)) as zf:
+        for name in zf.namelist():
+            if name.startswith(data_prefix):
+                scheme = name[start:].split('/', 1)[0]
+                if scheme not in DATA_SCHEMES:
+                    return f"installs {scheme} files"
+                continue
+            top, _, rest = name.partition('/')
+            if top.endswith('.dist-info') or name.endswith('/'):
+                continue
+            if name.endswith('.pth') and not rest:
+                return 'uses path configuration files'
+            if name.endswith(tuple(EXTENSION_SUFFIXES)):
+                return 'contains extension modules'
+            if rest:
+                packages.add(top)
+                if rest == '__init__.py':
+                    initialized.add(top)
+            if name.endswith('.py'):
+                source = zf.read(name)
+                if any(x in source for x in UNSAFE_NAMES):
+                    return f"{name} locates files by __file__"
+    if packages - initialized:
+        # zipimport does not assemble namespace packages
+        return 'contains namespace packages'
+    return None
+
+
+def _read_scripts(data: bytes) -> Dict[str, List[str]]:
+    """Read script specifications of entry points by section."""
+    exports = read_exports(io.BytesIO(data))
+    scripts: Dict[str, List[str]] = {}
+    for section in SCRIPT_OPTIONS:
+        for entry in exports.get(section, {}).values():
+            spec = f"{entry.name} = {entry.prefix}:{entry.suffix}"
+            if entry.flags:
+                spec += f" [{','.join(entry.flags)}]"
+            scripts.setdefault(section, []).append(spec)
+    return scripts
+
+
+def _extract(zf: zipfile.ZipFile, name: str, filepath: str) -> str:
+    """Extract archive member to a path."""
+    os.makedirs(os.path.dirname(filepath), exist_ok=True)
+    with zf.open(name) as src, open(filepath, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    return filepath
+
+
+def install_zipped(
+    wheel: Wheel, paths: Dict[str, str], maker: ScriptMaker
+) -> InstalledDistribution:
+    """Install verified wheel leaving its modules in the archive.
+
+    Parameters
+    ----------
+    wheel: Wheel
+        wheel accepted by get_unsafe_reason
+    paths: Dict[str, str]
+        installation scheme of the environment
+    maker: ScriptMaker
+        maker of entry point and data scripts
+
+    """
+    libdir = paths['purelib']
+    prefix = _prefix(wheel)
+    info_dir = f"{prefix}.dist-info"
+    data_prefix = f"{prefix}.data/"
+    source = os.path.join(wheel.dirname, wheel.filename)
+    target = os.path.join(libdir, wheel.filename)
+    start = len(data_prefix)
+    outfiles = [target]
+    workdir = tempfile.mkdtemp()
+    try:
+        tmp_path = f"{target}.{os.getpid()}.tmp"
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, target)
+        maker.source_dir = workdir
+        with zipfile.ZipFile(source) as zf:
+            for name in zf.namelist():
+                if name.endswith('/'):
+                    continue
+                if name.startswith(f"{info_dir}/"):
+                    if name != f"{info_dir}/RECORD":
+                        outfiles.append(
+                            _extract(zf, name, os.path.join(libdir, name))
+                        )
+                elif name.startswith(data_prefix):
+                    scheme, relpath = name[start:].split('/', 1)
+                    if scheme == 'scripts':
+                        # shebangs are rewritten for the environment
+                        filename = posixpath.basename(relpath)
+                        _extract(zf, name, os.path.join(workdir, filename))
+                        maker.target_dir = paths['scripts']
+                        outfiles.extend(maker.make(filename))
+                    else:
+                        filepath = os.path.join(
+                            paths[scheme], *relpath.split('/')
+                        )
+                        outfiles.append(_extract(zf, name, filepath))
+            entry_points = f"{info_dir}/entry_points.txt"
+            if entry_points in zf.namelist():
+                scripts = _read_scripts(zf.read(entry_points))
+            else:
+                scripts = {}
+        maker.target_dir = paths['scripts']
+        for section, specs in scripts.items():
+            for spec in specs:
+                outfiles.extend(maker.make(spec, SCRIPT_OPTIONS[section]))
+        dist = InstalledDistribution(os.path.join(libdir, info_dir))
+        dist.write_installed_files(outfiles, paths['prefix'])
+    except BaseException:
+        for filepath in outfiles:
+            if os.path.isfile(filepath):
+                os.remove(filepath)
+        raise
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    log.debug(f"installed {wheel.filename} zipped")
+    return dist
@@ -0,0 +1,255 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# type: ignore
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+
+import pytest
+
+from proman.package_manager import config, package_manager
+from proman.package_manager.aio import AsyncPackageManager
+from proman.package_manager.aiosession import AsyncSession
+from proman.package_manager.distributions import LocalDistributionPath
+from proman.package_manager.package_manager import PackageManager
+
+GRAPH = {
+    'a': {'1.0': ['b>=1.0']},
+    'b': {'1.0': [], '2.0': ['c']},
+    'c': {'1.0': []},
+}
+
+
+def content(filename):
+    return f"artifact {filename}".encode('utf-8')
+
+
+@pytest.fixture
+def index():
+    """Serve JSON API index counting requests and connections."""
+    counts = {'requests': 0, 'connections': 0, 'files': []}
+    lock = threading.Lock()
+
+    def release(host, name, version):
+        filename = f"{name}-{version}-py3-none-any.whl"
+        # c is published with a digest that does not match its content
+        data = content(filename if name != 'c' else 'tampered')
+        return [
+            {
+                'filename': filename,
+                'url': f"http://{host}/files/{filename}",
+                'packagetype': 'bdist_wheel',
+                'digests': {'sha256': hashlib.sha256(data).hexdigest()},
+                'size': len(data),
+            }
+        ]
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            with lock:
+                counts['connections'] += 1
+
+        def send_body(self, body, chunked=False):
+            self.send_response(200)
+            if chunked:
+                self.send_header('Transfer-Encoding', 'chunked')
+                self.end_headers()
+                for start in range(0, len(body), 7):
+                    end = start + 7
+                    piece = body[start:end]
+                    self.wfile.write(b'%x\r\n%s\r\n' % (len(piece), piece))
+                self.wfile.write(b'0\r\n\r\n')
+            else:
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        def do_GET(self):
+            with lock:
+                counts['requests'] += 1
+            parts = self.path.strip('/').split('/')
+            if parts[0] == 'redirect':
+                self.send_response(302)
+                self.send_header('Location', '/chunked')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+            elif parts[0] == 'chunked':
+                self.send_body(json.dumps(GRAPH).encode('utf-8'), True)
+            elif parts[0] == 'files':
+                with lock:
+                    counts['files'].append(parts[1])
+                self.send_body(content(parts[1]), True)
+            elif parts[0] == 'pypi' and parts[1] in GRAPH:
+                name = parts[1]
+                versions = GRAPH[name]
+                latest = parts[2] if len(parts) == 4 else max(versions)
+                data = {
+                    'info': {
+                        'name': name,
+                        'version': latest,
+                        'requires_dist': versions[latest],
+                    },
+                    'releases': {
+                        v: release(self.headers['Host'], name, v)
+                        for v in versions
+                    },
+                }
+                self.send_body(json.dumps(data).encode('utf-8'))
+            else:
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    host, port = httpd.server_address
+    yield f"http://{host}:{port}/", counts
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_session_coalesces_thousands(index):
+    url, counts = index
+
+    async def main():
+        session = AsyncSession(maxsize=16)
+        same = await asyncio.gather(
+            *(session.request('GET', f"{url}pypi/a/json") for _ in range(2000))
+        )
+        distinct = await asyncio.gather(
+            *(
+                session.request('GET', f"{url}pypi/{x}/json")
+                for x in range(500)
+            )
+        )
+        session.close()
+        return session, same, distinct
+
+    session, same, distinct = asyncio.run(main())
+    assert all(x is same[0] for x in same)
+    assert session.coalesced == 1999
+    assert {x.status for x in distinct} == {404}
+    assert counts['requests'] == 501
+    assert counts['connections'] <= 16
+
+
+def test_session_chunked_redirect(index, tmp_path):
+    url, counts = index
+
+    async def main():
+        session = AsyncSession()
+        rsp = await session.request('GET', f"{url}redirect")
+        await session.download(f"{url}files/x.whl", str(tmp_path / 'x.whl'))
+        session.close()
+        return rsp
+
+    rsp = asyncio.run(main())
+    assert rsp.status == 200
+    assert rsp.geturl() == f"{url}chunked"
+    assert json.loads(rsp.data) == GRAPH
+    assert (tmp_path / 'x.whl').read_bytes() == content('x.whl')
+    assert counts['connections'] == 1
+
+
+def test_resolve_and_download(index, tmp_path, monkeypatch):
+    url, counts = index
+    monkeypatch.setattr(config, 'INDEX_URL', url)
+    monkeypatch.setattr(config, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(package_manager, '_metadata_cache', {})
+    manager = PackageManager(
+        None,
+        LocalDistributionPath(
+            name='example', pypackages_dir=str(tmp_path / '__pypackages__')
+        ),
+        None,
+        store=False,
+        prefetch=False,
+    )
+    events = []
+
+    async def main():
+        async with AsyncPackageManager(manager, events.append) as aio:
+            candidates = await aio.resolve('a')
+            results = await aio.download(*candidates, dest=str(tmp_path))
+            info = await aio.info('a', 'info')
+        return candidates, results, info
+
+    candidates, results, info = asyncio.run(main())
+    assert {(x.name, x.version) for x in candidates} == {
+        ('a', '1.0'),
+        ('b', '2.0'),
+        ('c', '1.0'),
+    }
+    assert info['version'] == '1.0'
+    results = {x.name: x for x in results}
+    assert results['a'].ok and results['b'].ok
+    assert os.path.isfile(results['a'].path)
+    assert results['c'].error == 'digest mismatch for c-1.0-py3-none-any.whl'
+    assert not os.path.exists(tmp_path / 'c-1.0-py3-none-any.whl')
+    stages = [(x.stage, x.name) for x in events]
+    assert sorted(stages[:3]) == [
+        ('resolved', 'a'),
+        ('resolved', 'b'),
+        ('resolved', 'c'),
+    ]
+    assert sorted(stages[3:]) == [
+        ('downloaded', 'a'),
+        ('downloaded', 'b'),
+        ('failed', 'c'),
+    ]
+    assert events[-1].completed == events[-1].total == 3
+
+
+def test_install_skips_stored_within_budgets(index, tmp_path, monkeypatch):
+    url, counts = index
+    monkeypatch.setattr(config, 'INDEX_URL', url)
+    monkeypatch.setattr(config, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(package_manager, '_metadata_cache', {})
+    manager = PackageManager(
+        None,
+        LocalDistributionPath(
+            name='example', pypackages_dir=str(tmp_path / '__pypackages__')
+        ),
+        None,
+        prefetch=False,
+        budgets={'temp_disk': 64, 'open_files': 4},
+    )
+    installs = {}
+
+    def perform_install(candidate, **options):
+        # downloads are held on temp disk until installed
+        assert manager.budgets.temp_disk.used > 0 or not options['reserved']
+        installs[candidate.name] = options['reserved']
+        return SimpleNamespace(path=candidate.name)
+
+    monkeypatch.setattr(
+        manager, '_is_stored', lambda candidate, **_: candidate.name == 'b'
+    )
+    monkeypatch.setattr(manager, '_perform_install', perform_install)
+
+    async def main():
+        async with AsyncPackageManager(manager) as aio:
+            return await aio.install('a', save=False)
+
+    results = {x.name: x for x in asyncio.run(main())}
+    assert results['a'].ok and results['b'].ok and not results['c'].ok
+    # stored wheels are linked without downloading their artifact
+    assert sorted(counts['files']) == [
+        'a-1.0-py3-none-any.whl',
+        'c-1.0-py3-none-any.whl',
+    ]
+    assert installs == {'a': True, 'b': False}
+    assert manager.budgets.temp_disk.used == 0
+    assert manager.budgets.open_files.used == 0
+    assert 0 < manager.budgets.temp_disk.peak <= 64
@@ -0,0 +1,172 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# type: ignore
+
+import gc
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from proman.package_manager import config
+from proman.package_manager.budget import Budget, Budgets, parse_size
+from proman.package_manager.distributions import LocalDistributionPath
+from proman.package_manager.package_manager import PackageManager
+from proman.package_manager.session import Session
+from proman.package_manager.session import session as shared
+
+
+def test_parse_size():
+    assert parse_size(None) is None
+    assert parse_size(42) == 42
+    assert parse_size('512') == 512
+    assert parse_size('64k') == 64 * 1024
+    assert parse_size('512M') == 512 * 1024 * 1024
+    assert parse_size('2GiB') == 2 * 1024**3
+    with pytest.raises(ValueError):
+        parse_size('lots')
+
+
+def test_budget_applies_backpressure():
+    budget = Budget('temp disk', 100)
+    running = []
+    lock = threading.Lock()
+
+    def work(amount):
+        with budget.reserve(amount):
+            with lock:
+                running.append(budget.used)
+            time.sleep(0.05)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(work, [40] * 8))
+    assert budget.peak == 80
+    assert budget.used == 0
+    assert max(running) <= 100
+
+
+def test_budget_clamps_oversized_requests():
+    budget = Budget('temp disk', 100)
+    with budget.reserve(500) as reserved:
+        assert reserved == 100
+    assert budget.used == 0
+    # unlimited budgets never wait
+    with Budget('memory').reserve(1 << 40) as reserved:
+        assert reserved == 0
+
+
+def test_budgets_from_config():
+    budgets = Budgets.from_config(
+        {'temp_disk': '1M', 'memory': '64k', 'open_files': 16}
+    )
+    assert budgets.temp_disk.capacity == 1 << 20
+    assert budgets.memory.capacity == 64 << 10
+    assert budgets.open_files.capacity == 16
+    assert budgets.bounded
+    assert not Budgets.from_config(None).bounded
+
+
+def test_session_releases_memory(monkeypatch):
+    body = b'x' * 1000
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    host, port = httpd.server_address
+    try:
+        session = Session()
+        session.memory = Budget('memory', 4096)
+        rsp = session.request('GET', f"http://{host}:{port}/a")
+        assert rsp.data == body
+        assert session.memory.used == len(body)
+        del rsp
+        gc.collect()
+        assert session.memory.used == 0
+
+        # managers charge responses to their own budget
+        memory = Budget('memory', 4096)
+        with session.using({'memory': memory, 'timeout': 5}):
+            rsp = session.request('GET', f"http://{host}:{port}/b")
+            assert (memory.used, session.memory.used) == (len(body), 0)
+        del rsp
+        gc.collect()
+        assert memory.used == 0
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def test_managers_keep_their_settings(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'CACHE_DIR', str(tmp_path / 'cache'))
+    defaults = (shared.memory, shared.timeout, list(shared.mirrors))
+    managers = [
+        PackageManager(
+            None,
+            LocalDistributionPath(
+                name=str(x), pypackages_dir=str(tmp_path / str(x))
+            ),
+            None,
+            store=False,
+            prefetch=False,
+            budgets={'memory': memory},
+            network={'timeout': timeout, 'mirrors': ['http://mirror']},
+            concurrency={'network': {'max': 64}},
+        )
+        for x, (memory, timeout) in enumerate([('1M', 5), ('2M', 10)])
+    ]
+    # constructing managers leaves the shared session untouched
+    assert (shared.memory, shared.timeout, list(shared.mirrors)) == defaults
+
+    def settings(manager):
+        with shared.using(manager.session_settings):
+            return (
+                shared._get('memory').capacity,
+                shared._get('timeout'),
+                shared._get('mirrors'),
+                shared._pool() is not shared.pool,
+            )
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        results = list(executor.map(settings, managers))
+    assert results == [
+        (1 << 20, 5, ['http://mirror'], True),
+        (2 << 20, 10, ['http://mirror'], True),
+    ]
+    assert shared._get('memory') is shared.memory
+
+
+def test_uninstall_uses_manager_settings(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'CACHE_DIR', str(tmp_path / 'cache'))
+    manager = PackageManager(
+        None,
+        LocalDistributionPath(
+            name='example', pypackages_dir=str(tmp_path / '__pypackages__')
+        ),
+        None,
+        store=False,
+        prefetch=False,
+        network={'timeout': 7},
+    )
+    seen = []
+
+    def get_removals(packages, dev=False):
+        seen.append((shared._get('timeout'), shared.deadline is not None))
+        return []
+
+    monkeypatch.setattr(manager, '_get_removals', get_removals)
+    manager.uninstall('example', deadline=5)
+    assert seen == [(7, True)]
+    assert shared.deadline is None
@@ -0,0 +1,101 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# type: ignore
+
+import os
+import shutil
+from types import SimpleNamespace
+
+import pytest
+
+from proman.package_manager import stamp
+from proman.package_manager.bundle import (
+    create_bundle,
+    read_index,
+    restore_bundle,
+)
+from proman.package_manager.distributions import LocalDistributionPath
+from proman.package_manager.exception import PackageManagerBundle
+from proman.package_manager.package_manager import PackageManager
+
+from ..utils import TempDistributionPath
+
+archive = os.path.join(
+    os.path.dirname(__file__), '..', 'distributions', 'pypackages.zip'
+)
+locks = [{'name': 'urllib3', 'version': '1.26.4', 'digests': []}]
+
+
+def test_bundle_restore(tmp_path):
+    with TempDistributionPath(archive) as temp_path:
+        dist_dir = os.path.join(temp_path, '3.8')
+        bundle = create_bundle(dist_dir, str(tmp_path / 'env.zip'), locks)
+        index = read_index(bundle)
+        assert index['locks'] == [{'name': 'urllib3', 'version': '1.26.4'}]
+        assert not any('__pycache__' in x for x in index['files'])
+
+        restored = tmp_path / 'restored' / '3.8'
+        wheels = restore_bundle(bundle, str(restored), locks, max_workers=4)
+        assert wheels == []
+        for arcname in index['files']:
+            relpath = arcname.split('/', 1)[1]
+            with open(os.path.join(dist_dir, relpath), 'rb') as f:
+                original = f.read()
+            assert (restored / relpath).read_bytes() == original
+
+
+def test_bundle_lock_mismatch(tmp_path):
+    with TempDistributionPath(archive) as temp_path:
+        dist_dir = os.path.join(temp_path, '3.8')
+        bundle = create_bundle(dist_dir, str(tmp_path / 'env.zip'), locks)
+    with pytest.raises(PackageManagerBundle):
+        restore_bundle(
+            bundle,
+            str(tmp_path / 'restored' / '3.8'),
+            [{'name': 'urllib3', 'version': '2.0.0'}],
+        )
+    # trees are only usable by the Python they were installed for
+    with pytest.raises(PackageManagerBundle, match='Python 3.8'):
+        restore_bundle(bundle, str(tmp_path / 'restored' / '3.9'), locks)
+
+
+def test_bundle_install(tmp_path):
+    distribution_path = LocalDistributionPath(
+        name='example', pypackages_dir=str(tmp_path / '__pypackages__')
+    )
+    dist_dir = distribution_path.dist_dir
+    wheel_dir = tmp_path / 'wheels'
+    wheel_dir.mkdir()
+    # shipped wheels of unpacked distributions are not installed again
+    (wheel_dir / 'urllib3-1.23-py2.py3-none-any.whl').write_bytes(b'')
+    locks = [
+        {'name': 'urllib3', 'version': '1.23'},
+        {'name': 'MarkupSafe', 'version': '1.1.1'},
+    ]
+    with TempDistributionPath(archive) as temp_path:
+        source = tmp_path / 'source' / os.path.basename(dist_dir)
+        shutil.copytree(os.path.join(temp_path, '3.8'), source)
+        bundle = create_bundle(
+            str(source),
+            str(tmp_path / 'env.zip'),
+            locks,
+            wheels=[str(x) for x in wheel_dir.iterdir()],
+        )
+    lock_path = tmp_path / 'proman-lock.json'
+    lock_path.write_text('{}')
+    manifest = SimpleNamespace(
+        lockfile=SimpleNamespace(
+            get_locks=lambda dev=False: [] if dev else locks
+        )
+    )
+    manager = PackageManager(
+        manifest,
+        distribution_path,
+        None,
+        store=False,
+        prefetch=False,
+        lock_path=str(lock_path),
+    )
+    manager.install(from_bundle=bundle)
+    assert sorted(manager.installed.records) == ['markupsafe', 'urllib3']
+    assert stamp.stamp_status(dist_dir, str(lock_path)) == stamp.CURRENT
@@ -0,0 +1,80 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# type: ignore
+
+import os
+import pathlib
+from types import SimpleNamespace
+
+from proman.package_manager import check
+from proman.package_manager.check import check_environment, hash_file
+from proman.package_manager.distributions import LocalDistributionPath
+from proman.package_manager.package_manager import PackageManager
+
+
+def make_env(dist_dir, count=3):
+    lib = dist_dir / 'lib'
+    (lib / 'demo').mkdir(parents=True)
+    (lib / 'demo-1.0.dist-info').mkdir()
+    rows = []
+    for x in range(count):
+        path = lib / 'demo' / f"m{x}.py"
+        path.write_text(f"VALUE = {x}\n")
+        rows.append(
+            f"demo/m{x}.py,sha256={hash_file(str(path))},{path.stat().st_size}"
+        )
+    rows.append('demo-1.0.dist-info/RECORD,,')
+    (lib / 'demo-1.0.dist-info' / 'RECORD').write_text('\n'.join(rows))
+    return lib
+
+
+def test_check_environment(tmp_path, monkeypatch):
+    lib = make_env(tmp_path)
+    locks = [{'name': 'demo', 'version': '1.0'}]
+    report = check_environment(str(tmp_path), locks)
+    assert report['checked'] == 4
+    assert not any(
+        v for k, v in report.items() if k not in ('checked', 'skipped')
+    )
+
+    (lib / 'demo' / 'm0.py').write_text('VALUE = 9\n')
+    os.remove(lib / 'demo' / 'm1.py')
+    (lib / 'stray.py').write_text('')
+    report = check_environment(
+        str(tmp_path),
+        [{'name': 'demo', 'version': '2.0'}, {'name': 'other', 'version': 1}],
+    )
+    assert report['modified'] == [os.path.join('lib', 'demo', 'm0.py')]
+    assert report['missing'] == [os.path.join('lib', 'demo', 'm1.py')]
+    assert report['extra'] == [os.path.join('lib', 'stray.py')]
+    assert report['not_installed'] == ['other']
+    assert report['version_mismatch'] == [
+        {'name': 'demo', 'locked': '2.0', 'installed': '1.0'}
+    ]
+
+    # hashing is spread over processes for large environments
+    monkeypatch.setattr(check, 'INLINE_LIMIT', 0)
+    report = check_environment(str(tmp_path), incremental=True)
+    assert (report['checked'], report['skipped']) == (2, 2)
+    assert report['modified'] == [os.path.join('lib', 'demo', 'm0.py')]
+
+
+def test_check_production(tmp_path):
+    distribution_path = LocalDistributionPath(
+        name='example', pypackages_dir=str(tmp_path / '__pypackages__')
+    )
+    make_env(pathlib.Path(distribution_path.dist_dir))
+    locks = {
+        False: [{'name': 'demo', 'version': '1.0'}],
+        True: [{'name': 'pytest', 'version': '7.0'}],
+    }
+    manifest = SimpleNamespace(
+        lockfile=SimpleNamespace(get_locks=lambda dev=False: locks[dev])
+    )
+    manager = PackageManager(
+        manifest, distribution_path, None, store=False, prefetch=False
+    )
+    assert manager.check()['not_installed'] == ['pytest']
+    # development packages are not expected in a production install
+    assert manager.check(production=True)['not_installed'] == []
+    assert locks[False] == [{'name': 'demo', 'version': '1.0'}]
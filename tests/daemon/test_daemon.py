@@ -0,0 +1,97 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# type: ignore
+
+import os
+import sys
+import threading
+import time
+
+from proman.package_manager import config, daemon
+from proman.package_manager.distributions import LocalDistributionPath
+from proman.package_manager.package_manager import PackageManager
+
+
+def dispatch(args):
+    if args == ['fail']:
+        print('bad command', file=sys.stderr)
+        sys.exit(2)
+    if args == ['done']:
+        sys.exit()
+    if args == ['abort']:
+        sys.exit('aborted')
+    print(' '.join(args))
+
+
+def test_daemon_round_trip(tmp_path, monkeypatch):
+    monkeypatch.setattr(config, 'CACHE_DIR', str(tmp_path))
+    monkeypatch.delenv('PROMAN_NO_DAEMON', raising=False)
+    assert daemon.call_daemon(['list']) is None
+
+    server = threading.Thread(target=daemon.serve, args=(dispatch,))
+    server.start()
+    for _ in range(100):
+        if os.path.exists(daemon.socket_path()):
+            break
+        time.sleep(0.01)
+
+    try:
+        assert daemon.call_daemon(['list', '--json']) == {
+            'code': 0,
+            'stdout': 'list --json\n',
+            'stderr': '',
+        }
+        response = daemon.call_daemon(['fail'])
+        assert (response['code'], response['stderr']) == (2, 'bad command\n')
+        assert daemon.call_daemon(['done'])['code'] == 0
+        response = daemon.call_daemon(['abort'])
+        assert (response['code'], response['stderr']) == (1, 'aborted\n')
+        # starting the daemon is never forwarded to itself
+        assert daemon.call_daemon(['daemon']) is None
+    finally:
+        assert daemon.stop_daemon()
+        server.join(5)
+    assert not os.path.exists(daemon.socket_path())
+
+
+def test_daemon_reloads_edited_lock(tmp_path, monkeypatch):
+    lock = tmp_path / 'proman-lock.json'
+    monkeypatch.setattr(config, 'pyproject_path', str(tmp_path / 'none'))
+    monkeypatch.setattr(config, 'lock_path', str(lock))
+    monkeypatch.setattr(config, 'pypackages_dir', str(tmp_path))
+    from proman.package_manager import cli
+
+    managers = []
+
+    def get_package_manager():
+        distribution_path = LocalDistributionPath(
+            name='example', pypackages_dir=str(tmp_path / '__pypackages__')
+        )
+        managers.append(
+            PackageManager(
+                None,
+                distribution_path,
+                None,
+                store=False,
+                prefetch=False,
+                lock_path=str(lock),
+            )
+        )
+        return managers[-1]
+
+    served = []
+    monkeypatch.setattr(cli, '_get_package_manager', get_package_manager)
+    monkeypatch.setattr(cli, '_package_manager', get_package_manager())
+    monkeypatch.setattr(cli._daemon, 'serve', served.append)
+    lock.write_text('{}')
+    cli.daemon()
+    dispatch = served[0]
+
+    dispatch(['list'])
+    assert len(managers) == 1
+    lock.write_text('{"locked": 1}')
+    os.utime(lock, ns=(0, 0))
+    dispatch(['list'])
+    assert len(managers) == 2 and cli._package_manager is managers[-1]
+    dispatch(['list'])
+    assert len(managers) == 2
@@ -0,0 +1,52 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# type: ignore
+
+from proman.common.dependencies import DependencyBase
+
+from proman.package_manager.dependencies import Candidate
+from proman.package_manager.metadata import ProjectMetadata, ReleaseFile
+
+metadata = ProjectMetadata(
+    name='example',
+    version='2.0.0',
+    requires_dist=('urllib3>=1.25',),
+    releases={
+        '1.0.0': (
+            ReleaseFile('example-1.0.0.tar.gz', 'https://x/1', 'sdist', 'a'),
+        ),
+        '2.0.0': (
+            ReleaseFile('example-2.0.0.tar.gz', 'https://x/2', 'sdist', 'b'),
+            ReleaseFile(
+                'example-2.0.0-py3-none-any.whl',
+                'https://x/3',
+                'bdist_wheel',
+                'c',
+            ),
+        ),
+    },
+)
+
+
+def test_candidate_from_metadata():
+    candidate = Candidate.from_metadata(metadata, dev=True)
+    assert candidate.name == 'example'
+    assert candidate.version == '2.0.0'
+    assert candidate.requires == ('urllib3>=1.25',)
+    assert candidate.is_dev is True
+    assert candidate.digests == ({'sha256': 'b'}, {'sha256': 'c'})
+    assert candidate.get_release().url == 'https://x/3'
+    assert candidate._distribution is None
+    assert isinstance(candidate, DependencyBase)
+    assert not hasattr(candidate, '__dict__')
+
+
+def test_candidate_lazy_distribution():
+    candidate = Candidate.from_metadata(metadata, '1.0.0')
+    assert candidate.requires == ()
+    assert candidate.get_release() is None
+
+    dist = candidate.distribution
+    assert dist is candidate.distribution
+    assert dist.name_and_version == 'example (1.0.0)'
+    assert dist.digests == {'https://x/1': ('sha256', 'a')}
@@ -0,0 +1,37 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# type: ignore
+
+import os
+
+from proman.package_manager.installed import InstalledIndex
+
+from ..utils import TempDistributionPath
+
+
+def test_installed_index(monkeypatch):
+    with TempDistributionPath(
+        os.path.join(os.path.dirname(__file__), 'pypackages.zip'),
+    ) as temp_path:
+        dist_dir = os.path.join(temp_path, '3.8')
+        index = InstalledIndex(dist_dir)
+        record = index.get('urllib3')
+        assert record.version
+        assert any(x.endswith('__init__.py') for x in record.files)
+        assert os.path.isfile(index.filepath)
+
+        # a consistent index is read without scanning distributions
+        def rebuild():
+            raise AssertionError('index should not be rebuilt')
+
+        cached = InstalledIndex(dist_dir)
+        monkeypatch.setattr(cached, 'rebuild', rebuild)
+        assert cached.get('urllib3').version == record.version
+
+        cached.remove('urllib3')
+        cached.save()
+        assert InstalledIndex(dist_dir).get('urllib3') is None
+
+        # changes to the library directories invalidate the index
+        os.makedirs(os.path.join(dist_dir, 'lib', 'example-1.0.dist-info'))
+        assert InstalledIndex(dist_dir).get('urllib3') is not None
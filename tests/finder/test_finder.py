@@ -0,0 +1,48 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# type: ignore
+
+import importlib
+import os
+import sys
+
+from proman.package_manager import finder
+
+
+def test_module_map(tmp_path):
+    lib = tmp_path / 'lib'
+    (lib / 'mapped_pkg').mkdir(parents=True)
+    (lib / 'mapped_pkg' / '__init__.py').write_text('VALUE = 1\n')
+    (lib / 'mapped_pkg' / 'sub.py').write_text('VALUE = 2\n')
+    (lib / 'mapped_mod.py').write_text('VALUE = 3\n')
+    files = [
+        'mapped_pkg/__init__.py',
+        'mapped_pkg/sub.py',
+        'mapped_mod.py',
+        'mapped-1.0.dist-info/RECORD',
+        '../../bin/mapped',
+    ]
+    finder.write_module_map(str(tmp_path), files)
+    assert finder.build_module_map(str(tmp_path), files) == {
+        'mapped_mod': 'lib/mapped_mod.py',
+        'mapped_pkg': 'lib/mapped_pkg',
+    }
+
+    # lib is deliberately absent from sys.path
+    module_finder = finder.install(str(tmp_path))
+    try:
+        assert finder.install(str(tmp_path)) is module_finder
+        assert importlib.import_module('mapped_pkg.sub').VALUE == 2
+        assert importlib.import_module('mapped_mod').VALUE == 3
+
+        # uninstall rewrites the map and caches are invalidated
+        os.remove(lib / 'mapped_mod.py')
+        finder.write_module_map(str(tmp_path), files[:2])
+        os.utime(module_finder.filepath, ns=(0, 0))
+        importlib.invalidate_caches()
+        assert 'mapped_mod' not in module_finder.modules
+        assert module_finder.find_spec('mapped_mod') is None
+    finally:
+        sys.meta_path.remove(module_finder)
+        for name in ('mapped_pkg', 'mapped_pkg.sub', 'mapped_mod'):
+            sys.modules.pop(name, None)
@@ -0,0 +1,94 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# type: ignore
+
+import pytest
+
+from proman.package_manager.markers import (
+    TargetEnvironment,
+    get_platform_markers,
+)
+from proman.package_manager.resolver import Provider, Resolver
+from proman.package_manager.specifiers import parse_requirement
+
+GRAPH = {
+    'app': {
+        '1.0': [
+            'colorama; sys_platform == "win32"',
+            'importlib-metadata; python_version < "3.8"',
+            'rich[jupyter]',
+            'rich<2',
+            'pytest; extra == "dev"',
+        ]
+    },
+    'rich': {
+        '1.0': ['pygments', 'ipywidgets; extra == "jupyter"'],
+        '2.0': ['pygments', 'ipywidgets; extra == "jupyter"'],
+    },
+    'pygments': {'1.0': []},
+    'ipywidgets': {'1.0': []},
+    'colorama': {'1.0': []},
+    'importlib-metadata': {'1.0': []},
+    'pytest': {'1.0': []},
+}
+
+
+class RecordingProvider(Provider):
+    def __init__(self, graph):
+        self.graph = graph
+        self.lookups = set()
+
+    def get_versions(self, name):
+        self.lookups.add(name)
+        return list(self.graph.get(name, {}))
+
+    def get_dependencies(self, name, version):
+        return self.graph[name][version]
+
+
+def test_platform_markers():
+    assert get_platform_markers('win_amd64') == {
+        'sys_platform': 'win32',
+        'platform_system': 'Windows',
+        'os_name': 'nt',
+        'platform_machine': 'AMD64',
+    }
+    linux = get_platform_markers('manylinux2014_aarch64')
+    assert linux['platform_machine'] == 'aarch64'
+    macos = get_platform_markers('macosx_11_0_arm64')
+    assert macos['sys_platform'] == 'darwin'
+    with pytest.raises(ValueError):
+        get_platform_markers('plan9')
+
+
+def test_memoized_evaluation():
+    environment = TargetEnvironment(python='3.7', platform='win32')
+    assert environment.python == '3.7.0'
+    requirement = parse_requirement('a; python_version < "3.8"')
+    assert environment.applies(requirement)
+    assert environment.applies(parse_requirement('b; extra == "x"'), ['x'])
+    assert not environment.applies(parse_requirement('b; extra == "x"'))
+    # same marker on another requirement reuses the result
+    assert len(environment._TargetEnvironment__results) == 3
+    environment.applies(parse_requirement('c; python_version < "3.8"'))
+    assert len(environment._TargetEnvironment__results) == 3
+
+
+def test_prunes_inapplicable_subgraphs():
+    provider = RecordingProvider(GRAPH)
+    resolver = Resolver(provider, python='3.11', platform='linux')
+    assert resolver.resolve(['app']) == {
+        'app': '1.0',
+        'rich': '1.0',
+        'pygments': '1.0',
+        'ipywidgets': '1.0',
+    }
+    assert provider.lookups == {'app', 'rich', 'pygments', 'ipywidgets'}
+
+
+def test_cross_target_and_root_extras():
+    provider = RecordingProvider(GRAPH)
+    resolver = Resolver(provider, python='3.7', platform='win_amd64')
+    resolution = resolver.resolve(['app[dev]'])
+    assert {'colorama', 'importlib-metadata', 'pytest'} <= set(resolution)
+    assert 'app[dev]' not in resolution
@@ -0,0 +1,115 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# type: ignore
+
+import io
+import json
+
+from proman.package_manager import metadata as metadata_module
+from proman.package_manager.metadata import read_fields, read_project
+
+
+def release_file(version, packagetype):
+    return {
+        'comment_text': '',
+        'digests': {'md5': 'x', 'sha256': f"{version}-{packagetype}"},
+        'downloads': -1,
+        'filename': f"example-{version}.{packagetype}",
+        'packagetype': packagetype,
+        'python_version': 'py3',
+        'requires_python': '>=3.6',
+        'size': 1024,
+        'upload_time': '2021-01-01T00:00:00',
+        'url': f"https://files.example/{version}/{packagetype}",
+        'yanked': False,
+    }
+
+
+document = {
+    'info': {
+        'name': 'example',
+        'version': '1.2.0',
+        'summary': 'Ünïcode summary ✓',
+        'description': 'long description ' * 1000,
+        'requires_dist': ['urllib3>=1.25', 'idna; extra == "dev"'],
+    },
+    'last_serial': 1234567,
+    'releases': {
+        f"1.{x}.0": [
+            release_file(f"1.{x}.0", 'bdist_wheel'),
+            release_file(f"1.{x}.0", 'sdist'),
+        ]
+        for x in range(3)
+    },
+    'urls': [release_file('1.2.0', 'bdist_wheel')],
+    'vulnerabilities': [],
+}
+
+
+def chunked(data, size):
+    stream = io.BytesIO(data)
+    return iter(lambda: stream.read(size), b'')
+
+
+def test_read_project_chunks():
+    data = json.dumps(document, ensure_ascii=False).encode('utf-8')
+    for size in (1, 7, 4096, len(data)):
+        metadata = read_project(chunked(data, size))
+        assert metadata.name == 'example'
+        assert metadata.version == '1.2.0'
+        assert metadata.summary == 'Ünïcode summary ✓'
+        assert metadata.last_serial == 1234567
+        assert metadata.versions == ['1.0.0', '1.1.0', '1.2.0']
+        release = metadata.get_release()
+        assert release.filename == 'example-1.2.0.bdist_wheel'
+        assert release.digests == {'sha256': '1.2.0-bdist_wheel'}
+        assert not hasattr(release, '__dict__')
+
+
+def test_read_project_filter():
+    data = json.dumps(document).encode('utf-8')
+    metadata = read_project(
+        chunked(data, 512), lambda x: x['packagetype'] == 'sdist'
+    )
+    assert metadata.get_release('1.1.0') is None
+    assert metadata.get_release('1.1.0', 'sdist').size == 1024
+
+
+def test_read_fields():
+    data = json.dumps(document).encode('utf-8')
+    record = read_fields(
+        chunked(data, 64),
+        ['info.version', 'urls.filename', 'info.missing', 'last_serial'],
+    )
+    assert record == {
+        'info.version': '1.2.0',
+        'urls.filename': ['example-1.2.0.bdist_wheel'],
+        'info.missing': None,
+        'last_serial': 1234567,
+    }
+
+
+def test_read_fields_skips_unselected(monkeypatch):
+    decoded = []
+    value = metadata_module._StreamDecoder.value
+
+    def record(self):
+        result = value(self)
+        decoded.append(result)
+        return result
+
+    monkeypatch.setattr(metadata_module._StreamDecoder, 'value', record)
+    tricky = {
+        **document,
+        'vulnerabilities': [{'details': 'quote \\" and } ] { [ \\\\'}],
+        'urls': [{'filename': 'a "quoted" [name]'}],
+    }
+    data = json.dumps(tricky, ensure_ascii=False).encode('utf-8')
+    for size in (1, 3, len(data)):
+        decoded.clear()
+        fields = read_fields(chunked(data, size), ['urls.filename'])
+        assert fields == {'urls.filename': ['a "quoted" [name]']}
+        # objects and arrays are only built for the selected member
+        assert [x for x in decoded if isinstance(x, (dict, list))] == [
+            tricky['urls']
+        ]
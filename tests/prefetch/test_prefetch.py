@@ -0,0 +1,153 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# type: ignore
+
+import hashlib
+import os
+import threading
+
+from proman.package_manager.metadata import ReleaseFile
+from proman.package_manager.prefetch import Prefetcher
+from proman.package_manager.resolver import Provider, Resolver
+from proman.package_manager.scheduler import Scheduler
+from proman.package_manager.session import session
+
+single = {'min': 1, 'max': 1, 'initial': 1}
+
+
+def release(name):
+    filename = f"{name}-1.0-py3-none-any.whl"
+    return ReleaseFile(
+        filename,
+        f"http://localhost/{filename}",
+        'bdist_wheel',
+        hashlib.sha256(filename.encode()).hexdigest(),
+    )
+
+
+class Downloader:
+    def __init__(self, content=None):
+        self.content = content
+        self.calls = []
+        self.release = threading.Event()
+
+    def __call__(self, release, dest):
+        self.calls.append(release.filename)
+        self.release.wait(5)
+        filepath = os.path.join(dest, release.filename)
+        with open(filepath, 'wb') as f:
+            f.write(self.content or release.filename.encode())
+        return filepath
+
+
+def test_prefetch_cache_and_cancel(tmp_path):
+    download = Downloader()
+    prefetcher = Prefetcher(str(tmp_path), download, Scheduler(single))
+    first, second = release('first'), release('second')
+    assert prefetcher.submit(first)
+    assert not prefetcher.submit(first)
+    # the only worker is busy so the second download is still queued
+    assert prefetcher.submit(second)
+    assert prefetcher.cancel(second)
+
+    download.release.set()
+    filepath = prefetcher.get(first)
+    assert filepath and open(filepath, 'rb').read() == first.filename.encode()
+    assert prefetcher.get(second) is None
+    # cached artifacts are reused without downloading
+    assert not prefetcher.submit(first)
+    prefetcher.close()
+    assert download.calls == [first.filename]
+
+
+def test_prefetch_rejects_digest_mismatch(tmp_path):
+    download = Downloader(b'tampered')
+    download.release.set()
+    prefetcher = Prefetcher(str(tmp_path), download, Scheduler(single))
+    prefetcher.submit(release('example'))
+    assert prefetcher.get(release('example')) is None
+    prefetcher.close()
+
+
+class RecordingProvider(Provider):
+    def __init__(self, graph):
+        self.graph = graph
+        self.events = []
+
+    def get_versions(self, name):
+        return list(self.graph.get(name, {}))
+
+    def get_dependencies(self, name, version):
+        return self.graph[name][version]
+
+    def prefetch(self, name, version):
+        self.events.append(('prefetch', name, version))
+
+    def cancel(self, name, version):
+        self.events.append(('cancel', name, version))
+
+
+def test_resolver_prefetches_confident_picks():
+    graph = {
+        'a': {'2.0': ['x==1.0', 'b==1.0'], '1.0': []},
+        'b': {'2.0': [], '1.0': []},
+        'x': {'1.0': ['missing'], '2.0': []},
+        'pinned': {'2.0': [], '1.0': []},
+    }
+    provider = RecordingProvider(graph)
+    selected = Resolver(provider).resolve(['a', 'pinned==1.0'])
+    assert selected == {'pinned': '1.0', 'a': '1.0'}
+    # b was only forced by a 2.0 so the pick is retracted with it while
+    # the learned conflict leaves a single version of a
+    assert provider.events == [
+        ('prefetch', 'pinned', '1.0'),
+        ('prefetch', 'b', '1.0'),
+        ('cancel', 'b', '1.0'),
+        ('prefetch', 'a', '1.0'),
+    ]
+
+
+def test_evict_least_recently_used(tmp_path):
+    download = Downloader()
+    download.release.set()
+    prefetcher = Prefetcher(str(tmp_path), download, Scheduler(single))
+    releases = [release(x) for x in ('renewed', 'unused', 'new')]
+    for number, item in enumerate(releases):
+        prefetcher.submit(item)
+        filepath = prefetcher.get(item)
+        os.utime(filepath, (1000 + number, 1000 + number))
+    stale = tmp_path / '.part-stale'
+    stale.mkdir()
+    os.utime(stale, (1000, 1000))
+    # reuse renews an artifact
+    prefetcher.cached(releases[0])
+
+    size = len(releases[0].filename) + len(releases[2].filename)
+    assert prefetcher.evict(max_size=size) == [releases[1].filename]
+    assert not stale.exists()
+    assert prefetcher.evict(max_age=3600) == [releases[2].filename]
+    assert prefetcher.cached(releases[0])
+    prefetcher.close()
+
+
+def test_prefetch_keeps_command_deadline(tmp_path):
+    deadlines = []
+
+    def download(release, dest):
+        deadlines.append(session.deadline)
+        filepath = os.path.join(dest, release.filename)
+        with open(filepath, 'wb') as f:
+            f.write(release.filename.encode())
+        return filepath
+
+    prefetcher = Prefetcher(str(tmp_path), download, Scheduler(single))
+    first, second = release('first'), release('second')
+    with session.within(60):
+        deadline = session.deadline
+        prefetcher.submit(first)
+        assert prefetcher.get(first)
+    # the worker does not keep the deadline of an earlier command
+    prefetcher.submit(second)
+    assert prefetcher.get(second)
+    prefetcher.close()
+    assert deadlines == [deadline, None]
@@ -0,0 +1,173 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# type: ignore
+
+import hashlib
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import urllib3
+
+from proman.package_manager.proxy import SIMPLE_JSON, CacheProxy, _Server
+
+WHEEL = b'wheel content'
+FILENAME = 'example-1.0-py3-none-any.whl'
+SHA256 = hashlib.sha256(WHEEL).hexdigest()
+
+
+@pytest.fixture
+def upstream():
+    """Serve a slow package index counting requests by path."""
+    counts = {}
+    state = {'failing': False}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            with lock:
+                counts[self.path] = counts.get(self.path, 0) + 1
+            time.sleep(0.2)
+            if state['failing']:
+                body, status = b'unavailable', 503
+            elif self.path == '/pypi/example/json':
+                url = f"http://{self.headers['Host']}/files/{FILENAME}"
+                entry = {
+                    'filename': FILENAME,
+                    'url': url,
+                    'packagetype': 'bdist_wheel',
+                    'digests': {'sha256': SHA256},
+                    'requires_python': '>=3.6',
+                }
+                body, status = (
+                    json.dumps(
+                        {
+                            'info': {'name': 'example', 'version': '1.0'},
+                            'last_serial': 42,
+                            'releases': {'1.0': [entry]},
+                            'urls': [entry],
+                        }
+                    ).encode('utf-8'),
+                    200,
+                )
+            elif self.path == f"/files/{FILENAME}":
+                body, status = WHEEL, 200
+            else:
+                body, status = b'not found', 404
+            self.send_response(status)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    host, port = httpd.server_address
+    yield f"http://{host}:{port}/", counts, state
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def start_proxy(path, upstream, **options):
+    proxy = CacheProxy(str(path), upstream, **options)
+    server = _Server(('127.0.0.1', 0), proxy)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return server, f"http://{host}:{port}/"
+
+
+def test_coalesces_metadata_and_artifacts(tmp_path, upstream):
+    upstream_url, counts, _ = upstream
+    server, url = start_proxy(tmp_path, upstream_url)
+    http = urllib3.PoolManager(maxsize=8)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        documents = list(
+            executor.map(
+                lambda _: json.loads(
+                    http.request('GET', f"{url}pypi/example/json").data
+                ),
+                range(8),
+            )
+        )
+    file_url = documents[0]['urls'][0]['url']
+    assert file_url == f"{url}files/{SHA256}/{FILENAME}"
+    assert all(x == documents[0] for x in documents)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        bodies = list(
+            executor.map(
+                lambda _: http.request('GET', file_url).data, range(8)
+            )
+        )
+    assert all(x == WHEEL for x in bodies)
+    assert counts == {'/pypi/example/json': 1, f"/files/{FILENAME}": 1}
+    assert (tmp_path / 'artifacts' / SHA256 / FILENAME).read_bytes() == WHEEL
+
+    # a restarted proxy locates artifacts it has not listed yet
+    server.shutdown()
+    (tmp_path / 'artifacts' / SHA256 / FILENAME).unlink()
+    (tmp_path / 'index' / 'pypi' / 'example.json').unlink()
+    server, url = start_proxy(tmp_path, upstream_url)
+    rsp = http.request('GET', f"{url}files/{SHA256}/{FILENAME}")
+    assert rsp.status == 200 and rsp.data == WHEEL
+    assert http.request('GET', f"{url}pypi/missing/json").status == 404
+    server.shutdown()
+
+
+def test_simple_api(tmp_path, upstream):
+    upstream_url, counts, _ = upstream
+    server, url = start_proxy(tmp_path, upstream_url)
+    http = urllib3.PoolManager()
+
+    rsp = http.request(
+        'GET', f"{url}simple/Example/", headers={'Accept': SIMPLE_JSON}
+    )
+    assert rsp.headers['Content-Type'] == SIMPLE_JSON
+    assert rsp.headers['X-PyPI-Last-Serial'] == '42'
+    page = json.loads(rsp.data)
+    assert page['name'] == 'example'
+    assert page['files'] == [
+        {
+            'filename': FILENAME,
+            'url': f"{url}files/{SHA256}/{FILENAME}",
+            'hashes': {'sha256': SHA256},
+            'requires-python': '>=3.6',
+            'yanked': False,
+        }
+    ]
+
+    rsp = http.request('GET', f"{url}simple/example/")
+    assert f'#sha256={SHA256}"' in rsp.data.decode()
+    assert 'data-requires-python="&gt;=3.6"' in rsp.data.decode()
+    etag = rsp.headers['ETag']
+    rsp = http.request(
+        'GET', f"{url}simple/example/", headers={'If-None-Match': etag}
+    )
+    assert rsp.status == 304
+    rsp = http.request('HEAD', f"{url}simple/example/")
+    assert rsp.status == 200 and rsp.headers['X-PyPI-Last-Serial'] == '42'
+    assert counts == {'/pypi/example/json': 1}
+    server.shutdown()
+
+
+def test_serves_stale_documents(tmp_path, upstream):
+    upstream_url, counts, state = upstream
+    server, url = start_proxy(tmp_path, upstream_url, ttl=0)
+    http = urllib3.PoolManager(retries=False)
+
+    fresh = http.request('GET', f"{url}pypi/example/json").data
+    state['failing'] = True
+    rsp = http.request('GET', f"{url}pypi/example/json")
+    assert rsp.status == 200 and rsp.data == fresh
+    assert counts['/pypi/example/json'] == 2
+    # nothing cached to fall back on
+    assert http.request('GET', f"{url}simple/").status == 502
+    server.shutdown()
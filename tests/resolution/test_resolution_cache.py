@@ -0,0 +1,61 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# type: ignore
+
+import json
+
+from proman.package_manager.dependencies import Candidate
+from proman.package_manager.metadata import ReleaseFile
+from proman.package_manager.resolution import ResolutionCache, fingerprint
+
+candidates = [
+    Candidate(
+        'example',
+        '2.0.0',
+        requires=['urllib3>=1.25'],
+        artifacts=[
+            ReleaseFile('example-2.0.0.tar.gz', 'https://x/2', 'sdist', 'b')
+        ],
+        last_serial=10,
+    ),
+    Candidate('urllib3', '1.26.0', last_serial=20),
+]
+
+
+def test_fingerprint():
+    key = fingerprint(['example>=1', 'urllib3'], 'https://pypi.org')
+    assert key == fingerprint(['urllib3', 'example >=1'], 'https://pypi.org')
+    assert key != fingerprint(['example>=1', 'urllib3'], 'https://mirror')
+    assert key != fingerprint(
+        ['example>=1', 'urllib3'], 'https://pypi.org', dev=True
+    )
+    # options not affecting resolution are ignored
+    assert key == fingerprint(
+        ['example>=1', 'urllib3'], 'https://pypi.org', log_level='debug'
+    )
+
+
+def test_cache_ttl_and_serials(tmp_path):
+    cache = ResolutionCache(str(tmp_path), ttl=3600)
+    cache.put('a', candidates)
+    cached = cache.get('a', validate=lambda x: False)
+    assert [(x.name, x.version) for x in cached] == [
+        ('example', '2.0.0'),
+        ('urllib3', '1.26.0'),
+    ]
+    assert cached[0].requires == ('urllib3>=1.25',)
+    assert cached[0].get_release('sdist').digests == {'sha256': 'b'}
+
+    # expired results are only reused while project serials match
+    with open(tmp_path / 'a.json') as f:
+        data = json.load(f)
+    data['created'] -= 7200
+    with open(tmp_path / 'a.json', 'w') as f:
+        json.dump(data, f)
+    checked = []
+    assert cache.get('a', validate=lambda x: checked.append(x)) is None
+    assert checked == [{'example': 10, 'urllib3': 20}]
+    assert cache.get('a', validate=lambda x: True) is not None
+    # revalidation starts a new TTL
+    assert cache.get('a') is not None
+    assert cache.get('b') is None
@@ -0,0 +1,188 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# type: ignore
+
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from proman.package_manager import config, package_manager
+from proman.package_manager.distributions import LocalDistributionPath
+from proman.package_manager.exception import PackageManagerResolution
+from proman.package_manager.package_manager import PackageManager
+from proman.package_manager.resolver import IndexProvider, Provider, Resolver
+
+
+class GraphProvider(Provider):
+    def __init__(self, graph):
+        self.graph = graph
+
+    def get_versions(self, name):
+        return list(self.graph.get(name, {}))
+
+    def get_dependencies(self, name, version):
+        return self.graph[name][version]
+
+
+def serve_graph(graph):
+    """Serve graph as a JSON API package index."""
+
+    def document(name, version, files):
+        return {
+            'info': {
+                'name': name,
+                'version': version,
+                'requires_dist': graph[name][version],
+            },
+            **files,
+        }
+
+    def release(name, version):
+        filename = f"{name}-{version}-py3-none-any.whl"
+        return [
+            {
+                'filename': filename,
+                'url': f"http://localhost/{filename}",
+                'packagetype': 'bdist_wheel',
+            }
+        ]
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            parts = self.path.strip('/').split('/')
+            name = parts[1] if len(parts) > 1 else ''
+            if name not in graph:
+                self.send_error(404)
+                return
+            if len(parts) == 4:
+                data = document(
+                    name, parts[2], {'urls': release(name, parts[2])}
+                )
+            else:
+                releases = {v: release(name, v) for v in graph[name]}
+                latest = max(graph[name], key=lambda x: float(x))
+                data = document(name, latest, {'releases': releases})
+            body = json.dumps(data).encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def adversarial_graph(width, depth):
+    """Create graph whose newest versions only conflict at the end."""
+    versions = [f"{x}.0" for x in range(1, depth + 1)]
+    graph = {'c': {v: [] for v in versions}}
+    graph['d'] = {'1.0': ['c==1.0']}
+    for i in range(width):
+        graph[f"a{i}"] = {
+            v: [f"b{i}=={v}"] + ([f"c=={v}"] if v != '1.0' else [])
+            for v in versions
+        }
+        graph[f"b{i}"] = {v: [] for v in versions}
+    return graph
+
+
+def test_backtracking():
+    graph = {
+        'a': {'2.0': ['b>=2'], '1.0': ['b<2']},
+        'b': {'2.0': ['c==1.0'], '1.0': []},
+        'c': {'2.0': [], '1.0': []},
+    }
+    assert Resolver(GraphProvider(graph)).resolve(['a', 'c>=2']) == {
+        'a': '1.0',
+        'b': '1.0',
+        'c': '2.0',
+    }
+
+
+def test_explanation():
+    graph = {
+        'foo': {'1.0': ['a', 'b']},
+        'a': {'1.0': ['x==1.0']},
+        'b': {'1.0': ['x==2.0']},
+        'x': {'1.0': [], '2.0': []},
+    }
+    with pytest.raises(PackageManagerResolution) as err:
+        Resolver(GraphProvider(graph)).resolve(['foo'])
+    message = str(err.value)
+    assert message.startswith('version solving failed:')
+    assert 'b depends on x (2.0)' in message
+    assert 'a depends on x (1.0)' in message
+    assert message.endswith('the project cannot be resolved.')
+
+
+def test_adversarial_index(monkeypatch):
+    graph = adversarial_graph(6, 8)
+    # every version of final needs a release that was never published
+    graph['final'] = {f"{x}.0": ['c>=100'] for x in range(1, 9)}
+    server = serve_graph(graph)
+    host, port = server.server_address
+    monkeypatch.setattr(config, 'INDEX_URL', f"http://{host}:{port}/")
+    monkeypatch.setattr(package_manager, '_metadata_cache', {})
+    try:
+        provider = IndexProvider(PackageManager._lookup_metadata)
+        requirements = [f"a{x}" for x in range(6)] + ['d']
+
+        resolver = Resolver(provider)
+        start = time.perf_counter()
+        selected = resolver.resolve(requirements)
+        assert time.perf_counter() - start < 10
+        # naive backtracking would visit 8 ** 6 combinations first
+        assert resolver.decisions < 50
+        assert all(selected[f"a{x}"] == '1.0' for x in range(6))
+        assert selected['c'] == '1.0'
+
+        with pytest.raises(PackageManagerResolution) as err:
+            Resolver(provider).resolve(requirements + ['final'])
+        assert 'which has no matching versions' in str(err.value)
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_install_reports_conflicts(tmp_path, monkeypatch, capsys):
+    graph = {
+        'foo': {'1.0': ['a', 'b']},
+        'a': {'1.0': ['x==1.0']},
+        'b': {'1.0': ['x==2.0']},
+        'x': {'1.0': [], '2.0': []},
+    }
+    server = serve_graph(graph)
+    host, port = server.server_address
+    monkeypatch.setattr(config, 'INDEX_URL', f"http://{host}:{port}/")
+    monkeypatch.setattr(config, 'CACHE_DIR', str(tmp_path / 'cache'))
+    monkeypatch.setattr(config, 'pyproject_path', str(tmp_path / 'none'))
+    monkeypatch.setattr(package_manager, '_metadata_cache', {})
+    from proman.package_manager import cli
+
+    manager = PackageManager(
+        None,
+        LocalDistributionPath(
+            name='example', pypackages_dir=str(tmp_path / '__pypackages__')
+        ),
+        None,
+        store=False,
+        prefetch=False,
+    )
+    monkeypatch.setattr(cli, '_package_manager', manager)
+    try:
+        with pytest.raises(SystemExit) as err:
+            cli.install('foo')
+    finally:
+        server.shutdown()
+        server.server_close()
+    assert err.value.code == 1
+    stderr = capsys.readouterr().err
+    assert stderr.startswith('version solving failed:')
+    assert 'b depends on x (2.0)' in stderr
@@ -0,0 +1,68 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# type: ignore
+
+import pytest
+
+from proman.package_manager.scheduler import AdaptiveLimiter, Scheduler
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def run_window(limiter, clock, latency, error=False):
+    for _ in range(limiter.limit):
+        clock.now += latency / limiter.limit
+        limiter.record(latency, error)
+
+
+def test_additive_increase_within_bounds():
+    clock = Clock()
+    limiter = AdaptiveLimiter(1, 6, 2, clock=clock)
+    for _ in range(10):
+        run_window(limiter, clock, 0.1)
+    assert limiter.limit == 6
+
+
+def test_multiplicative_decrease():
+    clock = Clock()
+    limiter = AdaptiveLimiter(2, 32, 16, clock=clock)
+    run_window(limiter, clock, 0.1)
+    assert limiter.limit == 17
+
+    # latency regression halves the limit
+    run_window(limiter, clock, 1.0)
+    assert limiter.limit == 8
+
+    # errors back off down to the minimum
+    for _ in range(4):
+        run_window(limiter, clock, 0.1, error=True)
+    assert limiter.limit == 2
+
+
+def test_slot_records_errors():
+    clock = Clock()
+    limiter = AdaptiveLimiter(1, 4, 2, clock=clock)
+    with pytest.raises(RuntimeError):
+        with limiter.slot():
+            raise RuntimeError
+    with limiter.slot():
+        assert limiter.active == 1
+    assert limiter.active == 0
+    assert limiter.limit == 1
+
+
+def test_scheduler_from_config():
+    scheduler = Scheduler.from_config(
+        {'network': {'min': 4, 'max': 64}, 'disk': {'min': 1, 'max': 2}}
+    )
+    assert (scheduler.network.minimum, scheduler.network.maximum) == (4, 64)
+    assert scheduler.disk.limit == 2
+    assert scheduler.max_workers == 66
+    with pytest.raises(ValueError):
+        AdaptiveLimiter(0, 4)
@@ -0,0 +1,50 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# type: ignore
+
+from proman.package_manager.search import SearchIndex
+
+projects = [
+    ('requests', 10),
+    ('requests-oauthlib', 11),
+    ('Requests_Toolbelt', 12),
+    ('urllib3', 13),
+    ('httpx', 14),
+] + [(f"project-{x}", x) for x in range(1000)]
+
+
+def test_query(tmp_path):
+    index = SearchIndex(str(tmp_path))
+    assert index.update(projects, etag='"a"', last_serial=14) == len(projects)
+
+    assert index.query('requests')[:3] == [
+        'requests',
+        'requests-oauthlib',
+        'Requests_Toolbelt',
+    ]
+    assert index.query('requests.toolbelt')[0] == 'Requests_Toolbelt'
+    assert index.query('reqeusts')[0] == 'requests'
+    assert index.query('urlib3')[0] == 'urllib3'
+    assert len(index.query('project', limit=10)) == 10
+
+
+def test_persist_and_refresh(tmp_path):
+    index = SearchIndex(str(tmp_path))
+    index.update(projects, etag='"a"', last_serial=14)
+    index.set_details('requests', summary='HTTP for Humans.', version='2.0')
+    index.set_details('urllib3', summary='HTTP library')
+    index.save()
+
+    loaded = SearchIndex(str(tmp_path))
+    assert loaded.load() is True
+    assert loaded.etag == '"a"'
+    assert loaded.query('urllib') == ['urllib3']
+    assert loaded.matches('requests', summary='humans')
+    assert not loaded.matches('requests', keywords='http')
+
+    # only changed projects lose their cached details
+    changed = [(x, y + 1 if x == 'urllib3' else y) for x, y in projects]
+    assert loaded.update(changed + [('niquests', 99)], '"b"', 99) == 2
+    assert 'urllib3' not in loaded.details
+    assert loaded.matches('requests', summary='humans')
+    assert loaded.query('niquests')[0] == 'niquests'
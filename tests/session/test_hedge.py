@@ -0,0 +1,152 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# type: ignore
+
+import socket
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from proman.package_manager import config
+from proman.package_manager.exception import PackageManagerNetwork
+from proman.package_manager.scheduler import Scheduler
+from proman.package_manager.session import Session
+
+
+@pytest.fixture
+def servers():
+    """Start index stand-ins stalling on paths containing slow."""
+    started = []
+
+    def start(name, stall=2.0):
+        counts = {}
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                counts[self.path] = counts.get(self.path, 0) + 1
+                if 'slow' in self.path and stall:
+                    time.sleep(stall)
+                body = name.encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        httpd.daemon_threads = True
+        threading.Thread(target=httpd.serve_forever, daemon=True).start()
+        started.append(httpd)
+        host, port = httpd.server_address
+        return f"http://{host}:{port}", counts
+
+    yield start
+    for httpd in started:
+        httpd.shutdown()
+        httpd.server_close()
+
+
+def test_hedges_slow_requests_to_mirror(servers, monkeypatch):
+    index_url, index_counts = servers('index')
+    mirror_url, mirror_counts = servers('mirror', stall=0)
+    monkeypatch.setattr(config, 'INDEX_URL', index_url)
+    session = Session(mirrors=[mirror_url])
+
+    # no duplicates are sent until the usual latency is known
+    for number in range(20):
+        rsp = session.request('GET', f"{index_url}/pypi/p{number}/json")
+        assert rsp.data == b'index'
+    assert session.hedged == 0 and mirror_counts == {}
+
+    start = time.monotonic()
+    rsp = session.request('GET', f"{index_url}/pypi/slow/json")
+    assert time.monotonic() - start < 1
+    assert rsp.data == b'mirror'
+    assert session.hedged == 1
+    assert index_counts['/pypi/slow/json'] == 1
+    assert mirror_counts == {'/pypi/slow/json': 1}
+
+
+def test_fails_over_to_mirror(servers, monkeypatch):
+    mirror_url, mirror_counts = servers('mirror')
+    # nothing listens on a port that was just released
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        index_url = f"http://127.0.0.1:{sock.getsockname()[1]}"
+    monkeypatch.setattr(config, 'INDEX_URL', index_url)
+    session = Session(mirrors=[mirror_url])
+    rsp = session.request('GET', f"{index_url}/simple/example/")
+    assert rsp.data == b'mirror'
+    assert session.hedged == 0
+    # artifacts outside the index are never duplicated
+    files_url = index_url.replace('127.0.0.1', 'localhost')
+    with pytest.raises(PackageManagerNetwork):
+        session.request('GET', f"{files_url}/files/example.whl")
+    assert mirror_counts == {'/simple/example/': 1}
+
+
+def test_timeout_and_deadline(servers):
+    index_url, counts = servers('index')
+    session = Session(timeout=0.2, mirrors=[])
+
+    start = time.monotonic()
+    with pytest.raises(PackageManagerNetwork):
+        session.request('GET', f"{index_url}/slow")
+    assert time.monotonic() - start < 1
+    # stalled reads are not sent again
+    assert counts['/slow'] == 1
+
+    session.timeout = None
+    with session.within(0.2):
+        with pytest.raises(PackageManagerNetwork):
+            session.request('GET', f"{index_url}/slow/again")
+        # later requests fail without reaching the index
+        time.sleep(0.1)
+        with pytest.raises(PackageManagerNetwork, match='deadline'):
+            session.request('GET', f"{index_url}/fast")
+    assert '/fast' not in counts
+    assert session.deadline is None
+    assert session.request('GET', f"{index_url}/fast").data == b'index'
+
+
+def test_deadlines_of_concurrent_commands(servers, monkeypatch):
+    index_url, _ = servers('index')
+    mirror_url, _ = servers('mirror')
+    monkeypatch.setattr(config, 'INDEX_URL', index_url)
+    session = Session(timeout=None, mirrors=[mirror_url])
+    entered = threading.Event()
+    exited = threading.Event()
+
+    def short():
+        with session.within(0.3):
+            entered.set()
+            exited.wait()
+            # duplicates sent to the mirror keep the deadline
+            with pytest.raises(PackageManagerNetwork):
+                session.request('GET', f"{index_url}/pypi/slow/json")
+        return session.deadline
+
+    def long():
+        entered.wait()
+        with session.within(60):
+            pass
+        exited.set()
+        return session.deadline
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        start = time.monotonic()
+        futures = [executor.submit(short), executor.submit(long)]
+        assert [x.result() for x in futures] == [None, None]
+    assert time.monotonic() - start < 1.5
+    # commands leaving their scope never restore the deadline of another
+    assert session.deadline is None
+    with session.within(5), Scheduler().executor() as executor:
+        deadline = session.deadline
+        assert executor.submit(lambda: session.deadline).result() == deadline
@@ -0,0 +1,140 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# type: ignore
+
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import urllib3
+
+from proman.package_manager import config, package_manager
+from proman.package_manager.package_manager import PackageManager
+from proman.package_manager.session import Session
+
+PROJECT = {
+    'info': {'name': 'example', 'version': '1.0', 'requires_dist': None},
+    'releases': {'1.0': []},
+}
+# document many times larger than a chunk
+LARGE = {
+    'info': {'name': 'large', 'version': '1.0', 'requires_dist': None},
+    'releases': {
+        f"0.{x}": [
+            {
+                'filename': f"large-0.{x}-py3-none-any.whl",
+                'url': f"http://localhost/large-0.{x}-py3-none-any.whl",
+                'packagetype': 'bdist_wheel',
+                'digests': {'sha256': f"{x:064x}"},
+            }
+        ]
+        for x in range(10000)
+    },
+}
+
+
+@pytest.fixture
+def server():
+    """Serve slow responses counting requests and connections."""
+    counts = {'requests': 0, 'connections': 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def setup(self):
+            super().setup()
+            with lock:
+                counts['connections'] += 1
+
+        def do_GET(self):
+            with lock:
+                counts['requests'] += 1
+            time.sleep(0.2)
+            document = LARGE if 'large' in self.path else PROJECT
+            body = json.dumps(document).encode('utf-8')
+            self.send_response(200 if 'missing' not in self.path else 404)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    host, port = httpd.server_address
+    yield f"http://{host}:{port}/", counts
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_coalesces_identical_requests(server):
+    url, counts = server
+    session = Session()
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        responses = list(
+            executor.map(
+                lambda _: session.request('GET', f"{url}pypi/example/json"),
+                range(8),
+            )
+        )
+    assert counts['requests'] == 1
+    assert session.coalesced == 7
+    assert all(x is responses[0] for x in responses)
+    # requests that differ are not shared
+    session.request('GET', f"{url}pypi/other/json")
+    assert counts['requests'] == 2
+
+
+def test_reuses_connections(server):
+    url, counts = server
+    session = Session()
+    for name in ['a', 'b', 'c', 'missing']:
+        session.request('GET', f"{url}pypi/{name}/json")
+    assert counts == {'requests': 4, 'connections': 1}
+
+
+def test_concurrent_metadata_lookups(server, monkeypatch):
+    url, counts = server
+    monkeypatch.setattr(config, 'INDEX_URL', url)
+    monkeypatch.setattr(package_manager, '_metadata_cache', {})
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(
+            executor.map(
+                lambda _: PackageManager._lookup_metadata('example'),
+                range(8),
+            )
+        )
+    assert counts['requests'] == 1
+    assert {x.version for x in results} == {'1.0'}
+
+
+def test_metadata_lookups_read_bounded_chunks(server, monkeypatch):
+    url, counts = server
+    monkeypatch.setattr(config, 'INDEX_URL', url)
+    monkeypatch.setattr(package_manager, '_metadata_cache', {})
+    reads = []
+    read = urllib3.response.HTTPResponse.read
+
+    def record(self, *args, **kwargs):
+        data = read(self, *args, **kwargs)
+        reads.append(len(data))
+        return data
+
+    monkeypatch.setattr(urllib3.response.HTTPResponse, 'read', record)
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        results = list(
+            executor.map(
+                lambda _: PackageManager._lookup_metadata('large'), range(4)
+            )
+        )
+    # waiting callers share the parsed metadata rather than a body
+    assert counts['requests'] == 1
+    assert all(x is results[0] for x in results)
+    assert results[0].get_release('0.9999')
+    assert sum(reads) > 20 * config.CHUNK_SIZE
+    assert max(reads) <= config.CHUNK_SIZE
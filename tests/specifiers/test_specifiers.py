@@ -0,0 +1,50 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# type: ignore
+
+from packaging.specifiers import SpecifierSet
+
+from proman.package_manager.specifiers import (
+    VersionSet,
+    get_specifier,
+    parse_version,
+    split_requirement,
+)
+
+versions = [
+    f"{major}.{minor}.{patch}{suffix}"
+    for major in range(1, 4)
+    for minor in range(20)
+    for patch in range(20)
+    for suffix in ('', 'rc1')
+] + ['not-a-version']
+
+
+def test_split_requirement():
+    assert split_requirement('urllib3>=1.25,<2') == ('urllib3', '>=1.25,<2')
+    assert split_requirement('urllib3') == ('urllib3', '*')
+
+
+def test_cached_parsing():
+    assert parse_version('1.0.0') is parse_version('1.0.0')
+    assert parse_version('not-a-version') is None
+    assert get_specifier('>=1.0') is get_specifier('>=1.0')
+    assert get_specifier('*') == SpecifierSet()
+
+
+def test_version_set_filter():
+    version_set = VersionSet(versions)
+    assert len(version_set) == len(versions) - 1
+
+    spec = '>=2.5,<3'
+    expected = sorted(
+        SpecifierSet(spec).filter(versions[:-1]),
+        key=parse_version,
+        reverse=True,
+    )
+    assert list(version_set.filter(spec)) == expected
+    assert version_set.filter(spec) is version_set.filter(spec)
+    assert version_set.best_match('<1.1') == '1.0.19'
+    assert version_set.filter('<1.0.1') == ('1.0.0',)
+    assert version_set.filter('<1.0.1', True) == ('1.0.0', '1.0.0rc1')
+    assert version_set.best_match('==1.0.0rc1') == '1.0.0rc1'
@@ -0,0 +1,103 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# type: ignore
+
+import json
+import os
+import subprocess
+import sys
+
+from proman.package_manager import config, stamp
+from proman.package_manager.__main__ import quick_status
+
+
+def make_environment(tmp_path):
+    dist_dir = tmp_path / '__pypackages__' / '3.x'
+    os.makedirs(dist_dir / 'lib' / 'example')
+    (dist_dir / 'lib' / 'single.py').write_text('')
+    lock_path = tmp_path / 'proman-lock.json'
+    lock_path.write_text('{"dependencies": []}')
+    return str(dist_dir), str(lock_path)
+
+
+def test_stamp_status(tmp_path):
+    dist_dir, lock_path = make_environment(tmp_path)
+    assert stamp.stamp_status(dist_dir, lock_path) == stamp.MISSING
+    stamp.write_stamp(dist_dir, lock_path, dev=True)
+    assert stamp.is_current(dist_dir, lock_path)
+    assert stamp.read_stamp(dist_dir)['dev'] is True
+
+    # bytecode of top level modules does not invalidate the stamp
+    cache_dir = os.path.join(dist_dir, 'lib', '__pycache__')
+    open(os.path.join(cache_dir, 'single.pyc'), 'w').close()
+    assert stamp.stamp_status(dist_dir, lock_path) == stamp.CURRENT
+
+    with open(lock_path, 'w') as f:
+        f.write('{"dependencies": [{"name": "example"}]}')
+    assert stamp.stamp_status(dist_dir, lock_path) == stamp.LOCK_CHANGED
+    stamp.write_stamp(dist_dir, lock_path)
+
+    # packages removed behind the installer's back
+    os.rmdir(os.path.join(dist_dir, 'lib', 'example'))
+    status = stamp.stamp_status(dist_dir, lock_path)
+    assert status == stamp.ENVIRONMENT_CHANGED
+
+    stamp.write_stamp(dist_dir, lock_path)
+    stamp.clear_stamp(dist_dir)
+    assert stamp.stamp_status(dist_dir, lock_path) == stamp.MISSING
+
+
+def test_quick_status_avoids_distlib(tmp_path):
+    dist_dir = stamp.get_dist_dir(str(tmp_path / '__pypackages__'))
+    os.makedirs(os.path.join(dist_dir, 'lib'))
+    lock_path = tmp_path / 'proman-lock.json'
+    lock_path.write_text('{}')
+    stamp.write_stamp(dist_dir, str(lock_path))
+    script = (
+        'import sys; '
+        'from proman.package_manager.__main__ import quick_status; '
+        "code = quick_status(['status', '--quick']); "
+        "assert 'distlib' not in sys.modules; "
+        "assert 'packaging' not in sys.modules; "
+        'sys.exit(code)'
+    )
+    result = subprocess.run(
+        [sys.executable, '-c', script],
+        cwd=str(tmp_path),
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == 'stamp current'
+
+
+def test_quick_status_flags(tmp_path, monkeypatch, capsys):
+    dist_dir = stamp.get_dist_dir(str(tmp_path / '__pypackages__'))
+    os.makedirs(os.path.join(dist_dir, 'lib'))
+    lock_path = tmp_path / 'proman-lock.json'
+    lock_path.write_text('{}')
+    monkeypatch.setattr(config, 'lock_path', str(lock_path))
+    monkeypatch.setattr(
+        config, 'pypackages_dir', str(tmp_path / '__pypackages__')
+    )
+
+    for args in (
+        ['status', '--json', '--quick'],
+        ['status', '--quick', '-j'],
+        ['status', '-qj'],
+    ):
+        assert quick_status(args) == 1
+        assert json.loads(capsys.readouterr().out) == {'stamp': 'missing'}
+    stamp.write_stamp(dist_dir, str(lock_path))
+    assert quick_status(['status', '-q']) == 0
+    assert capsys.readouterr().out == 'stamp current\n'
+
+    # anything else is left to the full CLI
+    for args in (
+        ['status'],
+        ['status', '--json'],
+        ['status', '--quick', '--verbose'],
+        ['check', '--quick'],
+    ):
+        assert quick_status(args) is None
+    assert capsys.readouterr().out == ''
@@ -0,0 +1,67 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# type: ignore
+
+import base64
+import hashlib
+import os
+import zipfile
+
+from distlib.database import InstalledDistribution
+
+from proman.package_manager.store import PackageStore
+
+
+def make_wheel(directory):
+    filename = os.path.join(directory, 'demo-1.0-py3-none-any.whl')
+    members = {
+        'demo.py': b'VALUE = 1\n',
+        'demo-1.0.dist-info/METADATA': (
+            b'Metadata-Version: 2.1\nName: demo\nVersion: 1.0\n'
+        ),
+        'demo-1.0.dist-info/WHEEL': (
+            b'Wheel-Version: 1.0\nGenerator: test\n'
+            b'Root-Is-Purelib: true\nTag: py3-none-any\n'
+        ),
+    }
+    record = []
+    with zipfile.ZipFile(filename, 'w') as whl:
+        for name, content in members.items():
+            digest = base64.urlsafe_b64encode(
+                hashlib.sha256(content).digest()
+            ).rstrip(b'=')
+            record.append(f"{name},sha256={digest.decode()},{len(content)}")
+            whl.writestr(name, content)
+        record.append('demo-1.0.dist-info/RECORD,,')
+        whl.writestr('demo-1.0.dist-info/RECORD', '\n'.join(record))
+    with open(filename, 'rb') as f:
+        return filename, hashlib.sha256(f.read()).hexdigest()
+
+
+def test_link_and_collect(tmp_path):
+    filepath, sha256 = make_wheel(str(tmp_path))
+    store = PackageStore(str(tmp_path / 'store'))
+    key = store.get_key('demo', '1.0', os.path.basename(filepath), sha256)
+    assert key == f"demo-1.0-py3-none-any-{sha256[:16]}"
+    store.add(filepath, key, '3.9', sha256)
+
+    envs = [str(tmp_path / x / '3.9') for x in ('a', 'b')]
+    for env in envs:
+        path = store.link(key, env)
+        dist = InstalledDistribution(path)
+        assert dist.name == 'demo'
+        # environments share the unpacked file
+        assert os.path.samefile(
+            os.path.join(env, 'lib', 'demo.py'),
+            os.path.join(store.path, '3.9', key, 'lib', 'demo.py'),
+        )
+        with open(os.path.join(path, 'SHARED')) as f:
+            assert env in f.read()
+        assert dist.check_installed_files() == []
+    assert store.find('Demo', '1.0', '3.9') == key
+
+    assert store.release(key, envs[0]) == 1
+    assert store.collect() == []
+    assert store.release(key, envs[1]) == 0
+    assert store.collect() == [key]
+    assert store.find('demo', '1.0', '3.9') is None
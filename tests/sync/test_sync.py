@@ -0,0 +1,165 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# type: ignore
+
+import os
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+from distlib.database import InstalledDistribution
+
+from proman.package_manager.distributions import LocalDistributionPath
+from proman.package_manager.exception import PackageManagerException
+from proman.package_manager.installed import InstalledRecord
+from proman.package_manager.package_manager import PackageManager
+from proman.package_manager.sync import (
+    SyncTransaction,
+    plan_sync,
+    record_paths,
+)
+
+
+def make_record(dist_dir, name, version, content='x'):
+    dist_info = f"{name}-{version}.dist-info"
+    files = [f"{name}/__init__.py", f"{dist_info}/RECORD", f"../bin/{name}"]
+    for relpath in files:
+        path = os.path.normpath(os.path.join(dist_dir, 'lib', relpath))
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+    os.makedirs(os.path.join(dist_dir, 'lib', name, '__pycache__'))
+    return InstalledRecord(name, version, files)
+
+
+def snapshot(dist_dir):
+    return sorted(
+        os.path.relpath(os.path.join(root, x), dist_dir)
+        for root, _, files in os.walk(dist_dir)
+        for x in files
+    )
+
+
+def test_plan_sync():
+    installed = {
+        'same': InstalledRecord('same', '1.0'),
+        'old': InstalledRecord('old', '1.0'),
+        'extra': InstalledRecord('Extra', '2.0'),
+    }
+    plan = plan_sync(
+        installed,
+        [
+            {'name': 'Same', 'version': '1.0.0'},
+            {'name': 'old', 'version': '2.0'},
+            {'name': 'new', 'version': '0.1'},
+        ],
+    )
+    assert plan.to_dict() == {
+        'install': [{'name': 'new', 'version': '0.1'}],
+        'remove': [{'name': 'Extra', 'version': '2.0'}],
+        'swap': [{'name': 'old', 'installed': '1.0', 'locked': '2.0'}],
+        'unchanged': 1,
+    }
+    assert not plan_sync({}, [])
+
+
+def test_transaction_rollback_and_commit(tmp_path):
+    dist_dir = str(tmp_path)
+    record = make_record(dist_dir, 'old', '1.0')
+    assert record_paths(dist_dir, record) == [
+        os.path.join('lib', 'old', '__init__.py'),
+        os.path.join('lib', 'old-1.0.dist-info', 'RECORD'),
+        os.path.join('bin', 'old'),
+    ]
+    before = snapshot(dist_dir)
+
+    transaction = SyncTransaction(dist_dir)
+    transaction.begin()
+    transaction.remove(record_paths(dist_dir, record))
+    assert not os.path.exists(tmp_path / 'lib' / 'old')
+    new = make_record(dist_dir, 'old', '2.0', 'y')
+    transaction.add(record_paths(dist_dir, new))
+    transaction.rollback()
+    assert snapshot(dist_dir) == before
+    assert (tmp_path / 'lib' / 'old' / '__init__.py').read_text() == 'x'
+
+    transaction = SyncTransaction(dist_dir)
+    transaction.begin()
+    transaction.remove(record_paths(dist_dir, record))
+    transaction.commit()
+    assert snapshot(dist_dir) == []
+
+
+def test_interrupted_transaction_is_recovered(tmp_path):
+    dist_dir = str(tmp_path)
+    record = make_record(dist_dir, 'old', '1.0')
+    before = snapshot(dist_dir)
+    transaction = SyncTransaction(dist_dir)
+    transaction.begin()
+    transaction.remove(record_paths(dist_dir, record))
+    # a new transaction restores the journal of the abandoned one
+    SyncTransaction(dist_dir).begin()
+    assert [x for x in snapshot(dist_dir) if '.proman-sync' not in x] == before
+
+
+def make_dist(dist_dir, name, version):
+    lib = os.path.join(dist_dir, 'lib')
+    dist_info = f"{name}-{version}.dist-info"
+    os.makedirs(os.path.join(lib, name), exist_ok=True)
+    os.makedirs(os.path.join(lib, dist_info), exist_ok=True)
+    files = {
+        f"{name}/__init__.py": f"VERSION = {version!r}\n",
+        f"{dist_info}/METADATA": (
+            f"Metadata-Version: 2.1\nName: {name}\nVersion: {version}\n"
+        ),
+    }
+    for relpath, text in files.items():
+        with open(os.path.join(lib, relpath), 'w') as f:
+            f.write(text)
+    with open(os.path.join(lib, dist_info, 'RECORD'), 'w') as f:
+        f.write(''.join(f"{x},,\n" for x in [*files, f"{dist_info}/RECORD"]))
+    return InstalledDistribution(os.path.join(lib, dist_info))
+
+
+def test_failed_sync_restores_environment(tmp_path):
+    distribution_path = LocalDistributionPath(
+        name='example', pypackages_dir=str(tmp_path / '__pypackages__')
+    )
+    dist_dir = distribution_path.dist_dir
+    make_dist(dist_dir, 'old', '1.0')
+    before = snapshot(dist_dir)
+    locks = [
+        {'name': 'old', 'version': '2.0'},
+        {'name': 'new', 'version': '1.0'},
+        {'name': 'broken', 'version': '1.0'},
+    ]
+    manifest = SimpleNamespace(
+        lockfile=SimpleNamespace(
+            get_locks=lambda dev=False: [] if dev else locks
+        )
+    )
+    manager = PackageManager(
+        manifest, distribution_path, None, store=False, prefetch=False
+    )
+    manager.resolve = lambda *x, **_: [
+        SimpleNamespace(name=y['name'], version=y['version']) for y in locks
+    ]
+    failed = threading.Event()
+
+    def install(package, **options):
+        if package.name == 'broken':
+            failed.set()
+            return None
+        if package.name == 'new':
+            # still running when the failure is noticed
+            failed.wait(5)
+            time.sleep(0.2)
+        return make_dist(dist_dir, package.name, package.version)
+
+    manager._install_package = install
+    with pytest.raises(PackageManagerException, match='broken'):
+        manager.sync()
+    # indexes of the environment are rebuilt from the restored files
+    assert [x for x in snapshot(dist_dir) if 'proman-' not in x] == before
+    assert sorted(manager.installed.records) == ['old']
@@ -0,0 +1,60 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# type: ignore
+
+import hashlib
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from proman.package_manager.metadata import ReleaseFile
+from proman.package_manager.prefetch import Prefetcher
+from proman.package_manager.scheduler import Scheduler
+from proman.package_manager.workspace import discover_members
+
+
+def test_discover_members(tmp_path):
+    for path in ['packages/a', 'packages/b', 'packages/docs', 'api']:
+        os.makedirs(tmp_path / path)
+    for path in ['packages/a', 'packages/b', 'api']:
+        (tmp_path / path / 'pyproject.toml').write_text('')
+    members = discover_members(str(tmp_path), ['packages/*', 'api', 'api'])
+    assert members == [
+        os.path.realpath(tmp_path / x)
+        for x in ['api', 'packages/a', 'packages/b']
+    ]
+
+
+def test_shared_artifact_downloaded_once(tmp_path):
+    content = b'shared wheel'
+    release = ReleaseFile(
+        'shared-1.0-py3-none-any.whl',
+        'http://localhost/shared-1.0-py3-none-any.whl',
+        'bdist_wheel',
+        hashlib.sha256(content).hexdigest(),
+    )
+    calls = []
+    lock = threading.Lock()
+
+    def download(release, dest):
+        with lock:
+            calls.append(release.filename)
+        time.sleep(0.1)
+        filepath = os.path.join(dest, release.filename)
+        with open(filepath, 'wb') as f:
+            f.write(content)
+        return filepath
+
+    prefetcher = Prefetcher(str(tmp_path), download, Scheduler())
+
+    def fetch(_):
+        # mirrors members installing the same artifact concurrently
+        prefetcher.submit(release)
+        return prefetcher.get(release)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        paths = set(executor.map(fetch, range(8)))
+    prefetcher.close()
+    assert len(paths) == 1 and None not in paths
+    assert calls == [release.filename]
@@ -0,0 +1,149 @@
+# SPDX-FileCopyrightText: © 2020-2022 Jesse Johnson <jpj6652@gmail.com>
+# SPDX-License-Identifier: LGPL-3.0-or-later
+# type: ignore
+
+import base64
+import hashlib
+import importlib
+import os
+import subprocess
+import sys
+import zipfile
+
+from distlib.wheel import Wheel
+
+from proman.package_manager import finder
+from proman.package_manager.check import check_environment
+from proman.package_manager.distributions import LocalDistributionPath
+from proman.package_manager.package_manager import PackageManager
+from proman.package_manager.zipped import get_unsafe_reason
+
+
+def make_wheel(directory, name, files):
+    """Build a wheel with a valid RECORD."""
+    info = f"{name}-1.0.dist-info"
+    files = {
+        **files,
+        f"{info}/METADATA": (
+            f"Metadata-Version: 2.1\nName: {name}\nVersion: 1.0\n"
+        ),
+        f"{info}/WHEEL": (
+            'Wheel-Version: 1.0\nRoot-Is-Purelib: true\nTag: py3-none-any\n'
+        ),
+    }
+    rows = []
+    for path, content in files.items():
+        digest = hashlib.sha256(content.encode()).digest()
+        encoded = base64.urlsafe_b64encode(digest).decode().rstrip('=')
+        rows.append(f"{path},sha256={encoded},{len(content.encode())}")
+    rows.append(f"{info}/RECORD,,")
+    filepath = os.path.join(directory, f"{name}-1.0-py3-none-any.whl")
+    with zipfile.ZipFile(filepath, 'w') as zf:
+        for path, content in files.items():
+            zf.writestr(path, content)
+        zf.writestr(f"{info}/RECORD", '\n'.join(rows) + '\n')
+    return filepath
+
+
+def get_manager(tmp_path, **options):
+    distribution_path = LocalDistributionPath(
+        name='example', pypackages_dir=str(tmp_path / '__pypackages__')
+    )
+    distribution_path.create_pypackages()
+    return PackageManager(
+        None,
+        distribution_path,
+        None,
+        store=False,
+        prefetch=False,
+        **options,
+    )
+
+
+def test_install_zipped(tmp_path):
+    filepath = make_wheel(
+        str(tmp_path),
+        'zipdemo',
+        {
+            'zipdemo/__init__.py': 'VALUE = 1\n\ndef main():\n    pass\n',
+            'zipdemo/sub.py': 'VALUE = 2\n',
+            'zipdemo-1.0.dist-info/entry_points.txt': (
+                '[console_scripts]\nzipdemo = zipdemo:main\n'
+            ),
+            'zipdemo-1.0.data/data/zipdemo.txt': 'data\n',
+            'zipdemo-1.0.data/scripts/zipdemo-tool': '#!python\npass\n',
+        },
+    )
+    assert get_unsafe_reason(Wheel(filepath)) is None
+    manager = get_manager(tmp_path, zipped=True)
+    dist_dir = manager.distribution_path.dist_dir
+    dist = manager._PackageManager__install_wheel(filepath)
+
+    # only metadata is extracted beside the intact wheel
+    assert sorted(os.listdir(os.path.join(dist_dir, 'lib'))) == [
+        'zipdemo-1.0-py3-none-any.whl',
+        'zipdemo-1.0.dist-info',
+    ]
+    assert os.path.isfile(os.path.join(dist_dir, 'share', 'zipdemo.txt'))
+    scripts = os.listdir(os.path.join(dist_dir, 'bin'))
+    assert 'zipdemo' in scripts and 'zipdemo-tool' in scripts
+    files = [x[0] for x in dist.list_installed_files()]
+    assert 'zipdemo-1.0-py3-none-any.whl' in files
+    assert os.path.join('..', 'bin', 'zipdemo') in files
+    report = check_environment(dist_dir)
+    assert report['missing'] == report['modified'] == report['extra'] == []
+
+    # interpreters without proman import the wheel listed in the path file
+    pypackages_dir = manager.distribution_path.pypackages_dir
+    script = (
+        f"import site; site.addsitedir({pypackages_dir!r}); "
+        "import zipdemo.sub; print(zipdemo.sub.VALUE)"
+    )
+    result = subprocess.run(
+        [sys.executable, '-I', '-S', '-c', script],
+        capture_output=True,
+        text=True,
+    )
+    assert result.returncode == 0, result.stderr
+    assert result.stdout == '2\n'
+
+    finder.write_module_map(dist_dir, files)
+    module_finder = finder.install(dist_dir)
+    try:
+        module = importlib.import_module('zipdemo.sub')
+        assert module.VALUE == 2
+        assert '.whl' in module.__file__
+    finally:
+        sys.meta_path.remove(module_finder)
+        for name in ('zipdemo', 'zipdemo.sub'):
+            sys.modules.pop(name, None)
+
+
+def test_unpacks_unsafe_wheels(tmp_path):
+    unsafe = {
+        'uses path configuration files': {'demo.pth': 'import os\n'},
+        'contains namespace packages': {'demo/mod.py': 'VALUE = 1\n'},
+        'contains extension modules': {'demo/__init__.py': '', 'demo.so': ''},
+        'demo/__init__.py locates files by __file__': {
+            'demo/__init__.py': 'import os\nHERE = os.path.dirname(__file__)\n'
+        },
+        'installs purelib files': {'demo-1.0.data/purelib/demo.py': ''},
+    }
+    for number, (reason, files) in enumerate(unsafe.items()):
+        directory = tmp_path / str(number)
+        directory.mkdir()
+        filepath = make_wheel(str(directory), 'demo', files)
+        assert get_unsafe_reason(Wheel(filepath)) == reason
+    # python 2 wheels are unpacked to be byte-compiled for python 3
+    py2_path = filepath.replace('-py3-', '-py2-')
+    os.rename(filepath, py2_path)
+    assert get_unsafe_reason(Wheel(py2_path)) == 'not a pure Python wheel'
+    os.rename(py2_path, filepath)
+
+    manager = get_manager(tmp_path, zipped=True)
+    dist_dir = manager.distribution_path.dist_dir
+    manager._PackageManager__install_wheel(filepath)
+    assert os.path.isfile(os.path.join(dist_dir, 'lib', 'demo.py'))
+    assert not os.path.exists(
+        os.path.join(dist_dir, 'lib', 'demo-1.0-py3-none-any.whl')
+    )